@@ -0,0 +1,10 @@
+#coding: utf-8
+"""回测热点路径的基准测试
+
+在合成的数据目录(与daily.bcolz/trading_dates.bcolz/instruments.pk相同的布局)上运行,
+不需要真实行情。用法::
+
+    python -m benchmarks --sizes 5x20,50x20 --output bench.json
+
+每个用例在单独的子进程中运行,分别记录吞吐量、启动时间和峰值内存,结果写成JSON便于比较。
+"""
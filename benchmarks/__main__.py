@@ -0,0 +1,118 @@
+#coding: utf-8
+"""运行基准测试并把结果写成JSON
+
+    python -m benchmarks --sizes 5x20,50x20 --cases get_bar,history --output bench.json
+
+size的格式为"合约数x交易日数",每个size用bundle_generator生成一次数据目录,每个用例在新的子进程中运行。
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from btsVob.bmsData.bundle_generator import generate_bundle
+
+from .cases import CASES
+
+DEFAULT_SIZES = "5x20,20x60"
+
+
+def parse_size(value):
+    contracts, days = value.lower().split("x")
+    return int(contracts), int(days)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_in_subprocess(case, bundle_dir, contracts):
+    """在新进程中运行一个用例,返回用例的结果和进程的总耗时"""
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join([root, env.get("PYTHONPATH", "")]).rstrip(os.pathsep)
+    start = time.time()
+    output = subprocess.check_output([sys.executable, "-m", "benchmarks.cases", case, bundle_dir, str(contracts)],
+                                     env=env, cwd=root)
+    wall = time.time() - start
+    result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    result["wall_s"] = wall
+    return result
+
+
+def run(sizes, cases, workdir=None, seed=0):
+    """生成各个size的数据目录并运行用例
+
+    :returns: 可以直接写成JSON的结果
+    :rtype: dict
+    """
+    import numpy
+    import pandas
+
+    own_workdir = workdir is None
+    workdir = workdir or tempfile.mkdtemp(prefix="bts-bench-")
+    results = []
+    try:
+        for contracts, days in sizes:
+            bundle_dir = os.path.join(workdir, "{0}x{1}".format(contracts, days))
+            start = time.time()
+            generate_bundle(bundle_dir, contracts=contracts, days=days, seed=seed)
+            generate_s = time.time() - start
+            for case in cases:
+                result = run_in_subprocess(case, bundle_dir, contracts)
+                result.update({"case": case, "contracts": contracts, "days": days, "generate_s": generate_s})
+                results.append(result)
+                print("{0:>14} {1:>4}x{2:<4} {3}".format(case, contracts, days, json.dumps(result, sort_keys=True)))
+    finally:
+        if own_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "time": datetime.datetime.now().isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": numpy.__version__,
+            "pandas": pandas.__version__,
+            "seed": seed,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="backtest hot path benchmarks")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated CONTRACTSxDAYS, default %(default)s")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma separated cases, default all")
+    parser.add_argument("--output", default=None, help="write results as JSON to this file")
+    parser.add_argument("--workdir", default=None, help="keep generated bundles in this directory")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    cases = [case for case in args.cases.split(",") if case]
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error("unknown cases: {}".format(", ".join(sorted(unknown))))
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size]
+
+    report = run(sizes, cases, args.workdir, args.seed)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    return report
+
+
+if __name__ == "__main__":
+    main()
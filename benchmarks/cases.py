@@ -0,0 +1,216 @@
+#coding: utf-8
+"""基准测试用例,每个用例在单独的进程中运行并把结果以一行JSON输出到stdout
+
+    python -m benchmarks.cases <case> <bundle_dir> [contracts]
+"""
+
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+
+CASES = ("startup", "event_source", "get_bar", "history", "match_orders", "matching_modes", "risk")
+
+# history用例每个合约调用的窗口长度
+HISTORY_BAR_COUNT = 20
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux上单位为KB,macOS上为字节
+    return rss / 1024. / 1024. if sys.platform == "darwin" else rss / 1024.
+
+
+def list_order_book_ids(bundle_dir, contracts=None):
+    """数据目录中按代码排序的前contracts个合约"""
+    from btsVob.bmsData.data_source import LocalDataSource
+
+    order_book_ids = sorted(LocalDataSource(bundle_dir).order_book_ids())
+    return order_book_ids if contracts is None else order_book_ids[:contracts]
+
+
+def open_proxy(bundle_dir):
+    from btsVob.bmsData import LocalDataProxy
+    return LocalDataProxy(bundle_dir)
+
+
+def make_trading_params(proxy, **kwargs):
+    from btsVob.bmsUtils import TradingParams
+
+    calendar = proxy.get_trading_dates("1900-01-01", "2100-01-01")
+    return TradingParams(calendar, start_date=calendar[0].to_pydatetime(),
+                         end_date=calendar[-1].to_pydatetime(), **kwargs)
+
+
+def iterate_events(proxy, trading_params):
+    from btsVob.bmsEvent import SimulatorFutureTradingEventSource
+    return SimulatorFutureTradingEventSource(trading_params, proxy.cursors)
+
+
+def bench_startup(bundle_dir, contracts):
+    """打开数据目录并取到第一个合约第一根bar的时间,包含导入btsVob的时间"""
+    start = time.time()
+    proxy = open_proxy(bundle_dir)
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    calendar = proxy.get_trading_dates("1900-01-01", "2100-01-01")
+    proxy.get_bar(order_book_ids[0], calendar[0])
+    return {"startup_s": time.time() - start}
+
+
+def bench_event_source(bundle_dir, contracts):
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    proxy = open_proxy(bundle_dir)
+    trading_params = make_trading_params(proxy)
+    trading_params.settlement_mask
+    start = time.time()
+    events = sum(1 for _ in iterate_events(proxy, trading_params))
+    elapsed = time.time() - start
+    return {"events": events, "events_per_s": events / elapsed}
+
+
+def bench_get_bar(bundle_dir, contracts):
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    proxy = open_proxy(bundle_dir)
+    trading_params = make_trading_params(proxy)
+    for order_book_id in order_book_ids:
+        proxy.bar_store[order_book_id]
+    get_bar = proxy.get_bar
+    bars = 0
+    start = time.time()
+    for dt, _ in iterate_events(proxy, trading_params):
+        for order_book_id in order_book_ids:
+            get_bar(order_book_id, dt).close
+        bars += len(order_book_ids)
+    elapsed = time.time() - start
+    return {"bars": bars, "bars_per_s": bars / elapsed}
+
+
+def bench_history(bundle_dir, contracts):
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    proxy = open_proxy(bundle_dir)
+    trading_params = make_trading_params(proxy)
+    for order_book_id in order_book_ids:
+        proxy.bar_store[order_book_id]
+    calendar = trading_params.trading_calendar[HISTORY_BAR_COUNT:]
+    # history构建Series开销较大,只取日历中的一部分时间点
+    sample = calendar[::max(1, len(calendar) // 2000)]
+
+    calls = 0
+    start = time.time()
+    for dt, _ in iterate_events(proxy, trading_params):
+        for order_book_id in order_book_ids:
+            proxy.history_array(order_book_id, dt, HISTORY_BAR_COUNT, "1m", "close").mean()
+        calls += len(order_book_ids)
+    array_elapsed = time.time() - start
+
+    series_calls = 0
+    start = time.time()
+    for dt in sample:
+        for order_book_id in order_book_ids:
+            proxy.history(order_book_id, dt, HISTORY_BAR_COUNT, "1m", "close").mean()
+        series_calls += len(order_book_ids)
+    series_elapsed = time.time() - start
+    return {
+        "history_array_calls": calls,
+        "history_array_calls_per_s": calls / array_elapsed,
+        "history_calls": series_calls,
+        "history_calls_per_s": series_calls / series_elapsed,
+    }
+
+
+def bench_match_orders(bundle_dir, contracts):
+    """完整的事件驱动回测,每个bar对每个合约交替开平仓"""
+    import logbook
+    from btsVob.bmsController import api
+    from btsVob.bmsStrategy import StrategyExecutor
+
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    proxy = open_proxy(bundle_dir)
+    trading_params = make_trading_params(proxy, init_cash=1e9)
+
+    def init(context):
+        context.contracts = order_book_ids
+
+    def handle_bar(context, bar_dict):
+        positions = context.portfolio.positions
+        for order_book_id in context.contracts:
+            if positions[order_book_id].bought_quantity:
+                api.order_shares(order_book_id, 1, "short", "close")
+            else:
+                api.order_shares(order_book_id, 1, "long", "open")
+
+    executor = StrategyExecutor(trading_params=trading_params, data_proxy=proxy, init=init, handle_bar=handle_bar)
+    start = time.time()
+    with logbook.NullHandler().applicationbound():
+        executor.execute()
+    elapsed = time.time() - start
+    orders = len(executor.exchange.all_orders)
+    bars = int((~np.asarray(trading_params.settlement_mask)).sum()) * len(order_book_ids)
+    return {"orders": orders, "orders_per_s": orders / elapsed, "bars_per_s": bars / elapsed}
+
+
+def bench_matching_modes(bundle_dir, contracts):
+    """立即撮合与三种成交顺序下bar_end撮合的耗时,结果一致性由tests/test_matching.py检查"""
+    import logbook
+    from btsVob.bmsController import api
+    from btsVob.bmsStrategy import StrategyExecutor
+    from btsVob.bmsUtils.const import FILL_PRIORITY, MATCHING_MODE
+
+    order_book_ids = list_order_book_ids(bundle_dir, contracts)
+    proxy = open_proxy(bundle_dir)
+    order_book_id = order_book_ids[0]
+
+    def handle_bar(context, bar_dict):
+        if context.portfolio.positions[order_book_id].bought_quantity:
+            api.order_shares(order_book_id, 1, "short", "close")
+        else:
+            api.order_shares(order_book_id, 1, "long", "open")
+
+    def backtest(**kwargs):
+        trading_params = make_trading_params(proxy, init_cash=1e9, **kwargs)
+        executor = StrategyExecutor(trading_params=trading_params, data_proxy=proxy, handle_bar=handle_bar)
+        start = time.time()
+        with logbook.NullHandler().applicationbound():
+            results_df = executor.execute()
+        return results_df, time.time() - start
+
+    results_df, elapsed = backtest(matching_mode=MATCHING_MODE.IMMEDIATE)
+    trades = sum(len(day_trades) for day_trades in results_df["trades"])
+    result = {"trades": trades, "immediate_s": elapsed}
+    for fill_priority in (FILL_PRIORITY.FIFO, FILL_PRIORITY.CLOSE_FIRST, FILL_PRIORITY.OPEN_FIRST):
+        _, elapsed = backtest(matching_mode=MATCHING_MODE.BAR_END, fill_priority=fill_priority)
+        result["bar_end_{0}_s".format(fill_priority)] = elapsed
+    return result
+
+
+def bench_risk(bundle_dir, contracts):
+    from btsVob.bmsAnalyzer.risk_cal import RiskCal
+
+    proxy = open_proxy(bundle_dir)
+    trading_params = make_trading_params(proxy)
+    risk_cal = RiskCal(trading_params, proxy)
+    returns = np.random.RandomState(0).randn(len(risk_cal.trading_index)) * 0.01
+    start = time.time()
+    for date, daily_returns in zip(risk_cal.trading_index, returns):
+        risk_cal.calculate(date, daily_returns)
+    elapsed = time.time() - start
+    return {"settlements": len(returns), "calculate_per_s": len(returns) / elapsed}
+
+
+def run_case(case, bundle_dir, contracts=None):
+    # 合约列表在各用例中读取,运行startup用例前不导入btsVob
+    result = globals()["bench_" + case](bundle_dir, contracts)
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def main(argv):
+    case, bundle_dir = argv[0], argv[1]
+    contracts = int(argv[2]) if len(argv) > 2 else None
+    print(json.dumps(run_case(case, bundle_dir, contracts)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1 +1,21 @@
-from .bmsController import BtsController
+#coding: utf-8
+"""btsVob回测框架
+
+包本身不导入任何子模块,BtsController在第一次访问时才加载,
+因此导入btsVob、解析命令行参数不需要加载pandas等较重的依赖。
+"""
+import sys
+
+__all__ = ["BtsController"]
+
+
+def __getattr__(name):
+    if name == "BtsController":
+        from .bmsController import BtsController
+        return BtsController
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+if sys.version_info < (3, 7):
+    # 不支持模块级__getattr__时直接导入
+    from .bmsController import BtsController
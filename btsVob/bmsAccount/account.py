@@ -1,12 +1,12 @@
 #coding: utf-8
 
 import datetime
-from collections import defaultdict
 
 from ..bmsAnalyzer import Portfolio
 from ..bmsAnalyzer.commission import AStockCommission, BaseCommission
 from ..bmsAnalyzer.slippage import FixedPercentSlippageDecider, BaseSlippageDecider
 from ..bmsAnalyzer.tax import AStockTax
+from ..bmsAnalyzer.trade_log import TradeLog
 
 
 class Account(object):
@@ -15,7 +15,7 @@ class Account(object):
         self._commission_decider = kwargs.get("commission", AStockCommission())
         self._tax_decider = kwargs.get("tax", AStockTax())
 
-        self._daily_trades = defaultdict(list)            # type: Dict[date, List[Trade]]
+        self._trade_log = TradeLog()                      # type: TradeLog, all trades in columnar arrays with per-settlement offsets
         self._portfolio = Portfolio()
 
         # init portfolio
@@ -58,16 +58,28 @@ class Account(object):
         return self._portfolio
 
     def get_trades(self, date):
-        return self._daily_trades[date]
+        """trades settled at date, empty if date is not a settlement
+
+        :param datetime.datetime date:
+        :returns:
+        :rtype: List[Trade]
+
+        """
+        trades = self._trade_log.day(date)
+        return [] if trades is None else trades.trades()
 
     def get_all_trades(self):
         """get all trades
 
-        :returns:
-        :rtype: Dict[date, List[]]
+        :returns: one row per trade, backed by the columnar trade log
+        :rtype: pandas.DataFrame
 
         """
-        return self._daily_trades
+        return self._trade_log.to_frame()
+
+    @property
+    def trade_log(self):
+        return self._trade_log
 
     def set_start_date(self, start_date):
         assert isinstance(date, datetime.date)
@@ -86,7 +98,17 @@ class Account(object):
         :rtype:
 
         """
-        self._daily_trades[date].append(trade)
+        self._trade_log.append(trade)
+
+    def settle_trades(self, date):
+        """assign trades since the last settlement to this settlement
+
+        :param datetime.datetime date:
+        :returns: None
+        :rtype:
+
+        """
+        self._trade_log.mark_settlement(date)
 
     @property
     def portfolio_value(self):
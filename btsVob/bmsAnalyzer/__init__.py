@@ -1,5 +1,6 @@
 from .order import Order
 from .trade import Trade
+from .trade_log import TradeLog
 from .position import Position
 from .portfolio import Portfolio
 from .simulation_exchange import SimuExchange
@@ -4,6 +4,8 @@ import abc
 import json
 from six import with_metaclass
 
+from .contract_spec import ContractSpecRegistry
+
 class BaseCommission(with_metaclass(abc.ABCMeta)):
     @abc.abstractmethod
     def get_commission(self, order, trade):
@@ -23,6 +25,7 @@ class AStockCommission(BaseCommission):
         self.min_commission = min_commission
         self._commission_info = dict()
         self.read_commision_list()
+        self._contract_specs = ContractSpecRegistry(self._commission_info)
 
     def read_commision_list(self):
         """读取合约佣金列表以JSON方式"""
@@ -32,17 +35,13 @@ class AStockCommission(BaseCommission):
         
     def get_commission(self, order, trade):
         """根据合约号获取佣金,暂时不考虑平今的问题"""
-        symbol = trade.order_book_id[0:-4] if trade.order_book_id[-4].isdigit else trade.order_book_id[0:-3]
-        oc = self._commission_info[symbol]['oc'] 
-        multiplier = float(self._commission_info[symbol]['multiplier'])
-        if oc[-1] == '%':
-            commission_rate = float(oc[0:-1]) / 100
-            cost_money = trade.price * abs(trade.amount) * multiplier * commission_rate
-        else:
-            commission = float(oc)
-            cost_money = abs(trade.amount) * commission
-        return cost_money 
-    
+        return self._contract_specs[trade.order_book_id].commission(trade.price, trade.amount)
+
     @property
     def commission_info(self):
         return self._commission_info
+
+    @property
+    def contract_specs(self):
+        """按合约缓存的保证金比例、合约乘数和手续费"""
+        return self._contract_specs
@@ -0,0 +1,118 @@
+#coding: utf-8
+
+import six
+
+DIGITS = "0123456789"
+
+
+def get_contract_prefix(order_book_id):
+    """合约前缀,去掉末尾的年月数字,如rb1610 -> rb, SR610 -> SR"""
+    return order_book_id.rstrip(DIGITS)
+
+
+def parse_fee(value):
+    """解析commission.json中的手续费
+    '0.012%'表示按成交金额的比例收取,'2.4'表示每手固定收取
+    :returns: (比例, 每手金额),没有配置的一项为None
+    """
+    value = (value or "").strip()
+    if not value:
+        return None, 0.
+    if value[-1] == "%":
+        return float(value[:-1]) / 100, None
+    return None, float(value)
+
+
+def _parse_float(value):
+    if value is None:
+        return None
+    if isinstance(value, six.string_types) and not value.strip():
+        return None
+    return float(value)
+
+
+class ContractSpec(object):
+    """合约的交易参数,从commission.json和合约信息中解析一次"""
+    __slots__ = ("order_book_id", "symbol", "margin_rate", "multiplier",
+                 "fee_rate", "fee_per_lot", "close_today_fee_rate", "close_today_fee_per_lot")
+
+    def __init__(self, order_book_id, symbol, margin_rate, multiplier, fee, close_today_fee):
+        self.order_book_id = order_book_id
+        self.symbol = symbol
+        self.margin_rate = margin_rate
+        self.multiplier = multiplier
+        self.fee_rate, self.fee_per_lot = fee
+        self.close_today_fee_rate, self.close_today_fee_per_lot = close_today_fee
+
+    def commission(self, price, amount):
+        """开平仓手续费,暂时不考虑平今"""
+        if self.fee_rate is not None:
+            return price * abs(amount) * self.multiplier * self.fee_rate
+        return abs(amount) * self.fee_per_lot
+
+    def margin(self, price, amount):
+        """占用保证金"""
+        return price * amount * self.multiplier * self.margin_rate
+
+    def __repr__(self):
+        return "ContractSpec({0})".format({k: getattr(self, k) for k in self.__slots__})
+
+
+class ContractSpecRegistry(object):
+    """按order_book_id缓存的合约参数表
+    保证金比例和合约乘数优先取commission.json,没有配置时取合约信息中的margin_rate和contract_multiplier
+    """
+
+    def __init__(self, commission_info, instruments=None):
+        """
+        :param dict commission_info: commission.json的内容,合约前缀 -> 参数
+        :param instruments: 可选,根据order_book_id获取Instrument的函数
+        """
+        self._commission_info = commission_info
+        self._instruments = instruments
+        self._specs = {}
+
+    def bind_instruments(self, instruments):
+        self._instruments = instruments
+        self._specs.clear()
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._specs[order_book_id]
+        except KeyError:
+            spec = self._specs[order_book_id] = self._build(order_book_id)
+            return spec
+
+    get = __getitem__
+
+    def update_commission_info(self, commission_info):
+        """合并额外的手续费配置,已经缓存的合约参数失效"""
+        self._commission_info.update(commission_info)
+        self._specs.clear()
+
+    def _build(self, order_book_id):
+        symbol = get_contract_prefix(order_book_id)
+        try:
+            info = self._commission_info[symbol]
+        except KeyError:
+            raise KeyError('No commission info for {} ({})'.format(order_book_id, symbol))
+
+        margin_rate = _parse_float(info.get("premium"))
+        multiplier = _parse_float(info.get("multiplier"))
+        if (margin_rate is None or multiplier is None) and self._instruments is not None:
+            instrument = self._instruments(order_book_id)
+            if margin_rate is None:
+                margin_rate = _parse_float(getattr(instrument, "margin_rate", None))
+            if multiplier is None:
+                multiplier = _parse_float(getattr(instrument, "contract_multiplier", None))
+        if margin_rate is None or multiplier is None:
+            raise ValueError('No margin rate or multiplier for {}'.format(order_book_id))
+
+        return ContractSpec(order_book_id, symbol, margin_rate, multiplier,
+                            parse_fee(info.get("oc")), parse_fee(info.get("ctoday")))
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._specs
+
+    def __repr__(self):
+        return "ContractSpecRegistry({0})".format(sorted(self._specs))
@@ -0,0 +1,74 @@
+#coding: utf-8
+
+import abc
+
+import numpy as np
+from six import with_metaclass
+
+from .order_style import LimitOrder, StopOrder
+
+
+class BaseMatchingEngine(with_metaclass(abc.ABCMeta)):
+    @abc.abstractmethod
+    def match(self, bar, orders, resting, market_price):
+        """撮合同一合约的订单
+
+        :param BarObject bar: 当前bar
+        :param list orders: 待撮合的订单
+        :param bool resting: True表示撮合之前bar留下的挂单,可以用本bar的最高最低价;
+            False表示撮合刚提交的订单,只能用当前价格
+        :param market_price: 计算市价单成交价(含滑点)的函数
+        :returns: 可以成交的(order, price)列表,按订单顺序
+        :rtype: List[Tuple[Order, float]]
+        """
+        raise NotImplementedError
+
+
+class BarMatchingEngine(BaseMatchingEngine):
+    """基于bar的撮合引擎
+    市价单按收盘价加滑点立即成交;限价单和止损单挂在挂单簿中跨bar保留,
+    每个bar对同一合约的所有挂单做一次向量化的最高最低价比较
+    """
+
+    def match(self, bar, orders, resting, market_price):
+        pending = [order for order in orders if isinstance(order.style, (LimitOrder, StopOrder))]
+        matched = self.match_pending(bar, pending, resting) if pending else {}
+
+        fills = []
+        for order in orders:
+            if id(order) in matched:
+                fills.append((order, matched[id(order)]))
+            elif not isinstance(order.style, (LimitOrder, StopOrder)):
+                fills.append((order, market_price(order)))
+        return fills
+
+    def match_pending(self, bar, pending, resting):
+        """一次向量化比较所有限价单和止损单
+        :returns: id(order) -> 成交价
+        """
+        n = len(pending)
+        prices = np.empty(n)
+        is_stop = np.empty(n, dtype=bool)
+        is_buy = np.empty(n, dtype=bool)
+        for i, order in enumerate(pending):
+            style = order.style
+            buy = order.direction == 'long'
+            is_buy[i] = buy
+            if isinstance(style, StopOrder):
+                is_stop[i] = True
+                prices[i] = style.get_stop_price(buy)
+            else:
+                is_stop[i] = False
+                prices[i] = style.get_limit_price(buy)
+
+        if resting:
+            open_price, high, low = bar.open, bar.high, bar.low
+        else:
+            open_price = high = low = bar.close
+
+        # 买入限价和卖出止损在价格下穿时触发,卖出限价和买入止损在价格上穿时触发
+        on_fall = is_buy != is_stop
+        triggered = np.where(on_fall, low <= prices, high >= prices)
+        fill_prices = np.where(on_fall, np.minimum(prices, open_price), np.maximum(prices, open_price))
+
+        return dict((id(pending[i]), float(fill_prices[i])) for i in np.flatnonzero(triggered))
@@ -1,22 +1,37 @@
 #coding: utf-8
 
-import uuid
+import itertools
 
 from ..bmsUtils.const import ORDER_STATUS
+from .order_style import MarketOrder
+
+# 进程内单调递增的整数订单号,替代每个订单生成一次uuid
+_order_ids = itertools.count(1)
 
 
 def gen_order_id():
-    return uuid.uuid4().hex
+    return next(_order_ids)
+
+
+def format_order_id(order_id):
+    """订单号的字符串形式,只在需要展示时生成"""
+    return "{0:016d}".format(order_id)
 
 
-# TODO use nametuple to reduce memory
+def parse_order_id(order_id):
+    """接受整数订单号或者format_order_id生成的字符串"""
+    return int(order_id)
+
 
 class Order(object):
+    __slots__ = ("dt", "order_book_id", "_order_id", "filled_shares", "quantity", "_reject_reason",
+                 "status", "direction", "offset", "style")
 
-    def __init__(self, dt, order_book_id, quantity, direction, offset):
+    def __init__(self, dt, order_book_id, quantity, direction, offset, style=None):
         """合约下单数据的构造函数
         :direction: 开平仓方向
         :offset: 多空
+        :style: 订单类型,默认为市价单
         """
         self.dt = dt
         self.order_book_id = order_book_id
@@ -29,17 +44,22 @@ class Order(object):
         self.status = ORDER_STATUS.OPEN
         self.direction = direction
         self.offset = offset
+        self.style = style if style is not None else MarketOrder()
 
     @property
     def order_id(self):
         return self._order_id
 
+    @property
+    def order_id_str(self):
+        return format_order_id(self._order_id)
+
     @property
     def instrument(self):
         raise NotImplementedError
 
     def cancel(self):
-        raise NotImplementedError
+        self.status = ORDER_STATUS.CANCELLED
 
     def fill(self, shares):
         self.filled_shares += shares
@@ -58,5 +78,9 @@ class Order(object):
     def reject_reason(self):
         return self._reject_reason
 
+    @property
+    def __dict__(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
     def __repr__(self):
         return "Order({0})".format(self.__dict__)
@@ -0,0 +1,90 @@
+#coding: utf-8
+
+from collections import OrderedDict
+
+from ..bmsUtils.const import ORDER_STATUS
+
+
+class OrderBook(object):
+    """挂单簿,同时按order_id、合约和订单状态建立索引
+    插入、撤单和删除都是O(1),撮合时只需要遍历有挂单的合约
+    订单状态需要通过挂单簿修改,这样状态索引才能保持一致
+    """
+
+    def __init__(self):
+        self._orders = OrderedDict()        # type: Dict[int, Order], order_id -> order
+        self._by_contract = OrderedDict()   # type: Dict[str, OrderedDict], order_book_id -> {order_id: order}
+        self._by_status = {}                # type: Dict[ORDER_STATUS, OrderedDict], status -> {order_id: order}
+
+    def add(self, order):
+        order_id = order.order_id
+        self._orders[order_id] = order
+        try:
+            self._by_contract[order.order_book_id][order_id] = order
+        except KeyError:
+            self._by_contract[order.order_book_id] = OrderedDict([(order_id, order)])
+        self._status_index(order.status)[order_id] = order
+
+    def remove(self, order):
+        """删除挂单,挂单不存在时返回False"""
+        order_id = order.order_id
+        if self._orders.pop(order_id, None) is None:
+            return False
+        contract_orders = self._by_contract[order.order_book_id]
+        del contract_orders[order_id]
+        if not contract_orders:
+            del self._by_contract[order.order_book_id]
+        self._status_index(order.status).pop(order_id, None)
+        return True
+
+    def set_status(self, order, status):
+        order_id = order.order_id
+        if order_id in self._orders:
+            self._status_index(order.status).pop(order_id, None)
+            self._status_index(status)[order_id] = order
+        order.status = status
+
+    def reject(self, order, reason):
+        self.set_status(order, ORDER_STATUS.REJECTED)
+        order.mark_rejected(reason)
+
+    def cancel(self, order):
+        """撤单并从挂单簿中删除"""
+        self.set_status(order, ORDER_STATUS.CANCELLED)
+        return self.remove(order)
+
+    def get(self, order_id):
+        return self._orders.get(order_id)
+
+    def orders(self, order_book_id):
+        """合约当前的挂单,按下单顺序返回列表,遍历时可以修改挂单簿"""
+        try:
+            return list(self._by_contract[order_book_id].values())
+        except KeyError:
+            return []
+
+    def contracts(self):
+        """有挂单的合约"""
+        return list(self._by_contract)
+
+    def with_status(self, status):
+        return list(self._status_index(status).values())
+
+    def _status_index(self, status):
+        try:
+            return self._by_status[status]
+        except KeyError:
+            index = self._by_status[status] = OrderedDict()
+            return index
+
+    def __contains__(self, order):
+        return order.order_id in self._orders
+
+    def __len__(self):
+        return len(self._orders)
+
+    def __iter__(self):
+        return iter(list(self._orders.values()))
+
+    def __repr__(self):
+        return "OrderBook({0})".format(list(self._orders.values()))
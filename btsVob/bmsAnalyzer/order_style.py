@@ -23,3 +23,16 @@ class LimitOrder(OrderStyle):
 
     def get_limit_price(self, is_buy):
         return self.limit_price
+
+
+class StopOrder(OrderStyle):
+    """止损单,价格触及stop_price后按不差于stop_price的价格成交"""
+
+    def __init__(self, stop_price):
+        self.stop_price = stop_price
+
+    def get_limit_price(self, _is_buy):
+        return None
+
+    def get_stop_price(self, _is_buy):
+        return self.stop_price
@@ -0,0 +1,114 @@
+#coding: utf-8
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .snapshot import PORTFOLIO_FIELDS, POSITION_FIELDS
+
+_POSITION_FIELD_INDEX = {field: i for i, field in enumerate(POSITION_FIELDS)}
+_EMPTY_POSITION = (0.,) * len(POSITION_FIELDS)
+
+
+class PositionView(object):
+    """单个合约持仓的只读视图,创建时固定字段的值"""
+    __slots__ = ("_values",)
+
+    def __init__(self, position=None):
+        if position is None:
+            values = _EMPTY_POSITION
+        else:
+            values = tuple(getattr(position, field) for field in POSITION_FIELDS)
+        object.__setattr__(self, "_values", values)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[_POSITION_FIELD_INDEX[name]]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("position is read-only")
+
+    def __repr__(self):
+        return "Position({%s})" % dict(zip(POSITION_FIELDS, self._values))
+
+
+class PositionsView(Mapping):
+    """持仓字典的只读视图,按合约按需生成PositionView
+    与defaultdict(Position)一致,访问没有持仓的合约返回全零持仓,但不会向账户中插入
+    """
+
+    def __init__(self, positions):
+        self._positions = positions
+        self._views = {}
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._views[order_book_id]
+        except KeyError:
+            position = self._positions.get(order_book_id)
+            view = self._views[order_book_id] = PositionView(position)
+            return view
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._positions
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __repr__(self):
+        return "Positions({0})".format({k: self[k] for k in self})
+
+
+class PortfolioView(object):
+    """账户投资组合的只读代理,替代每次访问都copy.deepcopy
+    字段在第一次访问时才从账户读取,并在版本号变化(成交、价格更新、结算)时失效
+    """
+    __slots__ = ("_portfolio", "_versioned", "_version", "_values", "_positions")
+
+    def __init__(self, portfolio, versioned):
+        """
+        :param Portfolio portfolio: 账户中实际的投资组合
+        :param versioned: 提供portfolio_version版本号的对象,一般是SimuExchange
+        """
+        object.__setattr__(self, "_portfolio", portfolio)
+        object.__setattr__(self, "_versioned", versioned)
+        object.__setattr__(self, "_version", None)
+        object.__setattr__(self, "_values", {})
+        object.__setattr__(self, "_positions", None)
+
+    def _refresh(self):
+        version = self._versioned.portfolio_version
+        if version != self._version:
+            object.__setattr__(self, "_version", version)
+            object.__setattr__(self, "_values", {})
+            object.__setattr__(self, "_positions", None)
+
+    @property
+    def positions(self):
+        self._refresh()
+        if self._positions is None:
+            object.__setattr__(self, "_positions", PositionsView(self._portfolio.positions))
+        return self._positions
+
+    def __getattr__(self, name):
+        if name not in PORTFOLIO_FIELDS:
+            raise AttributeError(name)
+        self._refresh()
+        values = self._values
+        try:
+            return values[name]
+        except KeyError:
+            value = values[name] = getattr(self._portfolio, name)
+            return value
+
+    def __setattr__(self, name, value):
+        raise AttributeError("portfolio is read-only")
+
+    def __repr__(self):
+        return "Portfolio({0})".format({field: getattr(self, field) for field in PORTFOLIO_FIELDS})
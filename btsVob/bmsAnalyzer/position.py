@@ -1,29 +1,140 @@
 #coding: utf-8
 
-from collections import defaultdict
+import numpy as np
 
-# TODO make field readonly
-# TODO use nametuple to reduce memory
+POSITION_FIELDS = (
+    "quantity",             # int 未平仓部分的总头寸
+    "bought_quantity",      # int 该合约的总的多头头寸
+    "sold_quantity",        # int 该合约的总的空头头寸
+    "bought_premium",       # float 该合约的总的多头占用保证金
+    "sold_premium",         # float 该合约的总的空头占用保证金
+    "long_sellable",        # int 该合约的总的多头可平仓数目
+    "short_sellable",       # int 该合约的总空头的可平仓数目
+    "average_long_cost",    # float 获得多头均价,计算方法为每次买入的数量做加权平均
+    "average_short_cost",   # float 获得空头均价,计算方法为每次买入的数量做加权平均
+    "market_value",         # float 获得该持仓的实时市场价值单手的点数
+    "value_percent",        # float 获得该持仓的实时市场价值在总投资组合价值中所占比例
+)
+
+# 与持仓对齐的合约参数,用于向量化计算保证金和盯市盈亏
+SPEC_FIELDS = ("margin_rate", "multiplier")
+
+INITIAL_CAPACITY = 16
+
+
+def _field_property(field):
+    def getter(self):
+        return float(self._table._columns[field][self._slot])
+
+    def setter(self, value):
+        self._table._columns[field][self._slot] = value
+
+    return property(getter, setter)
 
 
 class Position(object):
+    """持仓表中一行的代理,字段直接读写Positions中对齐的数组"""
+    __slots__ = ("_table", "_slot")
+
+    def __init__(self, table, slot):
+        self._table = table
+        self._slot = slot
 
-    def __init__(self):
-        self.quantity = 0.          # int 未平仓部分的总头寸
-        self.bought_quantity = 0.   # int 该合约的总的多头头寸
-        self.sold_quantity = 0.     # int 该合约的总的空头头寸
-        self.bought_premium = 0.      # float 该合约的总的多头占用保证金
-        self.sold_premium = 0.        # float 该合约的总的空头占用保证金
-        self.long_sellable = 0.          # int 该合约的总的多头可平仓数目
-        self.short_sellable = 0.          # int 该合约的总空头的可平仓数目
-        self.average_long_cost = 0.      # float 获得多头均价,计算方法为每次买入的数量做加权平均
-        self.average_short_cost = 0.     # float 获得空头均价,计算方法为每次买入的数量做加权平均
-        self.market_value = 0.      # float 获得该持仓的实时市场价值单手的点数
-        self.value_percent = 0.     # float 获得该持仓的实时市场价值在总投资组合价值中所占比例
+    @property
+    def order_book_id(self):
+        return self._table._order_book_ids[self._slot]
+
+    @property
+    def __dict__(self):
+        return {field: getattr(self, field) for field in POSITION_FIELDS}
 
     def __repr__(self):
         return "Position({%s})" % self.__dict__
 
 
-def Positions():
-    return defaultdict(Position)
+for _field in POSITION_FIELDS + SPEC_FIELDS:
+    setattr(Position, _field, _field_property(_field))
+del _field
+
+
+class Positions(object):
+    """按列存储的持仓表,每个合约占一行,各字段保存在对齐的numpy数组中
+    与defaultdict(Position)一样,访问不存在的合约时插入全零持仓;
+    盯市、保证金和结算可以用column()取出所有持仓的一列做一次向量化计算
+    """
+
+    def __init__(self, contract_specs=None):
+        """
+        :param contract_specs: 可选,order_book_id -> ContractSpec,新增持仓时填充保证金比例和合约乘数
+        """
+        self._contract_specs = contract_specs
+        self._order_book_ids = []       # type: List[str], 行号 -> order_book_id
+        self._slots = {}                # type: Dict[str, int], order_book_id -> 行号
+        self._positions = {}            # type: Dict[str, Position]
+        self._columns = {field: np.zeros(INITIAL_CAPACITY) for field in POSITION_FIELDS + SPEC_FIELDS}
+
+    def bind_contract_specs(self, contract_specs):
+        """绑定合约参数表,并补齐已有持仓的保证金比例和合约乘数"""
+        self._contract_specs = contract_specs
+        for slot, order_book_id in enumerate(self._order_book_ids):
+            self._fill_spec(slot, order_book_id)
+
+    def _fill_spec(self, slot, order_book_id):
+        spec = self._contract_specs[order_book_id]
+        self._columns["margin_rate"][slot] = spec.margin_rate
+        self._columns["multiplier"][slot] = spec.multiplier
+
+    def _add(self, order_book_id):
+        slot = len(self._order_book_ids)
+        capacity = len(self._columns["quantity"])
+        if slot == capacity:
+            for field, column in self._columns.items():
+                grown = np.zeros(capacity * 2)
+                grown[:capacity] = column
+                self._columns[field] = grown
+        if self._contract_specs is not None:
+            self._fill_spec(slot, order_book_id)
+
+        self._order_book_ids.append(order_book_id)
+        self._slots[order_book_id] = slot
+        position = self._positions[order_book_id] = Position(self, slot)
+        return position
+
+    def column(self, field):
+        """所有持仓某个字段的数组视图,按order_book_ids()的顺序排列,可以原地修改"""
+        return self._columns[field][:len(self._order_book_ids)]
+
+    def order_book_ids(self):
+        return list(self._order_book_ids)
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._positions[order_book_id]
+        except KeyError:
+            return self._add(order_book_id)
+
+    def get(self, order_book_id, default=None):
+        return self._positions.get(order_book_id, default)
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._positions
+
+    def __len__(self):
+        return len(self._order_book_ids)
+
+    def __iter__(self):
+        return iter(list(self._order_book_ids))
+
+    def keys(self):
+        return list(self._order_book_ids)
+
+    def values(self):
+        return [self._positions[order_book_id] for order_book_id in self._order_book_ids]
+
+    def items(self):
+        return [(order_book_id, self._positions[order_book_id]) for order_book_id in self._order_book_ids]
+
+    iteritems = items  # Python 2
+
+    def __repr__(self):
+        return "Positions({0})".format(dict(self.items()))
@@ -5,12 +5,18 @@ from __future__ import division
 import copy
 import numpy as np
 import pandas as pd
-import datetime
 
 from collections import OrderedDict
 
 from .risk import Risk
 from ..bmsUtils import const
+from ..bmsLogger.trace import risk_trace
+
+
+def safe_divide(numerator, denominator):
+    """与numpy浮点除法一致,除数为0时返回inf或nan而不是抛出异常"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.float64(numerator) / denominator
 
 
 class RiskCal(object):
@@ -21,7 +27,7 @@ class RiskCal(object):
         self.start_date = trading_params.start_date
         
         if trading_params.frequency == '1m':
-            self.trading_index = self.pick_up_settlement_date(trading_params.trading_calendar)
+            self.trading_index = self.pick_up_settlement_date(trading_params)
         else:
             self.trading_index = trading_params.trading_calendar
 
@@ -38,6 +44,8 @@ class RiskCal(object):
         self.risk = Risk()
 
         self.daily_risks = OrderedDict()
+        # 只保留最近几次结算的风险指标,None表示全部保留
+        self.max_history = None
 
         self.current_max_returns = -np.inf
         self.current_max_drawdown = 0
@@ -45,47 +53,43 @@ class RiskCal(object):
         #无风险利率暂时设置为0
         self.riskfree_total_returns = 0
 
-    def pick_up_settlement_date(self, trading_calendar):
-        """选择结算的时间点"""
-        index = []
-        for elt in trading_calendar:
-            if self.judge_settlement_time(elt.to_datetime()) == True:
-                index.append(elt)
-        index = pd.tseries.index.DatetimeIndex(index)
-        return index
-
-    def judge_settlement_time(self, date):
-        settle1 = [datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 15:00:00', '%Y-%m-%d %H:%M:%S'),
-                   datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 20:00:00', '%Y-%m-%d %H:%M:%S')]
-        settle2 = [datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 03:00:00', '%Y-%m-%d %H:%M:%S'),
-                   datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 08:00:00', '%Y-%m-%d %H:%M:%S')]
-        if ((date >= settle1[0] and date < settle1[1]) or
-            (date >= settle2[0] and date < settle2[1])):
-            return True
-        else:
-            return False
-        
-    def calculate(self, date, strategy_daily_returns):
+        # 流式计算风险指标的累加量
+        self.returns_cnt = 0
+        self.returns_sum = 0.
+        self.returns_mean = 0.
+        self.returns_m2 = 0.
+        self.compounded_returns = 1.
+        self.downside_cnt = 0
+        self.downside_sumsq = 0.
+
+    def pick_up_settlement_date(self, trading_params):
+        """选择结算的时间点,与事件源共用交易参数上的结算掩码"""
+        return trading_params.trading_calendar[trading_params.settlement_mask]
 
+    def calculate(self, date, strategy_daily_returns):
+        """按结算顺序流式更新风险指标,每次结算只做常数时间的累加
+        结果与在整个收益率前缀上批量计算的公式在浮点误差范围内一致
+        """
         idx = self.latest_idx = self.trading_index.get_loc(date)
         # daily
         self.strategy_total_daily_returns[idx] = strategy_daily_returns
         self.strategy_current_daily_returns = self.strategy_total_daily_returns[:idx + 1]
 
-        self.days_cnt = len(self.strategy_current_daily_returns)
+        self.days_cnt = idx + 1
         days_pass_cnt = (date - self.start_date).days + 1
+        self.update_accumulators(strategy_daily_returns)
 
         # total
-        self.strategy_total_returns[idx] = (1. + self.strategy_current_daily_returns).prod() - 1
+        self.strategy_total_returns[idx] = self.compounded_returns - 1
         self.strategy_current_total_returns = self.strategy_total_returns[:idx + 1]
 
         # annual
-        self.strategy_annualized_returns[idx] = (1 + self.strategy_current_total_returns[-1]) ** (
+        self.strategy_annualized_returns[idx] = (1 + self.strategy_total_returns[idx]) ** (
                     const.DAYS_CNT.DAYS_A_YEAR / days_pass_cnt) - 1
         self.strategy_current_annualized_returns = self.strategy_annualized_returns[:idx + 1]
 
-        if self.strategy_current_total_returns[-1] > self.current_max_returns:
-            self.current_max_returns = self.strategy_current_total_returns[-1]
+        if self.strategy_total_returns[idx] > self.current_max_returns:
+            self.current_max_returns = self.strategy_total_returns[idx]
 
         risk = self.risk
         risk.volatility = self.cal_volatility()
@@ -93,44 +97,61 @@ class RiskCal(object):
         risk.downside_risk = self.cal_downside_risk()
         risk.sharpe = self.cal_sharpe()
         risk.sortino = self.cal_sortino()
-        self.daily_risks[date] = copy.deepcopy(risk)
+        self.daily_risks[date] = copy.copy(risk)
+        if risk_trace.debug_on:
+            risk_trace.debug("risk %s: %r", date, risk)
+        if self.max_history is not None:
+            while len(self.daily_risks) > self.max_history:
+                self.daily_risks.popitem(last=False)
+
+    def update_accumulators(self, daily_returns):
+        """更新收益率的流式累加量: 个数、和、Welford方差、复利收益和下行平方和"""
+        self.returns_cnt += 1
+        self.returns_sum += daily_returns
+        delta = daily_returns - self.returns_mean
+        self.returns_mean += delta / self.returns_cnt
+        self.returns_m2 += delta * (daily_returns - self.returns_mean)
+        self.compounded_returns *= 1. + daily_returns
+        if daily_returns < 0:
+            self.downside_cnt += 1
+            self.downside_sumsq += daily_returns * daily_returns
 
     def cal_volatility(self):
-        daily_returns = self.strategy_current_daily_returns
-        if len(daily_returns) <= 1:
+        if self.returns_cnt <= 1:
             return 0.
-        volatility = const.DAYS_CNT.TRADING_DAYS_A_YEAR ** 0.5 * np.std(daily_returns, ddof=1)
+        volatility = const.DAYS_CNT.TRADING_DAYS_A_YEAR ** 0.5 * (self.returns_m2 / (self.returns_cnt - 1)) ** 0.5
         return volatility
 
     def cal_max_drawdown(self):
-        today_return = self.strategy_current_total_returns[-1]
+        today_return = self.strategy_total_returns[self.latest_idx]
         today_drawdown = (1. + today_return) / (1. + self.current_max_returns) - 1.
         if today_drawdown < self.current_max_drawdown:
             self.current_max_drawdown = today_drawdown
         return self.current_max_drawdown
 
+    def cal_annualized_mean_returns(self):
+        return self.returns_sum / self.returns_cnt * const.DAYS_CNT.TRADING_DAYS_A_YEAR
+
     def cal_sharpe(self):
         volatility = self.risk.volatility
-        strategy_rets = self.strategy_current_daily_returns.sum() / len(self.strategy_current_daily_returns) * const.DAYS_CNT.TRADING_DAYS_A_YEAR
+        strategy_rets = self.cal_annualized_mean_returns()
 
-        sharpe = (strategy_rets - self.riskfree_total_returns) / volatility
+        sharpe = safe_divide(strategy_rets - self.riskfree_total_returns, volatility)
 
         return sharpe
 
     def cal_sortino(self):
-        strategy_rets = self.strategy_current_daily_returns.sum() / len(self.strategy_current_daily_returns) * const.DAYS_CNT.TRADING_DAYS_A_YEAR
+        strategy_rets = self.cal_annualized_mean_returns()
         downside_risk = self.risk.downside_risk
 
-        sortino = (strategy_rets - self.riskfree_total_returns) / downside_risk
+        sortino = safe_divide(strategy_rets - self.riskfree_total_returns, downside_risk)
         return sortino
 
     def cal_downside_risk(self):
-        mask = self.strategy_current_daily_returns < 0
-        diff = self.strategy_current_daily_returns[mask]
-        if len(diff) <= 1:
+        if self.downside_cnt <= 1:
             return 0.
 
-        return ((diff * diff).sum() / len(diff)) ** 0.5 * const.DAYS_CNT.TRADING_DAYS_A_YEAR ** 0.5
+        return (self.downside_sumsq / self.downside_cnt) ** 0.5 * const.DAYS_CNT.TRADING_DAYS_A_YEAR ** 0.5
 
     def __repr__(self):
         return "RiskCal({0})".format(self.__dict__)
@@ -1,21 +1,22 @@
 #coding: utf-8
 
-import copy
+import numpy as np
 import pandas as pd
 import time
 import datetime
 
-from collections import defaultdict, OrderedDict
-from six import iteritems
-
 from ..bmsUtils.const import *
 from ..bmsUtils.i18n import gettext as _
 from ..bmsAccount import Account
 from ..bmsLogger import user_log
-from .order import Order
-from .order_style import MarketOrder, LimitOrder
+from ..bmsLogger.trace import exchange_trace, settlement_trace
+from .contract_spec import get_contract_prefix
+from .order import Order, parse_order_id
+from .order_book import OrderBook
+from .matching_engine import BarMatchingEngine
 from .portfolio import Portfolio
 from .risk_cal import RiskCal
+from .snapshot import PortfolioSnapshots
 from .trade import Trade
 
 class SimuExchange(object):
@@ -28,90 +29,128 @@ class SimuExchange(object):
         # TODO move risk cal outside this class
         self.risk_cal = RiskCal(trading_params, data_proxy)
 
-        self.daily_portfolios = OrderedDict()      # type: Dict[str, Portfolio], each day has a portfolio copy
-        self.all_orders = {}                       # type: Dict[str, Order], all orders, including cancel orders
-        self.open_orders = defaultdict(list)       # type: Dict[str, List[Order]], all open orders
+        self.daily_portfolios = PortfolioSnapshots()  # type: Dict[datetime, PortfolioSnapshot], each settlement has a snapshot
+        self.all_orders = {}                       # type: Dict[int, Order], all orders, including cancel orders
+        self.open_orders = OrderBook()             # type: OrderBook, all open orders indexed by id/contract/status
+        self.matching_engine = kwargs.get("matching_engine", BarMatchingEngine())
+        self.deferred_matching = trading_params.matching_mode == MATCHING_MODE.BAR_END
+        self.queued_orders = []                    # type: List[Order], orders waiting for the end of bar batch match
 
         self.start_date = start_date = self.trading_params.trading_calendar[0].to_datetime()
         self.account = Account(start_date=start_date, init_cash=self.trading_params.init_cash)
+        # 数据目录自带的commission.json覆盖默认配置中的同名品种
+        self.contract_specs.update_commission_info(data_proxy.commission_info())
+        # commission.json没有配置保证金比例或合约乘数时从合约信息中获取
+        self.contract_specs.bind_instruments(data_proxy.instrument)
+        self.account.portfolio.positions.bind_contract_specs(self.contract_specs)
 
         self.last_date = None        # type: datetime.date, last trading date
         self.simu_days_cnt = 0       # type: int, days count since simulation start
 
+        # 投资组合版本号,成交、价格更新和结算时递增,用于策略只读视图的失效
+        self.portfolio_version = 0
+
+        self._price_cache = None     # type: tuple, (dt, 持仓数, 价格向量), 同一个bar内复用
+
     def on_dt_change(self, dt):
         """时间Ticker"""
         if dt.to_datetime() != self.current_date:
             self.last_date = self.current_date
         self.dt = dt.to_datetime()
 
+    @property
+    def contract_specs(self):
+        return self.account.commission_decider.contract_specs
+
     @property
     def current_date(self):
         return self.dt if self.dt else None
 
+    def gather_prices(self, bar_dict):
+        """按持仓表的顺序取出所有持仓合约当前bar的收盘价,同一个bar内只取一次"""
+        positions = self.account.portfolio.positions
+        dt = getattr(bar_dict, "dt", None)
+        cache = self._price_cache
+        if dt is not None and cache is not None and cache[0] is dt and cache[1] == len(positions):
+            return cache[2]
+        prices = np.array([bar_dict[order_book_id].close for order_book_id in positions.order_book_ids()], dtype=np.float64)
+        self._price_cache = (dt, len(positions), prices)
+        return prices
+
     def update_position(self, bar_dict):
-        """更新仓位的情况"""
+        """更新仓位的情况,对所有持仓一次向量化计算"""
         portfolio = self.account.portfolio
-        commission_info = self.account.commission_decider.commission_info
         positions = portfolio.positions
-        old_premium = 0
-        new_premium = 0
-        for order_book_id, position in iteritems(positions):
-            position.market_value = bar_dict[order_book_id].close 
+        if len(positions):
+            market_value = positions.column("market_value")
+            bought_premium = positions.column("bought_premium")
+            sold_premium = positions.column("sold_premium")
+            margin_rate = positions.column("margin_rate")
+            multiplier = positions.column("multiplier")
+
+            market_value[:] = self.gather_prices(bar_dict)
             #计算权益变动
-            symbol = self.get_contract_prefix(order_book_id)
-            old_premium += position.bought_premium + position.sold_premium
-            position.bought_premium = (position.market_value * position.bought_quantity) * float(commission_info[symbol]['premium']) * float(commission_info[symbol]['multiplier'])
-            position.sold_premium = (position.market_value * position.sold_quantity) * float(commission_info[symbol]['premium']) * float(commission_info[symbol]['multiplier'])
-            new_premium += position.bought_premium + position.sold_premium
-        portfolio.cash += (old_premium - new_premium)
-            
+            old_premium = bought_premium.sum() + sold_premium.sum()
+            bought_premium[:] = market_value * positions.column("bought_quantity") * margin_rate * multiplier
+            sold_premium[:] = market_value * positions.column("sold_quantity") * margin_rate * multiplier
+            new_premium = bought_premium.sum() + sold_premium.sum()
+            portfolio.cash += float(old_premium - new_premium)
+        self.portfolio_version += 1
+
     def get_previous_portfolio(self):
         """返回之前的组合收益结构"""
         return self.daily_portfolios.get(self.last_date)
         
-    def match_current_orders(self, bar_dict):
-        """根据当前数据匹配落单"""
-        trades, close_orders = self.match_orders(bar_dict)
+    def match_current_orders(self, bar_dict, order_book_ids=None, resting=False, priority=None):
+        """根据当前数据匹配落单
+        :order_book_ids: 只撮合这些合约的挂单,为None时撮合所有有挂单的合约
+        :resting: 是否撮合之前bar留下的挂单
+        :priority: 成交顺序,id(order) -> 序号
+        """
+        trades, close_orders = self.match_orders(bar_dict, order_book_ids, resting, priority)
         for trade in trades:
             self.account.record_new_trade(self.current_date, trade)
+        if trades:
+            self.portfolio_version += 1
         self.remove_close_orders(close_orders)
 
         # remove rejected order
-        rejected_orders = []
-        for order_book_id, order_list in iteritems(self.open_orders):
-            for order in order_list:
-                if order.status == ORDER_STATUS.REJECTED:
-                    rejected_orders.append(order)
-        self.remove_close_orders(rejected_orders)
+        self.remove_close_orders(self.open_orders.with_status(ORDER_STATUS.REJECTED))
 
     def settlement_daily_portfolio(self):
         """盯市每日结算Market to Market"""
         previous_portfolio = self.get_previous_portfolio()
         portfolio = self.account.portfolio
         positions = portfolio.positions
-        commission_info = self.account.commission_decider.commission_info
-        print('euxyacg before settlement:%s' % portfolio.__dict__)
+        if settlement_trace.debug_on:
+            settlement_trace.debug("before settlement %s: %r", self.current_date, portfolio.__dict__)
 
-        for order_book_id, position in iteritems(positions):
-            #根据平均持仓价格结算盈亏
-            symbol = self.get_contract_prefix(order_book_id)
-            longprofit = position.bought_quantity * (position.market_value - position.average_long_cost) * float(commission_info[symbol]['multiplier'])
-            shortprofit = position.sold_quantity * (position.average_short_cost - position.market_value) * float(commission_info[symbol]['multiplier'])
+        if len(positions):
+            market_value = positions.column("market_value")
+            multiplier = positions.column("multiplier")
+            bought_quantity = positions.column("bought_quantity")
+            sold_quantity = positions.column("sold_quantity")
+            average_long_cost = positions.column("average_long_cost")
+            average_short_cost = positions.column("average_short_cost")
 
-            portfolio.pnl += (longprofit + shortprofit)
+            #根据平均持仓价格结算盈亏
+            longprofit = bought_quantity * (market_value - average_long_cost) * multiplier
+            shortprofit = sold_quantity * (average_short_cost - market_value) * multiplier
+            portfolio.pnl += float((longprofit + shortprofit).sum())
 
             #多空持仓的平均价格按照结算价格重新计算
-            position.average_short_cost = position.market_value
-            position.average_long_cost = position.market_value
+            average_short_cost[:] = market_value
+            average_long_cost[:] = market_value
 
             #多空持单的保证金需要重新计算
-            position.bought_premium = (position.market_value * position.bought_quantity) * float(commission_info[symbol]['premium']) * float(commission_info[symbol]['multiplier'])  
-            position.sold_premium = (position.market_value * position.sold_quantity) * float(commission_info[symbol]['premium']) * float(commission_info[symbol]['multiplier'])
-
+            margin_rate = positions.column("margin_rate")
+            positions.column("bought_premium")[:] = market_value * bought_quantity * margin_rate * multiplier
+            positions.column("sold_premium")[:] = market_value * sold_quantity * margin_rate * multiplier
 
         #判断是否需要追加保证金
         if portfolio.cash <= 0:
-            print('Compensate premium:%f' % portfolio.cash)
+            if settlement_trace.warning_on:
+                settlement_trace.warning("compensate premium %s: %f", self.current_date, portfolio.cash)
 
         if previous_portfolio is None:
             previous_portfolio_value = portfolio.starting_cash
@@ -127,147 +166,211 @@ class SimuExchange(object):
         portfolio.annualized_returns = portfolio.total_returns * (
             DAYS_CNT.DAYS_A_YEAR / float((self.current_date - self.trading_params.start_date).days + 1))
         
-        # 保存当前投资组合结构
-        self.daily_portfolios[self.current_date] = copy.deepcopy(portfolio)
+        # 保存当前投资组合结构和当日成交的区间
+        self.daily_portfolios.record(self.current_date, portfolio)
+        self.account.settle_trades(self.current_date)
         # 计算当日风险水平
         self.risk_cal.calculate(self.current_date, portfolio.daily_returns)
         portfolio.pnl = 0
+        self.portfolio_version += 1
 
-        print('euxyacg after settlement:%s' % portfolio.__dict__)
+        if settlement_trace.debug_on:
+            settlement_trace.debug("after settlement %s: %r", self.current_date, portfolio.__dict__)
 
     def update_portfolio(self, bar_dict):
-        #获取佣金对象这里为了拿到最小合约乘数后期需要抽象更新
-        commission_info = self.account.commission_decider.commission_info
-        portfolio = self.account.portfolio
-        positions = portfolio.positions
-
-        for order_book_id, position in iteritems(positions):
-            #根据order_book_id获取合约前缀
-            symbol = self.get_contract_prefix(order_book_id)
-            position.market_value = bar_dict[order_book_id].close
-
-    def create_order(self, bar_dict, order_book_id, amount, direction, offset):
-        order = Order(self.dt, order_book_id, amount, direction, offset)
-        self.open_orders[order_book_id].append(order)
+        positions = self.account.portfolio.positions
+        if len(positions):
+            positions.column("market_value")[:] = self.gather_prices(bar_dict)
+        self.portfolio_version += 1
+
+    def create_order(self, bar_dict, order_book_id, amount, direction, offset, style=None):
+        order = Order(self.dt, order_book_id, amount, direction, offset, style)
+        self.open_orders.add(order)
         self.all_orders[order.order_id] = order
 
+        if self.deferred_matching:
+            self.queued_orders.append(order)
+            return order
+
         # match order here because ricequant do this
-        self.match_current_orders(bar_dict)
+        self.match_current_orders(bar_dict, [order_book_id])
         self.update_portfolio(bar_dict)
         return order
 
+    def match_queued_orders(self, bar_dict):
+        """bar结束时一次撮合handle_bar中排队的订单
+        同一bar内的成交顺序由trading_params.fill_priority决定
+        """
+        queued = self.queued_orders
+        if not queued:
+            return
+        self.queued_orders = []
+
+        order_book_ids = []
+        for order in queued:
+            if order.order_book_id not in order_book_ids:
+                order_book_ids.append(order.order_book_id)
+        priority = dict((id(order), i) for i, order in enumerate(self.sort_by_fill_priority(queued)))
+
+        self.match_current_orders(bar_dict, order_book_ids, priority=priority)
+        self.update_portfolio(bar_dict)
+
+    def sort_by_fill_priority(self, orders):
+        rule = self.trading_params.fill_priority
+        if rule == FILL_PRIORITY.CLOSE_FIRST:
+            return sorted(orders, key=lambda order: order.offset != 'close')
+        if rule == FILL_PRIORITY.OPEN_FIRST:
+            return sorted(orders, key=lambda order: order.offset != 'open')
+        if rule != FILL_PRIORITY.FIFO:
+            raise ValueError('Unknown fill priority {}'.format(rule))
+        return list(orders)
+
+    def match_resting_orders(self, bar_dict):
+        """新bar开始时用本bar的最高最低价撮合之前留下的限价单和止损单"""
+        if len(self.open_orders) == 0:
+            return
+        self.match_current_orders(bar_dict, resting=True)
+        self.update_portfolio(bar_dict)
+
     def cancel_order(self, order_id):
         order = self.get_order(order_id)
-        if order in self.open_orders[order.order_book_id]:
-            order.cancel()
+        if order in self.open_orders:
+            self.open_orders.cancel(order)
 
     def remove_close_orders(self, close_orders):
+        open_orders = self.open_orders
         for order in close_orders:
-            order_list = self.open_orders[order.order_book_id]
-            try:
-                order_list.remove(order)
-            except ValueError:
-                pass
+            open_orders.remove(order)
 
     def get_order(self, order_id):
-        return self.all_orders[order_id]
-
-    def match_orders(self, bar_dict):
-        # TODO abstract Matching Engine
+        """order_id可以是整数订单号或其字符串形式"""
+        return self.all_orders[parse_order_id(order_id)]
+
+    def match_orders(self, bar_dict, order_book_ids=None, resting=False, priority=None):
+        """通过撮合引擎撮合挂单并更新仓位
+        先对每个合约撮合得到可成交的订单,再按顺序校验并成交
+        :order_book_ids: 只撮合这些合约,为None时撮合所有有挂单的合约
+        :resting: 是否用本bar的最高最低价撮合之前bar留下的挂单
+        :priority: 跨合约的成交顺序,id(order) -> 序号,不在其中的订单最先成交
+        """
         trades = []
         close_orders = []
 
-        portfolio = self.account.portfolio
-        positions = portfolio.positions
-
         slippage_decider = self.account.slippage_decider
-        commission_decider = self.account.commission_decider
-        commission_info = commission_decider.commission_info
-        tax_decider = self.account.tax_decider
+        contract_specs = self.contract_specs
         data_proxy = self.data_proxy
+        matching_engine = self.matching_engine
+
+        def market_price(order):
+            return slippage_decider.get_trade_price(data_proxy, order)
+
+        open_orders = self.open_orders
+        if order_book_ids is None:
+            order_book_ids = open_orders.contracts()
+
+        fills = []
+        for order_book_id in order_book_ids:
+            orders = open_orders.orders(order_book_id)
+            if not orders:
+                continue
+
+            #获取保证金比例和合约乘数
+            spec = contract_specs[order_book_id]
+            premium = spec.margin_rate
+            multiplier = spec.multiplier
+
+            for order, trade_price in matching_engine.match(bar_dict[order_book_id], orders, resting, market_price):
+                fills.append((order, trade_price, premium, multiplier))
+
+        if priority is not None:
+            fills.sort(key=lambda fill: priority.get(id(fill[0]), -1))
+
+        for order, trade_price, premium, multiplier in fills:
+            is_pass, reason = self.validate_order(bar_dict, order, premium, multiplier)
+            if not is_pass:
+                open_orders.reject(order, reason)
+                user_log.error(reason)
+                continue
+
+            trade = self.fill_order(order, trade_price, premium, multiplier)
+            close_orders.append(order)
+            trades.append(trade)
+        return trades, close_orders
 
-        for order_book_id, order_list in iteritems(self.open_orders):
-            # TODO handle limit order
-            for order in order_list:
-
-                #计算合约前缀获取保证金比例
-                symbol = self.get_contract_prefix(order_book_id)
-                premium = float(commission_info[symbol]['premium'])
-                multiplier = float(commission_info[symbol]['multiplier'])
+    def fill_order(self, order, trade_price, premium, multiplier):
+        """按成交价成交订单并更新仓位和资金
+        :returns: 成交记录
+        :rtype: Trade
+        """
+        portfolio = self.account.portfolio
+        positions = portfolio.positions
+        order_book_id = order.order_book_id
+        amount = order.quantity
 
-                # TODO check whether can match
-                is_pass, reason = self.validate_order(bar_dict, order, premium, multiplier)
-                if not is_pass:
-                    order.mark_rejected(reason)
-                    user_log.error(reason)
-                    continue
+        trade = Trade(
+            date=self.dt,
+            order_book_id=order_book_id,
+            price=trade_price,
+            amount=order.quantity,
+            order_id=order.order_id,
+            commission=0.,
+            direction=order.direction,
+            offset=order.offset,
+        )
 
-                trade_price = slippage_decider.get_trade_price(data_proxy, order)
-                amount = order.quantity
+        commission = self.account.commission_decider.get_commission(order, trade)
+        trade.commission = commission
 
-                trade = Trade(
-                    date=order.dt,
-                    order_book_id=order_book_id,
-                    price=trade_price,
-                    amount=order.quantity,
-                    order_id=order.order_id,
-                    commission=0.,
-                )
+        # update order
+        order.filled_shares = order.quantity
+        self.open_orders.set_status(order, ORDER_STATUS.FILLED)
 
-                commission = commission_decider.get_commission(order, trade)
-                trade.commission = commission
-
-                # update order
-                order.filled_shares = order.quantity
-                close_orders.append(order)
-                trades.append(trade)
-
-                position = positions[order_book_id]
-                #更新仓位
-                if order.offset == 'open':
-                    #模拟开仓逻辑
-                    position.quantity += trade.amount
-                    portfolio.cash -= (trade_price * amount * multiplier * premium)
-                    portfolio.cash -= commission
-                    portfolio.total_commission += commission
-                    if order.direction == 'long':
-                        position.bought_premium += trade.price * amount * multiplier * premium
-                        position.long_sellable += amount
-                        position.average_long_cost = trade.price * (amount/(position.bought_quantity + amount)) + position.average_long_cost * (position.bought_quantity/(position.bought_quantity + amount)) 
-                        position.bought_quantity += amount
-                        position.market_value = trade.price
-                    if order.direction == 'short':
-                        position.sold_premium += trade.price * amount * multiplier * premium
-                        position.short_sellable += amount
-                        position.average_short_cost = trade.price * (amount/(position.sold_quantity + amount)) + position.average_short_cost * (position.sold_quantity/(position.sold_quantity + amount)) 
-                        position.sold_quantity += amount
-                        position.market_value = trade.price
-                
-                if order.offset == 'close':
-                    position.quantity -= trade.amount
-                    portfolio.cash -= commission
-                    #模拟平仓逻辑
-                    if order.direction == 'long':
-                        portfolio.cash += (position.average_short_cost * amount * multiplier * premium + (position.average_short_cost - trade.price) * multiplier)
-                        portfolio.pnl += (position.average_short_cost - trade.price) * multiplier
-                        position.sold_premium -= position.average_short_cost * amount * multiplier * premium
-                        position.average_short_cost = 0 if (position.sold_quantity - amount) == 0 else (position.average_short_cost * position.sold_quantity - trade.price * amount) / (position.sold_quantity - amount)
-                        position.sold_quantity -= amount
-                        position.short_sellable -= amount
-                        position.market_value = trade.price
-                    elif order.direction == 'short':
-                        portfolio.cash += (position.average_long_cost * amount * multiplier * premium + (trade.price - position.average_long_cost) * multiplier)
-                        portfolio.pnl += (trade.price - position.average_long_cost) * multiplier
-                        position.bought_premium -= position.average_long_cost * amount * multiplier * premium
-                        position.average_long_cost = 0 if (position.bought_quantity - amount) == 0 else (position.average_long_cost * position.bought_quantity - trade.price * amount) / (position.bought_quantity - amount)
-                        position.bought_quantity -= amount
-                        position.long_sellable -= amount
-                        position.market_value = trade.price
-                    else:
-                        print('Error direction')
-                print('euxyacg print portfolio after open or close % s' % order.offset)
-                print(portfolio.__dict__)
-        return trades, close_orders
+        position = positions[order_book_id]
+        #更新仓位
+        if order.offset == 'open':
+            #模拟开仓逻辑
+            position.quantity += trade.amount
+            portfolio.cash -= (trade_price * amount * multiplier * premium)
+            portfolio.cash -= commission
+            portfolio.total_commission += commission
+            if order.direction == 'long':
+                position.bought_premium += trade.price * amount * multiplier * premium
+                position.long_sellable += amount
+                position.average_long_cost = trade.price * (amount/(position.bought_quantity + amount)) + position.average_long_cost * (position.bought_quantity/(position.bought_quantity + amount)) 
+                position.bought_quantity += amount
+                position.market_value = trade.price
+            if order.direction == 'short':
+                position.sold_premium += trade.price * amount * multiplier * premium
+                position.short_sellable += amount
+                position.average_short_cost = trade.price * (amount/(position.sold_quantity + amount)) + position.average_short_cost * (position.sold_quantity/(position.sold_quantity + amount)) 
+                position.sold_quantity += amount
+                position.market_value = trade.price
+        
+        if order.offset == 'close':
+            position.quantity -= trade.amount
+            portfolio.cash -= commission
+            #模拟平仓逻辑
+            if order.direction == 'long':
+                portfolio.cash += (position.average_short_cost * amount * multiplier * premium + (position.average_short_cost - trade.price) * multiplier)
+                portfolio.pnl += (position.average_short_cost - trade.price) * multiplier
+                position.sold_premium -= position.average_short_cost * amount * multiplier * premium
+                position.average_short_cost = 0 if (position.sold_quantity - amount) == 0 else (position.average_short_cost * position.sold_quantity - trade.price * amount) / (position.sold_quantity - amount)
+                position.sold_quantity -= amount
+                position.short_sellable -= amount
+                position.market_value = trade.price
+            elif order.direction == 'short':
+                portfolio.cash += (position.average_long_cost * amount * multiplier * premium + (trade.price - position.average_long_cost) * multiplier)
+                portfolio.pnl += (trade.price - position.average_long_cost) * multiplier
+                position.bought_premium -= position.average_long_cost * amount * multiplier * premium
+                position.average_long_cost = 0 if (position.bought_quantity - amount) == 0 else (position.average_long_cost * position.bought_quantity - trade.price * amount) / (position.bought_quantity - amount)
+                position.bought_quantity -= amount
+                position.long_sellable -= amount
+                position.market_value = trade.price
+            elif exchange_trace.error_on:
+                exchange_trace.error("unknown direction %s of order %s", order.direction, order.order_id)
+        if exchange_trace.debug_on:
+            exchange_trace.debug("portfolio after %s %s: %r", order.offset, order.order_id, portfolio.__dict__)
+        return trade
 
     def validate_order(self, bar_dict, order, premium, multiplier):
         """判断落单是否合理
@@ -318,5 +421,4 @@ class SimuExchange(object):
 
     def get_contract_prefix(self, contract_name):
         """通用函数获取合约前缀号"""
-        symbol = contract_name[0:-4] if contract_name[-4].isdigit else contract_name[0:-3]
-        return symbol
+        return get_contract_prefix(contract_name)
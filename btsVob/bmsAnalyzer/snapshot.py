@@ -0,0 +1,210 @@
+#coding: utf-8
+
+from array import array
+
+from .position import POSITION_FIELDS, Positions
+
+PORTFOLIO_FIELDS = (
+    "starting_cash",
+    "cash",
+    "total_returns",
+    "daily_returns",
+    "market_value",
+    "portfolio_value",
+    "pnl",
+    "annualized_returns",
+    "start_date",
+    "total_commission",
+    "total_tax",
+)
+
+
+class PortfolioSnapshot(object):
+    """结算时投资组合的只读快照
+    标量字段直接保存在快照上,持仓按需从PortfolioSnapshots的持仓变化表中还原
+    """
+    __slots__ = PORTFOLIO_FIELDS + ("_book", "_day")
+
+    def __init__(self, book, day, portfolio):
+        self._book = book
+        self._day = day
+        for field in PORTFOLIO_FIELDS:
+            setattr(self, field, getattr(portfolio, field))
+
+    @property
+    def positions(self):
+        return self._book.positions_at(self._day)
+
+    @property
+    def __dict__(self):
+        items = {field: getattr(self, field) for field in PORTFOLIO_FIELDS}
+        items["positions"] = self.positions
+        return items
+
+    def __repr__(self):
+        return "PortfolioSnapshot({0})".format({field: getattr(self, field) for field in PORTFOLIO_FIELDS})
+
+
+class PortfolioSnapshots(object):
+    """按结算时间保存的投资组合快照,替代每次结算都copy.deepcopy整个Portfolio
+    持仓只记录相对上一次结算发生变化的合约,保存在按列存储的数组中,
+    内存只随持仓的变化量增长,而不是随天数乘以合约数增长;
+    设置max_history后只保留最近几次结算,更早的持仓变化合并进保留的第一次结算
+    """
+
+    def __init__(self, max_history=None):
+        self.max_history = max_history  # type: int, 保留的结算次数,None表示全部保留
+        self._base = 0                  # type: int, 保留的第一次结算是第几次结算
+        self._snapshots = []            # 第_base次结算起的快照
+        self._dates = []                # 与_snapshots对应的结算时间
+        self._index = {}                # type: Dict[datetime, int], 结算时间 -> 第几次结算
+
+        self._contracts = []            # type: List[str], 合约编号 -> order_book_id
+        self._contract_ids = {}         # type: Dict[str, int], order_book_id -> 合约编号
+        self._last_values = {}          # type: Dict[int, tuple], 每个合约最近一次记录的持仓
+
+        # 持仓变化表,每次结算的变化行为[_day_offsets[day], _day_offsets[day + 1])
+        self._day_offsets = array("l", [0])
+        self._row_contract = array("l")
+        self._row_removed = array("b")
+        self._row_values = {field: array("d") for field in POSITION_FIELDS}
+
+        self._replay_day = -1
+        self._replay_state = {}
+        self._replay_positions = None
+
+    def record(self, date, portfolio):
+        """记录一次结算后的投资组合"""
+        day = self._base + len(self._snapshots)
+        self._diff_positions(portfolio.positions)
+        self._day_offsets.append(len(self._row_contract))
+
+        snapshot = PortfolioSnapshot(self, day, portfolio)
+        self._snapshots.append(snapshot)
+        self._dates.append(date)
+        self._index[date] = day
+        if self.max_history is not None and len(self._snapshots) > self.max_history:
+            self._trim(len(self._snapshots) - self.max_history)
+        return snapshot
+
+    def _trim(self, count):
+        """丢弃最早的count次结算,到保留的第一次结算为止的持仓变化合并成该次结算的完整持仓"""
+        state = self._replay({}, 0, self._day_offsets[count + 1])
+        start = self._day_offsets[count + 1]
+        end = len(self._row_contract)
+
+        row_contract = array("l", sorted(state))
+        row_values = {field: array("d", [state[cid][i] for cid in row_contract])
+                      for i, field in enumerate(POSITION_FIELDS)}
+        base_rows = len(row_contract)
+        row_contract.extend(self._row_contract[start:end])
+        for field in POSITION_FIELDS:
+            row_values[field].extend(self._row_values[field][start:end])
+        self._row_removed = array("b", [0] * base_rows) + self._row_removed[start:end]
+        self._row_contract = row_contract
+        self._row_values = row_values
+        self._day_offsets = array("l", [0, base_rows] +
+                                  [offset - start + base_rows for offset in self._day_offsets[count + 2:]])
+
+        for date in self._dates[:count]:
+            del self._index[date]
+        del self._dates[:count]
+        del self._snapshots[:count]
+        self._base += count
+
+        self._replay_day = -1
+        self._replay_state = {}
+        self._replay_positions = None
+
+    def _replay(self, state, start, end):
+        """把[start, end)的持仓变化行依次应用到state上"""
+        columns = [self._row_values[field] for field in POSITION_FIELDS]
+        for row in range(start, end):
+            cid = self._row_contract[row]
+            if self._row_removed[row]:
+                state.pop(cid, None)
+            else:
+                state[cid] = tuple(column[row] for column in columns)
+        return state
+
+    def _diff_positions(self, positions):
+        last_values = self._last_values
+        seen = set()
+        for order_book_id, position in positions.items():
+            try:
+                cid = self._contract_ids[order_book_id]
+            except KeyError:
+                cid = self._contract_ids[order_book_id] = len(self._contracts)
+                self._contracts.append(order_book_id)
+            seen.add(cid)
+
+            values = tuple(float(getattr(position, field)) for field in POSITION_FIELDS)
+            if last_values.get(cid) != values:
+                last_values[cid] = values
+                self._append_row(cid, values, False)
+
+        for cid in [cid for cid in last_values if cid not in seen]:
+            del last_values[cid]
+            self._append_row(cid, (0.,) * len(POSITION_FIELDS), True)
+
+    def _append_row(self, cid, values, removed):
+        self._row_contract.append(cid)
+        self._row_removed.append(removed)
+        for field, value in zip(POSITION_FIELDS, values):
+            self._row_values[field].append(value)
+
+    def positions_at(self, day):
+        """还原第day次结算时的持仓
+        顺序访问时从上一次还原的位置继续重放,整体开销与变化行数成正比
+        """
+        day -= self._base
+        if day < 0:
+            raise KeyError("positions of settlement {} are no longer kept".format(day + self._base))
+        if day == self._replay_day and self._replay_positions is not None:
+            return self._replay_positions
+        if day < self._replay_day:
+            self._replay_day = -1
+            self._replay_state = {}
+
+        state = self._replay(self._replay_state, self._day_offsets[self._replay_day + 1], self._day_offsets[day + 1])
+        self._replay_day = day
+
+        positions = Positions()
+        for cid, values in state.items():
+            position = positions[self._contracts[cid]]
+            for field, value in zip(POSITION_FIELDS, values):
+                setattr(position, field, value)
+        self._replay_positions = positions
+        return positions
+
+    def get(self, date, default=None):
+        try:
+            return self._snapshots[self._index[date] - self._base]
+        except KeyError:
+            return default
+
+    def __getitem__(self, date):
+        return self._snapshots[self._index[date] - self._base]
+
+    def __contains__(self, date):
+        return date in self._index
+
+    def __len__(self):
+        return len(self._snapshots)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return list(self._dates)
+
+    def values(self):
+        return list(self._snapshots)
+
+    def items(self):
+        return list(zip(self._dates, self._snapshots))
+
+    iteritems = items  # Python 2
+
+    def __repr__(self):
+        return "PortfolioSnapshots({0} days, {1} position rows)".format(len(self), len(self._row_contract))
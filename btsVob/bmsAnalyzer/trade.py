@@ -1,8 +1,13 @@
 #coding: utf-8
 
+TRADE_FIELDS = ("date", "order_book_id", "price", "amount", "order_id", "commission", "tax", "direction", "offset")
+
+
 class Trade(object):
+    __slots__ = TRADE_FIELDS
 
-    def __init__(self, date, order_book_id, price, amount, order_id, commission=0., tax=0.):
+    def __init__(self, date, order_book_id, price, amount, order_id, commission=0., tax=0.,
+                 direction=None, offset=None):
         self.date = date
         self.order_book_id = order_book_id
         self.price = price
@@ -10,6 +15,12 @@ class Trade(object):
         self.order_id = order_id
         self.commission = commission
         self.tax = tax
+        self.direction = direction
+        self.offset = offset
+
+    @property
+    def __dict__(self):
+        return {field: getattr(self, field) for field in TRADE_FIELDS}
 
     def __repr__(self):
         return "Trade({0})".format(self.__dict__)
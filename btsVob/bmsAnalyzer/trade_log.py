@@ -0,0 +1,231 @@
+#coding: utf-8
+
+from array import array
+
+import numpy as np
+import pandas as pd
+
+from .trade import Trade
+
+INITIAL_CAPACITY = 1024
+
+# 成交日志的列,datetime为纳秒时间戳,contract为合约编号,direction和offset为下面的编码
+TRADE_LOG_DTYPES = (
+    ("datetime", np.int64),
+    ("contract", np.int32),
+    ("price", np.float64),
+    ("amount", np.float64),
+    ("commission", np.float64),
+    ("tax", np.float64),
+    ("order_id", np.int64),
+    ("direction", np.int8),
+    ("offset", np.int8),
+)
+
+DIRECTIONS = (None, "long", "short")
+OFFSETS = (None, "open", "close")
+_DIRECTION_CODES = {value: code for code, value in enumerate(DIRECTIONS)}
+_OFFSET_CODES = {value: code for code, value in enumerate(OFFSETS)}
+
+
+def to_nanoseconds(dt):
+    return int(np.datetime64(dt, "ns").view(np.int64))
+
+
+class TradeSlice(object):
+    """成交日志中[start, end)区间的视图,列为numpy视图,不拷贝数据"""
+    __slots__ = ("_log", "start", "end")
+
+    def __init__(self, log, start, end):
+        self._log = log
+        self.start = start
+        self.end = end
+
+    def column(self, field):
+        return self._log._columns[field][self.start:self.end]
+
+    def trades(self):
+        return self._log.trades(self.start, self.end)
+
+    def to_frame(self):
+        return self._log.to_frame(self.start, self.end)
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __iter__(self):
+        return iter(self.trades())
+
+    def __repr__(self):
+        return "TradeSlice([{0}, {1}))".format(self.start, self.end)
+
+
+class TradeLog(object):
+    """只追加的按列存储的成交账本,每列是按倍数扩容的numpy数组
+    每次结算记录一次当前长度,某一天的成交是两次结算之间的连续区间,切片为O(1);
+    Trade对象只在访问时才生成,整张成交表可以不拷贝地导出为DataFrame或Arrow表;
+    设置max_history后只保留最近几次结算的成交,更早的成交在结算时丢弃,之前取得的TradeSlice随之失效
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, max_history=None):
+        self.max_history = max_history  # type: int, 保留成交的结算次数,None表示全部保留
+        self._size = 0
+        self._columns = {field: np.empty(capacity, dtype=dtype) for field, dtype in TRADE_LOG_DTYPES}
+        self._contracts = []        # type: List[str], 合约编号 -> order_book_id
+        self._contract_ids = {}     # type: Dict[str, int], order_book_id -> 合约编号
+
+        # 第k次结算的成交为[_day_offsets[k], _day_offsets[k + 1])
+        self._day_offsets = array("l", [0])
+        self._days = {}             # type: Dict[datetime, int], 结算时间 -> 第几次结算
+
+    def contract_id(self, order_book_id):
+        try:
+            return self._contract_ids[order_book_id]
+        except KeyError:
+            cid = self._contract_ids[order_book_id] = len(self._contracts)
+            self._contracts.append(order_book_id)
+            return cid
+
+    def append(self, trade):
+        """追加一笔成交
+        :returns: 成交在账本中的下标
+        """
+        i = self._size
+        columns = self._columns
+        if i == len(columns["price"]):
+            self._grow()
+            columns = self._columns
+        columns["datetime"][i] = to_nanoseconds(trade.date)
+        columns["contract"][i] = self.contract_id(trade.order_book_id)
+        columns["price"][i] = trade.price
+        columns["amount"][i] = trade.amount
+        columns["commission"][i] = trade.commission
+        columns["tax"][i] = trade.tax
+        columns["order_id"][i] = trade.order_id
+        columns["direction"][i] = _DIRECTION_CODES[trade.direction]
+        columns["offset"][i] = _OFFSET_CODES[trade.offset]
+        self._size = i + 1
+        return i
+
+    def _grow(self):
+        for field, column in list(self._columns.items()):
+            grown = np.empty(len(column) * 2, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[field] = grown
+
+    def mark_settlement(self, date):
+        """结算时调用,之前还没有归属的成交都记到这次结算"""
+        self._days[date] = len(self._day_offsets) - 1
+        self._day_offsets.append(self._size)
+        if self.max_history is not None and len(self._days) > self.max_history:
+            self._trim(len(self._days) - self.max_history)
+
+    def _trim(self, count):
+        """丢弃最早count次结算的成交,剩下的成交移到数组开头"""
+        start = self._day_offsets[count]
+        size = self._size - start
+        for column in self._columns.values():
+            column[:size] = column[start:self._size]
+        self._size = size
+        self._day_offsets = array("l", [offset - start for offset in self._day_offsets[count:]])
+        self._days = {date: k - count for date, k in self._days.items() if k >= count}
+
+    def day(self, date):
+        """某次结算的成交,没有这次结算时返回None"""
+        k = self._days.get(date)
+        if k is None:
+            return None
+        return TradeSlice(self, self._day_offsets[k], self._day_offsets[k + 1])
+
+    def unsettled(self):
+        """最近一次结算之后的成交"""
+        return TradeSlice(self, self._day_offsets[-1], self._size)
+
+    def column(self, field):
+        """某一列已写入部分的视图"""
+        return self._columns[field][:self._size]
+
+    def trade(self, i):
+        columns = self._columns
+        return Trade(
+            date=pd.Timestamp(int(columns["datetime"][i])).to_pydatetime(),
+            order_book_id=self._contracts[columns["contract"][i]],
+            price=float(columns["price"][i]),
+            amount=float(columns["amount"][i]),
+            order_id=int(columns["order_id"][i]),
+            commission=float(columns["commission"][i]),
+            tax=float(columns["tax"][i]),
+            direction=DIRECTIONS[columns["direction"][i]],
+            offset=OFFSETS[columns["offset"][i]],
+        )
+
+    def trades(self, start=0, end=None):
+        end = self._size if end is None else end
+        return [self.trade(i) for i in range(start, end)]
+
+    def _export_columns(self, start, end):
+        columns = self._columns
+        return [
+            ("datetime", columns["datetime"][start:end].view("datetime64[ns]")),
+            ("contract", columns["contract"][start:end]),
+            ("price", columns["price"][start:end]),
+            ("amount", columns["amount"][start:end]),
+            ("commission", columns["commission"][start:end]),
+            ("tax", columns["tax"][start:end]),
+            ("order_id", columns["order_id"][start:end]),
+            ("direction", columns["direction"][start:end]),
+            ("offset", columns["offset"][start:end]),
+        ]
+
+    def to_frame(self, start=0, end=None):
+        """以DataFrame返回成交,数值列直接引用账本的数组
+        order_book_id、direction和offset为引用编码数组的Categorical
+        """
+        end = self._size if end is None else end
+        data = {}
+        for field, values in self._export_columns(start, end):
+            if field == "contract":
+                data["order_book_id"] = pd.Categorical.from_codes(values, categories=self._contracts)
+            elif field == "direction":
+                data[field] = pd.Categorical.from_codes(values - 1, categories=list(DIRECTIONS[1:]))
+            elif field == "offset":
+                data[field] = pd.Categorical.from_codes(values - 1, categories=list(OFFSETS[1:]))
+            else:
+                data[field] = values
+        columns = ["datetime", "order_book_id", "price", "amount", "commission", "tax", "order_id", "direction", "offset"]
+        return pd.DataFrame(data, columns=columns, copy=False)
+
+    def to_arrow(self):
+        """以pyarrow.Table返回所有成交,数值列零拷贝,合约、方向和开平为字典编码列"""
+        import pyarrow as pa
+
+        arrays, names = [], []
+        for field, values in self._export_columns(0, self._size):
+            if field == "contract":
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(values), pa.array(self._contracts, pa.string())))
+                names.append("order_book_id")
+                continue
+            if field in ("direction", "offset"):
+                # 编码0表示未知,导出为null
+                categories = DIRECTIONS if field == "direction" else OFFSETS
+                indices = pa.array(values - 1, mask=values == 0)
+                arrays.append(pa.DictionaryArray.from_arrays(indices, pa.array(categories[1:], pa.string())))
+            else:
+                arrays.append(pa.array(values))
+            names.append(field)
+        return pa.Table.from_arrays(arrays, names=names)
+
+    def to_parquet(self, path):
+        import pyarrow.parquet as pq
+        pq.write_table(self.to_arrow(), path)
+
+    def to_feather(self, path):
+        import pyarrow.feather as feather
+        feather.write_feather(self.to_arrow(), path)
+
+    def __len__(self):
+        return self._size
+
+    def __repr__(self):
+        return "TradeLog({0} trades, {1} contracts, {2} settlements)".format(
+            self._size, len(self._contracts), len(self._days))
@@ -10,8 +10,12 @@ import six
 from ..bmsUtils import ExecutionContext
 from ..bmsUtils.history import HybridDataFrame, missing_handler
 from ..bmsUtils.const import *
+from ..bmsAnalyzer.order_style import MarketOrder, LimitOrder, StopOrder
 
 __all__ = [
+    'MarketOrder',
+    'LimitOrder',
+    'StopOrder',
 ]
 
 def export_as_api(func):
@@ -34,15 +38,35 @@ def history(bar_count, frequency, field):
     return HybridDataFrame(results, missing_handler=handler)
 
 @export_as_api
-def order_shares(id_or_ins, amount, direction, offset):
+@ExecutionContext.enforce_phase(EXECUTION_PHASE.BEFORE_TRADING,
+                                EXECUTION_PHASE.HANDLE_BAR,
+                                EXECUTION_PHASE.SCHEDULED)
+def history_array(id_or_ins, bar_count, frequency, field):
+    """history的快速模式,返回单个合约最近bar_count根bar的只读numpy视图
+    不构建DataFrame和时间索引,需要时间索引时访问返回值的index属性
+    """
+    order_book_id = assure_order_book_id(id_or_ins)
+    executor = get_strategy_executor()
+    executor.current_universe.add(order_book_id)
+    dt = ExecutionContext.get_current_dt()
+    return get_data_proxy().history_array(order_book_id, dt, bar_count, frequency, field)
+
+@export_as_api
+def cancel_order(order_id):
+    """撤销还没有成交的挂单"""
+    get_simu_exchange().cancel_order(order_id)
+
+@export_as_api
+def order_shares(id_or_ins, amount, direction, offset, style=None):
     """根据合约号和需要买卖的手数落单回测对外接口,后续需要统一
     :direction: long, short
     :offset: open, close
+    :style: MarketOrder(默认), LimitOrder(price)或StopOrder(price)
     """
     order_book_id = assure_order_book_id(id_or_ins)
     amount = int(amount)
     bar_dict = ExecutionContext.get_current_bar_dict()
-    order = get_simu_exchange().create_order(bar_dict, order_book_id, amount, direction, offset)
+    order = get_simu_exchange().create_order(bar_dict, order_book_id, amount, direction, offset, style)
     return order.order_id
 
 def assure_order_book_id(id_or_ins):
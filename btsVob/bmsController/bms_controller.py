@@ -1,22 +1,16 @@
 #coding: utf-8
+import argparse
 import codecs
+import errno
 import os
 import sys
-import getopt
-import json
-
-import numpy as np
-import pandas as pd
-from pandas import Series, DataFrame
-from six import exec_, print_, StringIO, iteritems
-
-from ..bmsUtils import dummy_func
-from ..bmsUtils import Date
-from ..bmsUtils import TradingParams
-from ..bmsData import LocalDataProxy
-from ..bmsStrategy import StrategyExecutor
-from ..bmsScheduler import scheduler
-from . import api
+
+from six import exec_, print_
+
+from .parallel import BATCH_FIELDS, DEFAULT_INIT_CASH, FILL_PRIORITIES, MATCHING_MODES
+
+# pandas、数据和回测模块在真正运行回测时才导入,解析参数和显示帮助不需要加载它们
+
 
 class BtsController(object):
     """
@@ -33,95 +27,191 @@ class BtsController(object):
         self.plot = False
         self.progress = True
         self.frequency = '1m'
+        self.vectorized = False
+        self.matching_mode = MATCHING_MODES[0]
+        self.fill_priority = FILL_PRIORITIES[0]
+        self.profile = False
+        self.profile_output = None
+        self.profile_user = False
+
+    def build_parser(self):
+        """单个策略回测的命令行参数"""
+        parser = argparse.ArgumentParser(
+            prog="python btsMain.py",
+            description="run a strategy backtest",
+            epilog="batch mode: python btsMain.py batch MANIFEST [options], see batch --help")
+        parser.add_argument("-v", "--verbose", action="store_true", help="set option to hide info")
+        parser.add_argument("-d", "--data-bundle-path", default=self.databundlepath, help="data bundle path")
+        parser.add_argument("-f", "--strategy-file", required=True)
+        parser.add_argument("-s", "--start-date", required=True)
+        parser.add_argument("-e", "--end-date", required=True)
+        parser.add_argument("-o", "--output-file", default=None,
+                            help=".parquet/.feather/.arrow/.h5 are written per settlement, anything else is pickled")
+        parser.add_argument("-r", "--frequency", default=self.frequency)
+        parser.add_argument("-c", "--init-cash", type=float, default=DEFAULT_INIT_CASH)
+        parser.add_argument("--plot", dest="plot", action="store_true", help="draw graphic after the backtest")
+        parser.add_argument("--no-plot", dest="plot", action="store_false")
+        parser.add_argument("--progress", dest="progress", action="store_true", help="display progress bar")
+        parser.add_argument("--no-progress", dest="progress", action="store_false")
+        parser.add_argument("--vectorized", action="store_true",
+                            help="run the signal function of strategy in vectorized mode")
+        parser.add_argument("--matching-mode", default=self.matching_mode, choices=MATCHING_MODES,
+                            help="match orders when placed or queue them until the bar ends, default %(default)s")
+        parser.add_argument("--fill-priority", default=self.fill_priority, choices=FILL_PRIORITIES,
+                            help="order of fills for orders queued in bar_end mode, default %(default)s")
+        parser.add_argument("--trace", default=None, help="trace levels, e.g. exchange=debug,settlement=info")
+        parser.add_argument("--trace-file", default=None,
+                            help="write traces to this ring buffer file instead of stderr, see read_ring_buffer")
+        parser.add_argument("--profile", action="store_true", help="print per phase timings after the backtest")
+        parser.add_argument("--profile-output", default=None, help="write per phase timings as JSON to this file")
+        parser.add_argument("--profile-user", action="store_true", help="also run cProfile on the strategy code")
+        parser.set_defaults(plot=self.plot, progress=self.progress)
+        return parser
+
+    def build_batch_parser(self):
+        """批量回测的命令行参数"""
+        parser = argparse.ArgumentParser(
+            prog="python btsMain.py batch",
+            description="run the backtests of a manifest on a worker pool",
+            epilog="manifest columns: {}; only strategy_file, start_date and end_date are required".format(
+                ", ".join(BATCH_FIELDS)))
+        parser.add_argument("manifest", help="CSV file with a header row, or a JSON list of jobs")
+        parser.add_argument("-d", "--data-bundle-path", default=self.databundlepath, help="data bundle path")
+        parser.add_argument("-o", "--output-dir", default="batch_results", help="directory of the per job results")
+        parser.add_argument("--summary", default=None, help="summary CSV, default OUTPUT_DIR/summary.csv")
+        parser.add_argument("-w", "--workers", type=int, default=None, help="worker processes, default CPU count")
+        parser.add_argument("--max-pending", type=int, default=None,
+                            help="jobs queued or running at a time, default twice the workers")
+        parser.add_argument("--format", default="pkl", choices=["pkl", "parquet", "feather", "arrow", "h5"],
+                            help="results file format of jobs without output_file")
+        parser.add_argument("--bar-bundle", default=None, help="shared memory mapped bar bundle")
+        parser.add_argument("--preload", default="all",
+                            help="contracts decompressed once before the workers fork: all (default, skipped with "
+                                 "--bar-bundle), none, or a comma separated list")
+        parser.add_argument("--vectorized", action="store_true", help="run all jobs in vectorized mode")
+        parser.add_argument("--matching-mode", default=self.matching_mode, choices=MATCHING_MODES,
+                            help="matching mode of jobs without matching_mode, default %(default)s")
+        parser.add_argument("--fill-priority", default=self.fill_priority, choices=FILL_PRIORITIES,
+                            help="fill priority of jobs without fill_priority, default %(default)s")
+        parser.add_argument("--trace", default=None, help="trace levels, e.g. controller=info")
+        return parser
 
     def useage(self):
-        print('python btsMain [option][value]...')
-        print('-h or --help for detail')
-        print('-v or --verbose set option to hide info')
-        print('-d or --data-bundle-path for update data need assign a data path')
-        print('-f or --strategy-file')
-        print('-s or --start-date')
-        print('-e or --end-date')
-        print('-o or --output-file')
-        print('-r or --frequency')
-        print('--plot/--no-plot whether need draw graphic')
-        print('--progress/--no-progress whether need display progress bar')
-    
+        self.build_parser().print_help()
+
     def process_command(self, args):
-        """处理参数 
-        :rags: 主程序的参数列表
+        """处理参数,第一个参数为batch时运行批量回测
+        :args: 主程序的参数列表
         """
-        #参数的短格式
-        par_str = 'hvd:f:s:e:o:r:'
-        #参数的长格式
-        par_list = ['help',
-                    'verbose',
-                    'data-bundle-path=',
-                    'strategy-file=',
-                    'start-date=',
-                    'end-date=',
-                    'output-file',
-                    'frequency',
-                    'plot',
-                    'no-plot',
-                    'progress',
-                    'no-progress']
+        if args and args[0] == "batch":
+            return self.process_batch_command(args[1:])
+
+        options = self.build_parser().parse_args(args)
+        trace_sink = None
+        if options.trace or options.trace_file:
+            from ..bmsLogger import install_handlers
+            from ..bmsLogger.trace import RingBufferTraceSink, controller_trace, configure_trace
+            # 在第一条trace之前安装handler,否则这条记录会交给logbook默认的stderr handler
+            install_handlers()
+            if options.trace_file:
+                trace_sink = RingBufferTraceSink(options.trace_file)
+                configure_trace(options.trace, sink=trace_sink)
+            else:
+                configure_trace(options.trace)
+            if controller_trace.debug_on:
+                controller_trace.debug("options %r", options)
+
+        self.databundlepath = options.data_bundle_path
+        self.strategyfile = options.strategy_file
+        self.outputfile = options.output_file
+        self.start_time = options.start_date
+        self.end_time = options.end_date
+        self.plot = options.plot
+        self.progress = options.progress
+        self.frequency = options.frequency
+        self.vectorized = options.vectorized
+        self.matching_mode = options.matching_mode
+        self.fill_priority = options.fill_priority
+        self.profile = options.profile or options.profile_output is not None or options.profile_user
+        self.profile_output = options.profile_output
+        self.profile_user = options.profile_user
+
+        profiler = None
+        if self.profile:
+            from ..bmsStrategy.profiler import PhaseProfiler
+            profiler = PhaseProfiler(output=self.profile_output, user_profiler=self.profile_user)
         try:
-            options,args = getopt.getopt(args, par_str, par_list)
-            print('euxyacg')
-            print(options)
-            for name,value in options:
-                if name in ('-h', '--help'):
-                    self.useage()
-                elif name in ('-d', '--data-bundle-path'):
-                    self.databundlepath = value
-                elif name in ('-f', '--strategy-file'):
-                    self.strategyfile = value
-                elif name in ('-o', '--output-file'):
-                    self.outputfile = value
-                elif name in ('-s', '--start-date'):
-                    self.start_time = value
-                elif name in ('-e', '--end-date'):
-                    self.end_time = value
-                elif name in ('-r','--frequency'):
-                    self.frequency = value
-                elif name in ('--plot'):
-                    self.plot = True 
-                elif name in ('--no-plot'):
-                    self.plot = False
-                elif name in ('--progress'):
-                    self.progress = True
-                elif name in ('--no-progress'):
-                    self.progress = False
-            self.work(self.strategyfile, self.start_time, self.end_time, self.outputfile, self.plot, self.databundlepath, 1000000, self.progress, self.frequency)
-
-        except getopt.GetoptError:
-            self.useage()
-
-    def work(self, strategy_file, start_date, end_date, output_file, plot, data_bundle_path, init_cash, progress, frequency): 
+            self.work(self.strategyfile, self.start_time, self.end_time, self.outputfile, self.plot,
+                      self.databundlepath, options.init_cash, self.progress, self.frequency, vectorized=self.vectorized,
+                      profiler=profiler, matching_mode=self.matching_mode, fill_priority=self.fill_priority)
+        finally:
+            if trace_sink is not None:
+                configure_trace(sink=None)
+                trace_sink.close()
+
+    def process_batch_command(self, args):
+        """处理batch命令的参数"""
+        options = self.build_batch_parser().parse_args(args)
+        if options.trace:
+            from ..bmsLogger.trace import configure_trace
+            configure_trace(options.trace)
+
+        jobs, failed = self.batch(options.manifest, options.data_bundle_path, options.output_dir,
+                                  summary_file=options.summary, processes=options.workers,
+                                  max_pending=options.max_pending, result_format="." + options.format,
+                                  preload=self.parse_preload(options.preload), bar_bundle=options.bar_bundle,
+                                  vectorized=options.vectorized, matching_mode=options.matching_mode,
+                                  fill_priority=options.fill_priority)
+        print("{0} jobs finished, {1} failed, summary in {2}".format(
+            jobs, failed, options.summary or os.path.join(options.output_dir, "summary.csv")))
+
+    def parse_preload(self, value):
+        """--preload的取值,all表示默认(没有bar_bundle时加载所有合约),none表示不预先加载"""
+        if value == "all":
+            return None
+        if value == "none":
+            return ()
+        return [order_book_id.strip() for order_book_id in value.split(",") if order_book_id.strip()]
+
+    def work(self, strategy_file, start_date, end_date, output_file, plot, data_bundle_path, init_cash, progress, frequency, vectorized=False,
+             profiler=None, data_proxy=None, strategy_params=None, matching_mode=None, fill_priority=None):
         """控制类的工作函数调用策略运行函数
         :strategy_file:策略文件
         :start_date:回测开始时间
         :end_date:回测结束时间
-        :output_file:输出文件
+        :output_file:输出文件,扩展名为.parquet/.feather/.arrow/.h5时每次结算直接追加写入,否则结束后pickle
         :plot:是否画图标记
         :data_bundle_path:数据文件路径
         :init_cash:初始资金
         :progress:是否显示进度条
         :frequency:回测数据频率
+        :vectorized:是否以向量化模式运行策略的signal函数
+        :profiler:可选的PhaseProfiler,统计事件驱动回测各阶段的耗时
+        :data_proxy:已经打开的数据代理,为None时从data_bundle_path打开
+        :strategy_params:覆盖策略init中设置的参数
+        :matching_mode:撮合方式,immediate或bar_end,None表示TradingParams的默认值
+        :fill_priority:bar_end模式下排队订单的成交顺序,fifo、close_first或open_first
+        :returns: 回测结果,写列式文件时为ResultReader,只在画图时才读成DataFrame
         """
+        from ..bmsStrategy.result_sink import load_results, make_result_sink
+
         with codecs.open(strategy_file, encoding="utf-8") as f:
             source_code = f.read()
 
+        result_sink = make_result_sink(output_file)
         results_df = self.run_strategy(source_code, strategy_file, start_date, end_date,
-                                  init_cash, data_bundle_path, progress, frequency)
+                                  init_cash, data_bundle_path, progress, frequency, vectorized=vectorized,
+                                  result_sink=result_sink, profiler=profiler, data_proxy=data_proxy,
+                                  strategy_params=strategy_params, matching_mode=matching_mode,
+                                  fill_priority=fill_priority)
 
-        if output_file is not None:
+        if output_file is not None and result_sink.keeps_objects:
             results_df.to_pickle(output_file)
 
         if plot:
-            self.show_draw_result(strategy_file, results_df)
-    
+            self.show_draw_result(strategy_file, load_results(results_df))
+        return results_df
+
     def show_draw_result(self, title, results_df):
         """绘图函数"""
         import matplotlib
@@ -192,10 +282,71 @@ class BtsController(object):
 
         plt.show()
 
+    def sweep(self, strategy_file, param_grid, start_date, end_date, data_bundle_path,
+              init_cash, frequency, processes=None, preload=None, output_file=None, bar_bundle=None,
+              vectorized=False):
+        """参数扫描,把参数网格上的每组参数分发到进程池中回测
+        :strategy_file:策略文件
+        :param_grid:参数网格,如{"OBSERVATION": [10, 20, 30]}
+        :processes:进程数,默认为CPU核数
+        :preload:在主进程中预先加载的合约,fork后子进程共享,None表示没有bar_bundle时加载所有合约
+        :output_file:汇总结果输出文件
+        :bar_bundle:可选,各进程只读共享的内存映射行情文件
+        :vectorized:以向量化模式筛选参数
+        :returns: 每组参数最终风险指标的汇总DataFrame
+        """
+        from . import parallel
+
+        summary_df = parallel.run_sweep(strategy_file, param_grid, start_date, end_date, data_bundle_path,
+                                        init_cash, frequency, processes=processes, preload=preload,
+                                        bar_bundle=bar_bundle, vectorized=vectorized)
+        if output_file is not None:
+            summary_df.to_pickle(output_file)
+        return summary_df
+
+    def batch(self, manifest, data_bundle_path, output_dir, summary_file=None, processes=None, max_pending=None,
+              result_format=".pkl", preload=None, bar_bundle=None, vectorized=False, matching_mode=MATCHING_MODES[0],
+              fill_priority=FILL_PRIORITIES[0]):
+        """批量回测,在进程池中运行任务清单中的每个策略,数据目录在每个进程中只打开一次
+        :manifest:任务清单,CSV或JSON,每个任务包含策略文件、回测区间、频率、初始资金和合约
+        :output_dir:每个任务的结果文件目录
+        :summary_file:汇总CSV,每个任务完成后追加一行
+        :processes:进程数,默认为CPU核数
+        :max_pending:排队中的任务上限
+        :result_format:没有指定output_file的任务的结果文件扩展名
+        :preload:在主进程中预先加载的合约,fork后子进程共享,None表示没有bar_bundle时加载所有合约
+        :matching_mode:清单中没有matching_mode的任务的撮合方式
+        :fill_priority:清单中没有fill_priority的任务的成交顺序
+        :returns: (任务数, 失败的任务数)
+        """
+        from . import parallel
+
+        return parallel.run_batch(manifest, data_bundle_path, output_dir, summary_file=summary_file,
+                                  processes=processes, max_pending=max_pending, result_format=result_format,
+                                  preload=preload, bar_bundle=bar_bundle, vectorized=vectorized,
+                                  matching_mode=matching_mode, fill_priority=fill_priority)
+
     def run_strategy(self, source_code, strategy_filename, start_date, end_date,
-                     init_cash, data_bundle_path, show_progress, frequency):
+                     init_cash, data_bundle_path, show_progress, frequency,
+                     data_proxy=None, strategy_params=None, vectorized=False, result_sink=None, profiler=None,
+                     matching_mode=None, fill_priority=None):
         """运行策略类
+        :data_proxy:已经打开的数据代理,为None时从data_bundle_path打开
+        :strategy_params:覆盖策略init中设置的参数
+        :vectorized:为True时调用策略的signal函数做向量化回测,结果结构与事件驱动模式相同
+        :result_sink:事件驱动模式下每次结算的结果输出,默认保存在内存中
+        :profiler:事件驱动模式下的分阶段profiler,结束时打印或导出报告
+        :matching_mode:事件驱动模式下的撮合方式,None表示TradingParams的默认值
+        :fill_priority:事件驱动模式下bar_end撮合时的成交顺序,None表示TradingParams的默认值
         """
+        from ..bmsUtils import Date, TradingParams, dummy_func
+        from ..bmsData import LocalDataProxy
+        from ..bmsStrategy import StrategyExecutor, VectorizedStrategyExecutor
+        from ..bmsScheduler import scheduler
+        from ..bmsLogger import install_handlers
+        from . import api
+
+        install_handlers()
         start_date = Date(start_date).convert().to_datetime()
         end_date = Date(end_date).convert().to_datetime()
         scope = {}
@@ -203,18 +354,38 @@ class BtsController(object):
         code = compile(source_code, strategy_filename, 'exec')
         exec_(code, scope)
 
-        try:
-            data_proxy = LocalDataProxy(data_bundle_path)
-        except OSError as e:
-            if e.errno == errno.EEXIST:
-                print_("data bundle might crash. Run `%s update_bundle` to redownload data bundle." % sys.argv[0])
-                sys.exit()
+        if data_proxy is None:
+            try:
+                data_proxy = LocalDataProxy(data_bundle_path)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    print_("data bundle might crash. Run `%s update_bundle` to redownload data bundle." % sys.argv[0])
+                    sys.exit()
 
         trading_cal = data_proxy.get_trading_dates(start_date, end_date)
         scheduler.set_trading_dates(data_proxy.get_trading_dates(start_date, end_date))
+        matching = {}
+        if matching_mode is not None:
+            matching["matching_mode"] = matching_mode
+        if fill_priority is not None:
+            matching["fill_priority"] = fill_priority
         trading_params = TradingParams(trading_cal, start_date=start_date, end_date=end_date,
                                        frequency=frequency, init_cash=init_cash,
-                                       show_progress=show_progress)
+                                       show_progress=show_progress, **matching)
+
+        if vectorized:
+            if "signal" not in scope:
+                raise RuntimeError("vectorized mode needs a signal(context, bars) function in %s" % strategy_filename)
+            executor = VectorizedStrategyExecutor(
+                init=scope.get("init", dummy_func),
+                signal=scope["signal"],
+
+                trading_params=trading_params,
+                data_proxy=data_proxy,
+                strategy_params=strategy_params,
+                result_sink=result_sink,
+            )
+            return executor.execute()
 
         executor = StrategyExecutor(
             init=scope.get("init", dummy_func),
@@ -223,6 +394,9 @@ class BtsController(object):
 
             trading_params=trading_params,
             data_proxy=data_proxy,
+            strategy_params=strategy_params,
+            result_sink=result_sink,
+            profiler=profiler,
         )
 
         results_df = executor.execute()
@@ -0,0 +1,315 @@
+#coding: utf-8
+
+import codecs
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+# 参数扫描汇总表中保留的最终组合和风险指标
+SUMMARY_FIELDS = [
+    "total_returns",
+    "annualized_returns",
+    "portfolio_value",
+    "total_commission",
+    "volatility",
+    "max_drawdown",
+    "sharpe",
+    "downside_risk",
+    "sortino",
+]
+
+# 批量任务清单中每个任务的字段,只有strategy_file、start_date和end_date是必填的
+BATCH_FIELDS = [
+    "name",
+    "strategy_file",
+    "start_date",
+    "end_date",
+    "frequency",
+    "init_cash",
+    "contract",
+    "output_file",
+    "matching_mode",
+    "fill_priority",
+]
+
+DEFAULT_INIT_CASH = 1000000.
+
+# 与bmsUtils.const中MATCHING_MODE和FILL_PRIORITY的取值一致,第一个为默认值,这里不导入以免加载pandas
+MATCHING_MODES = ("immediate", "bar_end")
+FILL_PRIORITIES = ("fifo", "close_first", "open_first")
+
+# 工作进程使用的数据代理
+# fork方式启动时直接继承主进程中已经加载好的行情(写时复制),其他方式在进程初始化时打开
+_worker_data_proxy = None
+
+
+def expand_grid(param_grid):
+    """把参数网格展开成参数字典列表
+
+    :param dict param_grid: 参数名 -> 取值列表
+    :returns: 每个网格点的参数字典
+    :rtype: List[dict]
+    """
+    names = sorted(param_grid)
+    return [dict(zip(names, values)) for values in itertools.product(*[param_grid[name] for name in names])]
+
+
+def get_pool_context():
+    """优先使用fork,这样子进程可以共享主进程中已经加载的行情"""
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return multiprocessing.get_context()
+
+
+def import_backtest_modules():
+    """导入运行回测需要的模块
+    主进程只负责分发任务,不需要这些模块;fork方式下在fork之前导入一次,工作进程直接继承,
+    其他启动方式下由每个工作进程在初始化时导入
+    """
+    from ..bmsData import LocalDataProxy
+    from ..bmsStrategy import StrategyExecutor, VectorizedStrategyExecutor
+    from . import api
+    return LocalDataProxy
+
+
+def open_shared_data_proxy(data_bundle_path, preload=None, bar_bundle=None):
+    """在主进程中打开数据代理并预先加载合约,供之后fork出的工作进程共享
+
+    :param preload: 预先解压的合约,None表示没有bar_bundle时加载数据目录中的所有合约,
+        这样工作进程不需要各自再解压一遍;有bar_bundle时行情已经是共享的内存映射,不需要预先加载
+    """
+    global _worker_data_proxy
+    LocalDataProxy = import_backtest_modules()
+    _worker_data_proxy = LocalDataProxy(data_bundle_path, bar_bundle=bar_bundle)
+    if preload is None:
+        preload = () if bar_bundle is not None else _worker_data_proxy.order_book_ids()
+    for order_book_id in preload:
+        _worker_data_proxy.bar_store[order_book_id]
+    return _worker_data_proxy
+
+
+def _init_worker(data_bundle_path, bar_bundle=None):
+    global _worker_data_proxy
+    if _worker_data_proxy is None:
+        LocalDataProxy = import_backtest_modules()
+        _worker_data_proxy = LocalDataProxy(data_bundle_path, bar_bundle=bar_bundle)
+
+
+def summarize(results_df):
+    """取回测结果最后一次结算的汇总指标,结果写在文件中时只读最后一块"""
+    nan = float("nan")
+    if results_df is None:
+        return {field: nan for field in SUMMARY_FIELDS}
+    from ..bmsStrategy.result_sink import last_result
+
+    last = last_result(results_df)
+    if last is None:
+        return {field: nan for field in SUMMARY_FIELDS}
+    return {field: last.get(field, nan) for field in SUMMARY_FIELDS}
+
+
+def _run_grid_point(job):
+    from .bms_controller import BtsController
+
+    source_code, strategy_file, start_date, end_date, init_cash, frequency, vectorized, params = job
+    row = dict(params)
+    try:
+        results_df = BtsController().run_strategy(source_code, strategy_file, start_date, end_date,
+                                                  init_cash, None, False, frequency,
+                                                  data_proxy=_worker_data_proxy, strategy_params=params,
+                                                  vectorized=vectorized)
+        row.update(summarize(results_df))
+        row["error"] = None
+    except Exception:
+        row.update(summarize(None))
+        row["error"] = traceback.format_exc()
+    return row
+
+
+def run_sweep(strategy_file, param_grid, start_date, end_date, data_bundle_path,
+              init_cash, frequency, processes=None, preload=None, bar_bundle=None, vectorized=False):
+    """在进程池中对参数网格上的每组参数运行回测
+    fork方式下默认在主进程中加载所有合约,见open_shared_data_proxy;
+    指定bar_bundle时各进程只读映射同一个行情文件,不需要在主进程中预先加载;
+    vectorized为True时用策略的signal函数做向量化回测
+
+    :returns: 每行一个网格点,包含参数、最终风险指标和错误信息
+    :rtype: pandas.DataFrame
+    """
+    with codecs.open(strategy_file, encoding="utf-8") as f:
+        source_code = f.read()
+
+    grid = expand_grid(param_grid)
+    jobs = [(source_code, strategy_file, start_date, end_date, init_cash, frequency, vectorized, params)
+            for params in grid]
+
+    ctx = get_pool_context()
+    if ctx.get_start_method() == "fork":
+        open_shared_data_proxy(data_bundle_path, preload, bar_bundle)
+
+    pool = ctx.Pool(processes=processes, initializer=_init_worker, initargs=(data_bundle_path, bar_bundle))
+    try:
+        rows = pool.map(_run_grid_point, jobs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    import pandas as pd
+
+    columns = sorted(param_grid) + SUMMARY_FIELDS + ["error"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def read_manifest(path):
+    """逐行读取批量任务清单,扩展名为.json时为任务字典的列表,否则为带表头的CSV
+
+    :param str path: 清单文件
+    :returns: 任务字典的迭代器
+    """
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            for job in json.load(f):
+                yield job
+        return
+
+    with open(path) as f:
+        for job in csv.DictReader(f):
+            yield job
+
+
+def normalize_job(index, job, output_dir, result_format, matching_mode=MATCHING_MODES[0],
+                  fill_priority=FILL_PRIORITIES[0]):
+    """补全任务的默认值
+
+    :param int index: 任务在清单中的序号
+    :param dict job: 清单中的一行
+    :param str output_dir: 结果文件目录
+    :param str result_format: 结果文件扩展名,如.pkl或.parquet
+    :param str matching_mode: 清单中没有matching_mode的任务的撮合方式
+    :param str fill_priority: 清单中没有fill_priority的任务的成交顺序
+    :returns: 包含BATCH_FIELDS所有字段的任务
+    :rtype: dict
+    """
+    job = {field: (job.get(field) or None) for field in BATCH_FIELDS}
+    for field in ("strategy_file", "start_date", "end_date"):
+        if job[field] is None:
+            raise ValueError("job {0} in manifest has no {1}".format(index, field))
+    if job["name"] is None:
+        job["name"] = "{0:04d}_{1}".format(index, os.path.splitext(os.path.basename(job["strategy_file"]))[0])
+    job["frequency"] = job["frequency"] or "1m"
+    job["init_cash"] = float(job["init_cash"] or DEFAULT_INIT_CASH)
+    if job["output_file"] is None:
+        job["output_file"] = os.path.join(output_dir, job["name"] + result_format)
+    job["matching_mode"] = job["matching_mode"] or matching_mode
+    if job["matching_mode"] not in MATCHING_MODES:
+        raise ValueError("job {0} in manifest has unknown matching_mode {1}".format(index, job["matching_mode"]))
+    job["fill_priority"] = job["fill_priority"] or fill_priority
+    if job["fill_priority"] not in FILL_PRIORITIES:
+        raise ValueError("job {0} in manifest has unknown fill_priority {1}".format(index, job["fill_priority"]))
+    return job
+
+
+def _run_batch_job(job, vectorized):
+    from .bms_controller import BtsController
+
+    row = dict(job)
+    start = time.time()
+    try:
+        # 清单中的contract覆盖策略init中设置的context.contract
+        strategy_params = {"contract": job["contract"]} if job["contract"] else None
+        results_df = BtsController().work(job["strategy_file"], job["start_date"], job["end_date"],
+                                          job["output_file"], False, None, job["init_cash"], False,
+                                          job["frequency"], vectorized=vectorized,
+                                          data_proxy=_worker_data_proxy, strategy_params=strategy_params,
+                                          matching_mode=job["matching_mode"], fill_priority=job["fill_priority"])
+        if not os.path.exists(job["output_file"]):
+            raise RuntimeError("backtest finished without writing {0}".format(job["output_file"]))
+        row.update(summarize(results_df))
+        row["error"] = None
+    except Exception:
+        row.update(summarize(None))
+        row["error"] = traceback.format_exc()
+    row["elapsed"] = time.time() - start
+    return row
+
+
+def run_batch(manifest, data_bundle_path, output_dir, summary_file=None, processes=None, max_pending=None,
+              result_format=".pkl", preload=None, bar_bundle=None, vectorized=False,
+              matching_mode=MATCHING_MODES[0], fill_priority=FILL_PRIORITIES[0]):
+    """在进程池中运行批量任务清单中的每个回测
+    数据目录在每个工作进程中只打开一次(fork方式下在主进程中打开后共享);清单逐行读取,
+    最多有max_pending个任务在排队或运行,每个任务写出自己的结果文件,完成后在汇总CSV中追加一行
+
+    :param str manifest: 任务清单,见read_manifest
+    :param str output_dir: 结果文件目录
+    :param str summary_file: 汇总CSV,默认为output_dir下的summary.csv,已经存在时追加
+    :param int processes: 进程数,默认为CPU核数
+    :param int max_pending: 排队中的任务上限,默认为进程数的两倍
+    :param str result_format: 没有指定output_file的任务的结果文件扩展名
+    :param preload: fork方式下在主进程中预先加载的合约,默认见open_shared_data_proxy
+    :param str matching_mode: 没有指定matching_mode的任务的撮合方式
+    :param str fill_priority: 没有指定fill_priority的任务的成交顺序
+    :returns: (任务数, 失败的任务数),清单中无效的行也计为失败的任务,不影响其他任务
+    :rtype: tuple
+    """
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    if summary_file is None:
+        summary_file = os.path.join(output_dir, "summary.csv")
+    processes = processes or multiprocessing.cpu_count()
+    pending = threading.BoundedSemaphore(max_pending or 2 * processes)
+
+    columns = BATCH_FIELDS + SUMMARY_FIELDS + ["elapsed", "error"]
+    write_header = not os.path.exists(summary_file) or os.path.getsize(summary_file) == 0
+    counts = {"jobs": 0, "failed": 0}
+
+    ctx = get_pool_context()
+    if ctx.get_start_method() == "fork":
+        open_shared_data_proxy(data_bundle_path, preload, bar_bundle)
+
+    with open(summary_file, "a") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        if write_header:
+            writer.writeheader()
+            f.flush()
+
+        # 回调在进程池的结果线程中执行,清单中无效的行在主线程中记录,写汇总文件时加锁
+        lock = threading.Lock()
+
+        def write_row(row):
+            with lock:
+                writer.writerow(row)
+                f.flush()
+                counts["failed"] += row["error"] is not None
+
+        def on_done(row):
+            write_row(row)
+            pending.release()
+
+        def on_error(job):
+            def callback(e):
+                row = dict(job, error=repr(e))
+                on_done(row)
+            return callback
+
+        pool = ctx.Pool(processes=processes, initializer=_init_worker, initargs=(data_bundle_path, bar_bundle))
+        try:
+            for index, job in enumerate(read_manifest(manifest)):
+                counts["jobs"] += 1
+                try:
+                    job = normalize_job(index, job, output_dir, result_format, matching_mode, fill_priority)
+                except ValueError as e:
+                    write_row(dict({field: job.get(field) for field in BATCH_FIELDS}, error=str(e)))
+                    continue
+                pending.acquire()
+                pool.apply_async(_run_batch_job, (job, vectorized), callback=on_done, error_callback=on_error(job))
+        finally:
+            pool.close()
+            pool.join()
+
+    return counts["jobs"], counts["failed"]
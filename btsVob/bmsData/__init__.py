@@ -1,2 +1,4 @@
 from .data_accessor import LocalDataProxy
 from .data_bar import BarMap
+from .bar_store import BarStore
+from .bar_bundle import MappedBarBundle, export_bar_bundle
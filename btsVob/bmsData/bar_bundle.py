@@ -0,0 +1,101 @@
+#coding: utf-8
+
+import json
+import os
+
+import numpy as np
+
+from .bar_store import BAR_FIELDS, ContractBars
+
+BUNDLE_VERSION = 1
+INDEX_SUFFIX = ".index"
+
+
+def bundle_index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def export_bar_bundle(data_source, order_book_ids, path):
+    """把合约行情解压后导出成一个内存映射文件,供多个进程只读共享
+
+    文件按列连续存放: 先是所有合约拼接的int64 time列,再依次是各个float64字段列;
+    每个合约在各列中占用相同的[start, end)区间,记录在path + '.index'的JSON索引中。
+    放在/dev/shm下即相当于一段共享内存。
+    合约逐个从数据源解压、写入映射文件后即释放,不进入BarStore的缓存,内存占用只有一个合约。
+
+    :param LocalDataSource data_source: 数据源
+    :param order_book_ids: 需要导出的合约
+    :param str path: 输出文件路径
+    :returns: 合约 -> (start, end)
+    :rtype: dict
+    """
+    contracts = {}
+    total = 0
+    for order_book_id in order_book_ids:
+        start, end = data_source.bar_range(order_book_id)
+        n = end - start
+        contracts[order_book_id] = (total, total + n)
+        total += n
+
+    tmp_path = path + ".tmp"
+    time = np.memmap(tmp_path, dtype=np.int64, mode="w+", shape=(max(total, 1),))
+    columns = np.memmap(tmp_path, dtype=np.float64, mode="r+", offset=time.nbytes,
+                        shape=(len(BAR_FIELDS), max(total, 1))) if total else None
+    for order_book_id, (start, end) in contracts.items():
+        bars = ContractBars.from_records(order_book_id, data_source.get_all_bars(order_book_id))
+        time[start:end] = bars.time
+        for i, field in enumerate(BAR_FIELDS):
+            columns[i, start:end] = bars.column(field)
+        del bars
+    time.flush()
+    if columns is not None:
+        columns.flush()
+    del time, columns
+
+    index = {
+        "version": BUNDLE_VERSION,
+        "rows": total,
+        "fields": list(BAR_FIELDS),
+        "contracts": {k: list(v) for k, v in contracts.items()},
+    }
+    with open(bundle_index_path(tmp_path), "w") as f:
+        json.dump(index, f)
+    os.rename(tmp_path, path)
+    os.rename(bundle_index_path(tmp_path), bundle_index_path(path))
+    return contracts
+
+
+class MappedBarBundle(object):
+    """以只读内存映射方式打开export_bar_bundle导出的行情文件
+    任意多个进程打开同一个文件时共享操作系统的页缓存,合约数据是映射区上的视图,不做拷贝
+    """
+
+    def __init__(self, path):
+        with open(bundle_index_path(path)) as f:
+            index = json.load(f)
+        if index.get("version") != BUNDLE_VERSION or tuple(index["fields"]) != BAR_FIELDS:
+            raise RuntimeError("Incompatible bar bundle {}".format(path))
+
+        self._path = path
+        self._contracts = index["contracts"]
+        rows = max(index["rows"], 1)
+        self._time = np.memmap(path, dtype=np.int64, mode="r", shape=(rows,))
+        self._columns = np.memmap(path, dtype=np.float64, mode="r", offset=self._time.nbytes,
+                                  shape=(len(BAR_FIELDS), rows)) if index["rows"] else None
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._contracts
+
+    def __getitem__(self, order_book_id):
+        start, end = self._contracts[order_book_id]
+        columns = {field: self._columns[i, start:end] for i, field in enumerate(BAR_FIELDS)}
+        return ContractBars(order_book_id, self._time[start:end], **columns)
+
+    def order_book_ids(self):
+        return list(self._contracts)
+
+    def __len__(self):
+        return len(self._contracts)
+
+    def __repr__(self):
+        return "MappedBarBundle({0}, {1} contracts)".format(self._path, len(self))
@@ -0,0 +1,107 @@
+#coding: utf-8
+
+from .bar_store import to_epoch_minute
+from .data_bar import BarObject
+
+# 游标一次最多逐条前进的步数,超过后改为在剩余区间上二分查找
+MAX_LINEAR_STEPS = 8
+
+
+class BarCursor(object):
+    """单个合约的前向游标
+    模拟时钟只会向前走,因此游标从上次的位置继续向前推进,
+    每个bar的访问均摊为常数时间,而不需要每次在整段历史上searchsorted
+    """
+    __slots__ = ("_bars", "_instrument", "_pos", "_minute", "_bar")
+
+    def __init__(self, bars, instrument):
+        self._bars = bars
+        self._instrument = instrument
+        self._pos = 0
+        self._minute = None
+        self._bar = None
+
+    def seek(self, minute):
+        """把游标移动到第一个时间不早于minute的bar,语义与ContractBars.locate一致"""
+        if minute == self._minute:
+            return self._pos
+
+        time = self._bars.time
+        pos = self._pos
+        if self._minute is None or minute < self._minute:
+            # 首次定位或者时钟回退时直接二分查找
+            pos = int(time.searchsorted(minute))
+        else:
+            n = len(time)
+            steps = 0
+            while pos < n and time[pos] < minute:
+                pos += 1
+                steps += 1
+                if steps == MAX_LINEAR_STEPS:
+                    pos += int(time[pos:].searchsorted(minute))
+                    break
+
+        if pos != self._pos:
+            self._bar = None
+        self._pos = pos
+        self._minute = minute
+        return pos
+
+    def bar(self, minute):
+        pos = self.seek(minute)
+        if self._bar is None:
+            if pos >= len(self._bars):
+                raise IndexError("no bar of {} at or after minute {}".format(self._bars.order_book_id, minute))
+            self._bar = BarObject(self._instrument, self._bars, pos)
+        return self._bar
+
+    @property
+    def position(self):
+        return self._pos
+
+    def __repr__(self):
+        return "BarCursor({0}, pos={1})".format(self._bars.order_book_id, self._pos)
+
+
+class BarCursors(object):
+    """订阅合约的游标集合,由事件源随交易日历推进时钟
+    游标在被访问时才追赶到当前时钟,没有被访问的合约不产生开销
+    """
+
+    def __init__(self, bar_store, instruments):
+        """
+        :param BarStore bar_store: 列式行情存储
+        :param instruments: 根据order_book_id获取Instrument的函数
+        """
+        self._bar_store = bar_store
+        self._instruments = instruments
+        self._cursors = {}
+        self.dt = None
+        self.minute = None
+
+    def advance(self, dt):
+        """事件源推进时钟"""
+        self.dt = dt
+        self.minute = to_epoch_minute(dt)
+
+    def cursor(self, order_book_id):
+        try:
+            return self._cursors[order_book_id]
+        except KeyError:
+            cursor = BarCursor(self._bar_store[order_book_id], self._instruments(order_book_id))
+            self._cursors[order_book_id] = cursor
+            return cursor
+
+    def bar(self, order_book_id):
+        """当前时钟下合约的bar"""
+        return self.cursor(order_book_id).bar(self.minute)
+
+    def position(self, order_book_id):
+        """当前时钟下合约bar在列式数据中的下标"""
+        return self.cursor(order_book_id).seek(self.minute)
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._cursors
+
+    def __repr__(self):
+        return "BarCursors(dt={0}, {1})".format(self.dt, sorted(self._cursors))
@@ -0,0 +1,152 @@
+#coding: utf-8
+
+import datetime
+
+import numpy as np
+import pandas as pd
+from six import string_types
+
+EPOCH = datetime.datetime(1970, 1, 1)
+BAR_FIELDS = ("open", "high", "low", "close", "volume", "oi")
+
+
+def to_epoch_minute(dt):
+    """把时间转换成自1970年以来的分钟数,作为列式存储的整数时间索引
+
+    :param dt: datetime.datetime, pandas.Timestamp or str
+    :returns: epoch minute
+    :rtype: int
+    """
+    if isinstance(dt, string_types):
+        dt = pd.Timestamp(dt)
+    delta = dt - EPOCH
+    return delta.days * 1440 + delta.seconds // 60
+
+
+def readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+def parse_time_column(times):
+    """把bcolz中'%Y-%m-%d %H:%M:%S'格式的时间列一次性向量化转换成epoch分钟数"""
+    minutes = pd.to_datetime(np.asarray(times)).values.astype("datetime64[m]")
+    return minutes.astype(np.int64)
+
+
+class ContractBars(object):
+    """单个合约的列式行情数据
+    OHLCV/oi为float64数组,time为int64的epoch分钟索引,构建一次后只读
+    """
+    __slots__ = ("order_book_id", "time") + BAR_FIELDS
+
+    def __init__(self, order_book_id, time, **columns):
+        self.order_book_id = order_book_id
+        self.time = time
+        for field in BAR_FIELDS:
+            setattr(self, field, columns[field])
+
+    @classmethod
+    def from_records(cls, order_book_id, bars):
+        """从LocalDataSource.get_all_bars返回的结构化数组构建"""
+        columns = {field: readonly(np.array(bars[field], dtype=np.float64)) for field in BAR_FIELDS}
+        return cls(order_book_id, readonly(parse_time_column(bars["time"])), **columns)
+
+    def __len__(self):
+        return len(self.time)
+
+    def locate(self, minute):
+        """返回第一个时间不早于minute的bar的下标,与原先searchsorted(bar_str)的语义一致"""
+        return int(self.time.searchsorted(minute))
+
+    def column(self, field):
+        return getattr(self, field)
+
+    def datetime_index(self, left, right):
+        """按需构建[left, right)区间的DatetimeIndex"""
+        return pd.DatetimeIndex(self.time[left:right].astype("datetime64[m]").astype("datetime64[ns]"))
+
+    def window(self, field, end, bar_count):
+        """返回以end(含)结尾、最多bar_count根bar的只读视图,不拷贝数据"""
+        left = end - bar_count + 1 if end >= bar_count else 0
+        window = self.column(field)[left:end + 1].view(HistoryWindow)
+        window._source = (self, left, end + 1)
+        return window
+
+    def traded(self):
+        """过滤掉没有成交量的bar,供last使用"""
+        mask = self.volume > 0
+        columns = {field: readonly(self.column(field)[mask]) for field in BAR_FIELDS}
+        return ContractBars(self.order_book_id, readonly(self.time[mask]), **columns)
+
+    def __repr__(self):
+        return "ContractBars({0}, {1} bars)".format(self.order_book_id, len(self))
+
+
+class HistoryWindow(np.ndarray):
+    """history快速模式返回的只读视图
+    与普通ndarray用法相同,额外提供按需构建的index属性;
+    对视图再做运算或切片得到的结果不再关联时间索引
+    """
+
+    def __array_finalize__(self, obj):
+        self._source = None
+
+    @property
+    def index(self):
+        """按需构建的DatetimeIndex,没有关联行情时返回None"""
+        if self._source is None:
+            return None
+        bars, left, right = self._source
+        return bars.datetime_index(left, right)
+
+    @property
+    def values(self):
+        return self.view(np.ndarray)
+
+    def to_series(self):
+        return pd.Series(self.view(np.ndarray), index=self.index)
+
+
+class BarStore(object):
+    """按order_book_id索引的列式行情存储,每个合约只从数据源读取并转换一次
+    指定了内存映射的行情文件时,文件中有的合约直接使用映射区上的视图
+    """
+
+    def __init__(self, data_source, bundle=None):
+        """
+        :param LocalDataSource data_source: 数据源
+        :param MappedBarBundle bundle: 可选的共享行情文件
+        """
+        self._data_source = data_source
+        self._bundle = bundle
+        self._bars = {}
+        self._traded_bars = {}
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._bars[order_book_id]
+        except KeyError:
+            if self._bundle is not None and order_book_id in self._bundle:
+                bars = self._bundle[order_book_id]
+            else:
+                bars = ContractBars.from_records(order_book_id, self._data_source.get_all_bars(order_book_id))
+            self._bars[order_book_id] = bars
+            return bars
+
+    def traded(self, order_book_id):
+        try:
+            return self._traded_bars[order_book_id]
+        except KeyError:
+            bars = self[order_book_id].traded()
+            self._traded_bars[order_book_id] = bars
+            return bars
+
+    def __contains__(self, order_book_id):
+        return order_book_id in self._bars
+
+    def __len__(self):
+        return len(self._bars)
+
+    def __repr__(self):
+        return "BarStore({0})".format(sorted(self._bars))
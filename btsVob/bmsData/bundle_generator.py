@@ -0,0 +1,291 @@
+#coding: utf-8
+"""随机游走行情生成器,写出与LocalDataSource格式相同的数据目录,用于压力测试和性能分析
+
+    python -m btsVob.bmsData.bundle_generator /tmp/bundle --contracts 2000 --days 2500 --seed 1
+
+数据目录包含daily.bcolz(attrs中记录每个合约的行区间)、trading_dates.bcolz、instruments.pk,
+以及生成的合约品种对应的commission.json。相同的参数和seed总是生成相同的数据。
+"""
+
+import argparse
+import collections
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from ..bmsUtils.const import SETTLEMENT_WINDOWS
+from ..bmsUtils.settlement import parse_session_time
+from .bundle_index import compile_bundle
+from .data_source import LocalDataSource
+
+Product = collections.namedtuple("Product", ["prefix", "price", "tick_size", "multiplier",
+                                             "margin_rate", "fee", "night_close"])
+
+# 生成合约时依次轮换的品种, night_close为None表示没有夜盘
+PRODUCTS = (
+    Product("rb", 3000., 1., 10, 0.13, "0.012%", "23:00"),
+    Product("hc", 3000., 1., 10, 0.13, "0.012%", "23:00"),
+    Product("cu", 45000., 10., 5, 0.10, "0.006%", "01:00"),
+    Product("al", 13000., 5., 5, 0.10, "3.6", "01:00"),
+    Product("zn", 18000., 5., 5, 0.10, "3.6", "01:00"),
+    Product("ni", 80000., 10., 1, 0.10, "7.2", "01:00"),
+    Product("ag", 4000., 1., 15, 0.12, "0.006%", "02:30"),
+    Product("au", 280., 0.05, 1000, 0.10, "10", "02:30"),
+    Product("i", 500., 0.5, 100, 0.10, "0.0072%", "23:30"),
+    Product("j", 1200., 0.5, 100, 0.10, "0.0072%", "23:30"),
+    Product("m", 2800., 1., 10, 0.07, "1.8", "23:30"),
+    Product("y", 6000., 2., 10, 0.07, "3", "23:30"),
+    Product("p", 5000., 2., 10, 0.07, "3", "23:30"),
+    Product("c", 1600., 1., 10, 0.07, "1.44", None),
+    Product("jd", 3800., 1., 10, 0.08, "0.02%", None),
+    Product("l", 9000., 5., 5, 0.07, "0.0072%", None),
+    Product("pp", 8000., 1., 5, 0.07, "0.0072%", None),
+    Product("SR", 5500., 1., 10, 0.07, "3.6", "23:30"),
+    Product("CF", 14000., 5., 5, 0.07, "7.2", "23:30"),
+    Product("TA", 5000., 2., 5, 0.07, "3.6", "23:30"),
+    Product("MA", 2000., 1., 10, 0.07, "3.6", "23:30"),
+    Product("FG", 1200., 1., 20, 0.07, "3.6", "23:30"),
+)
+PRODUCT_MAP = {product.prefix: product for product in PRODUCTS}
+
+DAY_SESSIONS = (("09:00", "10:15"), ("10:30", "11:30"), ("13:30", "15:00"))
+NIGHT_OPEN = "21:00"
+# 结算时间点取各结算窗口的开始时间
+DAY_SETTLEMENT = SETTLEMENT_WINDOWS["day"][0]
+NIGHT_SETTLEMENT = SETTLEMENT_WINDOWS["night"][0]
+
+# 每分钟对数收益率的标准差
+MINUTE_VOLATILITY = 0.0008
+# 合约到期日为到期月份的这一天(遇到非交易日顺延)
+EXPIRY_DAY = 15
+
+FIELDS = ("time", "open", "high", "low", "close", "volume", "oi")
+
+
+def _night_close_offset(night_close):
+    """夜盘收盘时间相对于当天零点的分钟数,跨越零点时大于1440"""
+    offset = parse_session_time(night_close)
+    if offset <= parse_session_time(NIGHT_OPEN):
+        offset += 1440
+    return offset
+
+
+class SyntheticCalendar(object):
+    """合成的分钟交易日历
+    每个交易日依次为日盘、日盘结算点,除最后一个交易日外还有夜盘和第二天凌晨的夜盘结算点;
+    夜盘的长度取所有品种中收盘最晚的一个,各品种按自己的收盘时间截取
+    """
+
+    def __init__(self, start_date, days, night_close=None):
+        """
+        :param start_date: 第一个交易日
+        :param int days: 交易日个数(工作日)
+        :param str night_close: 夜盘收盘时间,None表示没有夜盘
+        """
+        self.dates = pd.bdate_range(start_date, periods=days)
+
+        day = [np.arange(parse_session_time(start), parse_session_time(end)) for start, end in DAY_SESSIONS]
+        day.append([parse_session_time(DAY_SETTLEMENT)])
+        day = np.concatenate(day)
+        night = np.array([], dtype=np.int64)
+        if night_close is not None:
+            night = np.append(np.arange(parse_session_time(NIGHT_OPEN), _night_close_offset(night_close)),
+                              1440 + parse_session_time(NIGHT_SETTLEMENT))
+
+        full_day = np.concatenate([day, night])
+        last_day = day
+        block = len(full_day)
+        midnights = self.dates.values.astype("datetime64[m]").astype(np.int64)
+
+        # offset为相对于交易日零点的分钟数,用来按品种截取夜盘
+        self.offset = np.concatenate([np.tile(full_day, days - 1), last_day]) if days else full_day[:0]
+        self.minutes = np.repeat(midnights, block)[:len(self.offset)] + self.offset
+        self.night_trading = (self.offset >= parse_session_time(NIGHT_OPEN)) & (self.offset < 1440)
+        # 第i个交易日在日历中占用[day_bounds[i], day_bounds[i + 1])
+        self.day_bounds = np.minimum(np.arange(days + 1) * block, len(self.minutes))
+
+    def __len__(self):
+        return len(self.minutes)
+
+    def product_mask(self, product, night=True):
+        """品种有行情的时间点,结算点总是包含在内"""
+        if not night or product.night_close is None:
+            return ~self.night_trading
+        return ~self.night_trading | (self.offset < _night_close_offset(product.night_close))
+
+    def time_strings(self, positions=None):
+        """'%Y-%m-%d %H:%M:%S'格式的时间列"""
+        minutes = self.minutes if positions is None else self.minutes[positions]
+        times = np.datetime_as_string(minutes.astype("datetime64[m]"), unit="s")
+        return np.char.replace(times, "T", " ").astype("U19")
+
+    def expiry_index(self, year, month):
+        """到期月份EXPIRY_DAY及以后的第一个交易日在dates中的下标,超出日历时为最后一个交易日"""
+        expiry = pd.Timestamp(year=year, month=month, day=EXPIRY_DAY)
+        return min(int(self.dates.searchsorted(expiry)), len(self.dates) - 1)
+
+
+def contract_ids(products, contracts, start_date):
+    """按品种轮换、到期月份递增生成合约代码,如rb1601, hc1601, ..., rb1602
+
+    :returns: (order_book_id, product, 到期年, 到期月)的列表
+    """
+    start = pd.Timestamp(start_date)
+    result = []
+    for i in range(contracts):
+        product = products[i % len(products)]
+        months = start.month - 1 + i // len(products)
+        year, month = start.year + months // 12, months % 12 + 1
+        result.append(("{0}{1:02d}{2:02d}".format(product.prefix, year % 100, month), product, year, month))
+    return result
+
+
+def random_walk_bars(rng, product, settlement):
+    """几何随机游走的分钟线,结算点的价格保持不变、成交量为0
+
+    :param numpy.random.RandomState rng: 随机数发生器
+    :param Product product: 品种
+    :param numpy.ndarray settlement: 每个时间点是否为结算点
+    :returns: 字段 -> 数组
+    :rtype: dict
+    """
+    n = len(settlement)
+    tick = product.tick_size
+    returns = rng.standard_normal(n) * MINUTE_VOLATILITY
+    returns[settlement] = 0.
+    close = product.price * np.exp(np.cumsum(returns))
+    close = np.maximum(np.round(close / tick) * tick, tick)
+
+    open_ = np.empty(n)
+    open_[:1] = close[:1]
+    open_[1:] = close[:-1]
+    wick = np.abs(rng.standard_normal(n)) * close * MINUTE_VOLATILITY
+    wick[settlement] = 0.
+    high = np.ceil((np.maximum(open_, close) + wick) / tick) * tick
+    low = np.maximum(np.floor((np.minimum(open_, close) - wick) / tick) * tick, tick)
+
+    volume = rng.poisson(50, n).astype(np.float64)
+    volume[settlement] = 0.
+    oi = np.maximum(10000. + np.cumsum(rng.randint(-20, 21, n)), 0.)
+    return {"open": open_, "high": high, "low": low, "close": close, "volume": volume, "oi": oi}
+
+
+def generate_bundle(root_dir, contracts=100, days=250, start_date="2016-01-04", seed=0,
+                    products=None, night=True, lifetime=None, compile_index=False):
+    """生成随机游走的数据目录
+
+    :param str root_dir: 输出目录,已有的数据文件会被覆盖
+    :param int contracts: 合约个数
+    :param int days: 交易日个数
+    :param start_date: 第一个交易日
+    :param int seed: 随机数种子,每个合约的行情只由seed和合约序号决定
+    :param products: 品种前缀列表,默认使用PRODUCTS中的所有品种
+    :param bool night: 是否生成夜盘
+    :param int lifetime: 合约上市的交易日数,合约在到期日前lifetime个交易日内有行情;None表示覆盖整个日历
+    :param bool compile_index: 是否同时编译bundle.index
+    :returns: 合约列表
+    :rtype: List[str]
+    """
+    import bcolz
+
+    if products is None:
+        products = PRODUCTS
+    else:
+        try:
+            products = [PRODUCT_MAP[prefix] for prefix in products]
+        except KeyError as e:
+            raise ValueError("Unknown product {}".format(e))
+
+    night_closes = [p.night_close for p in products if p.night_close is not None] if night else []
+    calendar = SyntheticCalendar(start_date, days, max(night_closes, key=_night_close_offset) if night_closes else None)
+    settlement = ((calendar.offset == parse_session_time(DAY_SETTLEMENT)) |
+                  (calendar.offset == 1440 + parse_session_time(NIGHT_SETTLEMENT)))
+
+    if not os.path.exists(root_dir):
+        os.makedirs(root_dir)
+
+    table = None
+    ranges = {}
+    instruments = []
+    total = 0
+    for i, (order_book_id, product, year, month) in enumerate(contract_ids(products, contracts, start_date)):
+        expiry = calendar.expiry_index(year, month)
+        if lifetime is None:
+            first_day, last_day = 0, len(calendar.dates) - 1
+        else:
+            first_day, last_day = max(0, expiry - lifetime + 1), expiry
+        left, right = calendar.day_bounds[first_day], calendar.day_bounds[last_day + 1]
+        positions = left + np.flatnonzero(calendar.product_mask(product, night)[left:right])
+
+        rng = np.random.RandomState([seed, i])
+        bars = random_walk_bars(rng, product, settlement[positions])
+        bars["time"] = calendar.time_strings(positions)
+        columns = [bars[name] for name in FIELDS]
+        if table is None:
+            table = bcolz.ctable(columns, names=list(FIELDS),
+                                 rootdir=os.path.join(root_dir, LocalDataSource.DAILY), mode="w")
+        else:
+            table.append(columns)
+        ranges[order_book_id] = [total, total + len(positions)]
+        total += len(positions)
+
+        instruments.append({
+            "order_book_id": order_book_id,
+            "symbol": order_book_id,
+            "underlying_symbol": product.prefix,
+            "type": "Future",
+            "margin_rate": product.margin_rate,
+            "contract_multiplier": float(product.multiplier),
+            "tick_size": product.tick_size,
+            "listed_date": calendar.dates[first_day].strftime("%Y-%m-%d"),
+            "de_listed_date": calendar.dates[expiry].strftime("%Y-%m-%d"),
+        })
+
+    if table is not None:
+        for order_book_id, bar_range in ranges.items():
+            table.attrs[order_book_id] = bar_range
+        table.flush()
+
+    bcolz.carray(calendar.time_strings(), rootdir=os.path.join(root_dir, LocalDataSource.TRADING_DATES),
+                 mode="w").flush()
+
+    with open(os.path.join(root_dir, LocalDataSource.INSTRUMENTS), "wb") as f:
+        pickle.dump(instruments, f, protocol=2)
+
+    commission_info = {p.prefix: {"oc": p.fee, "ctoday": p.fee, "multiplier": str(p.multiplier),
+                                  "premium": str(p.margin_rate)}
+                       for p in set(products)}
+    with open(os.path.join(root_dir, LocalDataSource.COMMISSION), "w") as f:
+        json.dump(commission_info, f, indent=4, sort_keys=True)
+
+    if compile_index:
+        compile_bundle(root_dir)
+    return [d["order_book_id"] for d in instruments]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m btsVob.bmsData.bundle_generator",
+                                     description="generate a random walk data bundle")
+    parser.add_argument("root_dir")
+    parser.add_argument("--contracts", type=int, default=100)
+    parser.add_argument("--days", type=int, default=250)
+    parser.add_argument("--start-date", default="2016-01-04")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--products", default=None, help="comma separated product prefixes, default all")
+    parser.add_argument("--no-night", dest="night", action="store_false", help="day sessions only")
+    parser.add_argument("--lifetime", type=int, default=None,
+                        help="trading days each contract is listed before expiry, default the whole calendar")
+    parser.add_argument("--compile-index", action="store_true", help="also compile bundle.index")
+    args = parser.parse_args(argv)
+
+    products = args.products.split(",") if args.products else None
+    order_book_ids = generate_bundle(args.root_dir, args.contracts, args.days, args.start_date, args.seed,
+                                     products, args.night, args.lifetime, args.compile_index)
+    print("{0} contracts written to {1}".format(len(order_book_ids), args.root_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#coding: utf-8
+
+import json
+import os
+import pickle
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+from .instruments import Instrument
+
+BUNDLE_INDEX = "bundle.index"
+MAGIC = b"BTSIDX01"
+ALIGNMENT = 8
+
+# 数据目录中决定索引是否过期的文件
+SOURCE_FILES = ("daily.bcolz", os.path.join("daily.bcolz", "__attrs__"), "trading_dates.bcolz", "instruments.pk")
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def is_index_fresh(root_dir):
+    """索引存在并且比数据目录中的源文件都新"""
+    index_path = os.path.join(root_dir, BUNDLE_INDEX)
+    if not os.path.exists(index_path):
+        return False
+    index_mtime = os.path.getmtime(index_path)
+    for name in SOURCE_FILES:
+        path = os.path.join(root_dir, name)
+        if os.path.exists(path) and os.path.getmtime(path) > index_mtime:
+            return False
+    return True
+
+
+def compile_bundle(root_dir):
+    """编译数据目录的二进制索引
+    包含合约到daily.bcolz行区间的映射、int64的交易日历以及逐个序列化的合约信息,
+    打开索引只需要内存映射,不随合约数目增长
+
+    :param str root_dir: 数据目录
+    :returns: 索引文件路径
+    :rtype: str
+    """
+    import bcolz
+
+    daily_table = bcolz.open(os.path.join(root_dir, "daily.bcolz"))
+    ranges = {k: v for k, v in daily_table.attrs.attrs.items()
+              if isinstance(v, (list, tuple)) and len(v) == 2}
+    trading_dates = pd.DatetimeIndex([pd.Timestamp(d) for d in
+                                      bcolz.open(os.path.join(root_dir, "trading_dates.bcolz"))])
+    with open(os.path.join(root_dir, "instruments.pk"), "rb") as f:
+        instruments = {d["order_book_id"]: d for d in pickle.load(f)}
+
+    ids = sorted(set(ranges) | set(instruments))
+    encoded = [order_book_id.encode("utf-8") for order_book_id in ids]
+    id_width = max([len(e) for e in encoded] + [1])
+
+    sections = [
+        ("ids", np.array(encoded, dtype="S{}".format(id_width))),
+        ("ranges", np.array([ranges.get(order_book_id, (-1, -1)) for order_book_id in ids],
+                            dtype=np.int64).reshape(len(ids), 2)),
+        ("trading_dates", trading_dates.values.astype("datetime64[ns]").view(np.int64)),
+    ]
+    blobs = [pickle.dumps(instruments[order_book_id], protocol=2) if order_book_id in instruments else b""
+             for order_book_id in ids]
+    offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in blobs])
+    sections.append(("instrument_offsets", offsets))
+    sections.append(("instrument_heap", np.frombuffer(b"".join(blobs) or b"\0", dtype=np.uint8)))
+
+    # 各段的偏移相对于头部之后的数据区起点
+    layout = {}
+    offset = 0
+    for name, array in sections:
+        layout[name] = [offset, array.dtype.str, list(array.shape)]
+        offset = _align(offset + array.nbytes)
+    header_bytes = json.dumps({"count": len(ids), "sections": layout}, sort_keys=True).encode("utf-8")
+    data_start = _align(len(MAGIC) + 8 + len(header_bytes))
+
+    path = os.path.join(root_dir, BUNDLE_INDEX)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in sections:
+            f.seek(data_start + layout[name][0])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.rename(tmp_path, path)
+    return path
+
+
+class IndexedInstruments(Mapping):
+    """按需从索引中反序列化单个合约信息"""
+
+    def __init__(self, index):
+        self._index = index
+        self._cache = {}
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._cache[order_book_id]
+        except KeyError:
+            instrument = self._cache[order_book_id] = Instrument(self._index.instrument_dict(order_book_id))
+            return instrument
+
+    def __contains__(self, order_book_id):
+        i = self._index.find(order_book_id)
+        return i is not None and self._index.has_instrument(i)
+
+    def __iter__(self):
+        index = self._index
+        return (index.order_book_id(i) for i in range(len(index)) if index.has_instrument(i))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+class BundleIndex(object):
+    """以内存映射方式打开compile_bundle生成的索引"""
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise RuntimeError("Invalid bundle index {}".format(path))
+            header_len, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_len).decode("utf-8"))
+        data_start = _align(len(MAGIC) + 8 + header_len)
+
+        self._path = path
+        self._count = header["count"]
+        sections = {}
+        for name, (offset, dtype, shape) in header["sections"].items():
+            if int(np.prod(shape)) == 0:
+                sections[name] = np.empty(shape, dtype=dtype)
+            else:
+                sections[name] = np.memmap(path, dtype=dtype, mode="r", offset=data_start + offset,
+                                           shape=tuple(shape))
+        self._ids = sections["ids"]
+        self._ranges = sections["ranges"]
+        self._trading_dates = sections["trading_dates"]
+        self._instrument_offsets = sections["instrument_offsets"]
+        self._instrument_heap = sections["instrument_heap"]
+        self.instruments = IndexedInstruments(self)
+
+    def __len__(self):
+        return self._count
+
+    def find(self, order_book_id):
+        """二分查找合约在索引中的位置,不存在时返回None"""
+        key = order_book_id.encode("utf-8")
+        if len(key) > self._ids.dtype.itemsize:
+            return None
+        i = int(self._ids.searchsorted(key))
+        if i < self._count and self._ids[i] == key:
+            return i
+        return None
+
+    def order_book_id(self, i):
+        return self._ids[i].decode("utf-8")
+
+    def bar_range(self, order_book_id):
+        i = self.find(order_book_id)
+        if i is None or self._ranges[i, 0] < 0:
+            raise KeyError(order_book_id)
+        return int(self._ranges[i, 0]), int(self._ranges[i, 1])
+
+    def order_book_ids(self):
+        """有行情数据的合约"""
+        return [self.order_book_id(i) for i in np.flatnonzero(self._ranges[:, 0] >= 0)]
+
+    def has_instrument(self, i):
+        return self._instrument_offsets[i + 1] > self._instrument_offsets[i]
+
+    def instrument_dict(self, order_book_id):
+        i = self.find(order_book_id)
+        if i is None or not self.has_instrument(i):
+            raise KeyError(order_book_id)
+        start, end = self._instrument_offsets[i], self._instrument_offsets[i + 1]
+        return pickle.loads(self._instrument_heap[start:end].tobytes())
+
+    def trading_dates(self):
+        return pd.DatetimeIndex(np.asarray(self._trading_dates).view("datetime64[ns]"))
+
+    def __repr__(self):
+        return "BundleIndex({0}, {1} contracts)".format(self._path, self._count)
+
+
+if __name__ == "__main__":
+    print(compile_bundle(sys.argv[1]))
@@ -1,13 +1,15 @@
 #coding: utf-8
 import abc
-import datetime
 import pandas as pd
 import numpy as np
-from six import with_metaclass, string_types
+from six import with_metaclass
 
 from .data_bar import BarObject
 from ..bmsUtils.context import ExecutionContext
 from .data_source import LocalDataSource
+from .bar_store import BarStore, to_epoch_minute
+from .bar_cursor import BarCursors
+from .bar_bundle import MappedBarBundle, export_bar_bundle
 
 class DataProxy(with_metaclass(abc.ABCMeta)):
     @abc.abstractmethod
@@ -74,59 +76,79 @@ class DataProxy(with_metaclass(abc.ABCMeta)):
         """
         raise NotImplementedError
 
+    def commission_info(self):
+        """数据自带的手续费配置,格式与commission.json相同,覆盖默认配置中的同名品种"""
+        return {}
+
 
 class LocalDataProxy(DataProxy):
 
-    def __init__(self, root_dir):
+    def __init__(self, root_dir, bar_bundle=None):
+        """
+        :param str root_dir: 数据目录
+        :param str bar_bundle: 可选,export_bar_bundle导出的共享行情文件
+        """
         self._data_source = LocalDataSource(root_dir)
-        self._cache = {}
-        self._origin_cache = {}
+        bundle = MappedBarBundle(bar_bundle) if bar_bundle is not None else None
+        self._bar_store = BarStore(self._data_source, bundle)
+        self._cursors = BarCursors(self._bar_store, self._data_source.instruments)
         self._dividend_cache = {}
 
-    def get_bar(self, order_book_id, dt):
-        try:
-            bars = self._cache[order_book_id]
-        except KeyError:
-            bars = self._data_source.get_all_bars(order_book_id)
-            self._cache[order_book_id] = bars
+    @property
+    def bar_store(self):
+        return self._bar_store
 
-        if isinstance(dt, string_types):
-            dt = pd.Timestamp(dt)
+    @property
+    def cursors(self):
+        """由事件源推进的前向游标"""
+        return self._cursors
 
+    def get_bar(self, order_book_id, dt):
+        cursors = self._cursors
+        if dt is cursors.dt:
+            return cursors.bar(order_book_id)
+
+        bars = self._bar_store[order_book_id]
         instrument = self._data_source.instruments(order_book_id)
-        bar_str = dt.strftime('%Y-%m-%d %H:%M:%S')
-        return BarObject(instrument, bars[bars["time"].searchsorted(bar_str)])
+        return BarObject(instrument, bars, bars.locate(to_epoch_minute(dt)))
 
     def history(self, order_book_id, dt, bar_count, frequency, field):
-        try:
-            bars = self._cache[order_book_id]
-        except KeyError:
-            bars = self._data_source.get_all_bars(order_book_id)
-            self._cache[order_book_id] = bars
-        bar_str = dt.strftime('%Y-%m-%d %H:%M:%S')
-        i = bars['time'].searchsorted(bar_str)
+        bars = self._bar_store[order_book_id]
+        i = bars.locate(to_epoch_minute(dt))
         left = i - bar_count + 1 if i >= bar_count else 0
-        bars = bars[left:i + 1]
-        series = pd.Series(bars[field], index=[datetime.datetime.strptime(t, '%Y-%m-%d %H:%M:%S') for t in bars["time"]])
-        return series
+        return pd.Series(bars.column(field)[left:i + 1], index=bars.datetime_index(left, i + 1))
+
+    def history_array(self, order_book_id, dt, bar_count, frequency, field):
+        """history的快速模式,返回列式数据上的只读视图(HistoryWindow),index按需构建"""
+        bars = self._bar_store[order_book_id]
+        cursors = self._cursors
+        if dt is cursors.dt:
+            i = cursors.position(order_book_id)
+        else:
+            i = bars.locate(to_epoch_minute(dt))
+        return bars.window(field, i, bar_count)
 
     def last(self, order_book_id, dt, bar_count, frequency, field):
-        try:
-            bars = self._origin_cache[order_book_id]
-        except KeyError:
-            bars = self._data_source.get_all_bars(order_book_id)
-            bars = bars[bars["volume"] > 0]
-            self._origin_cache[order_book_id] = bars
-
-        bar_str = dt.strftime('%Y-%d-%m %H:%M:%S')
-        i = bars["time"].searchsorted(bar_str)
+        bars = self._bar_store.traded(order_book_id)
+        i = bars.locate(to_epoch_minute(dt))
         left = i - bar_count + 1 if i >= bar_count else 0
-        hist = bars[left:i + 1][field]
+        return bars.column(field)[left:i + 1]
 
-        return hist
+    def order_book_ids(self):
+        """数据目录中的所有合约"""
+        return self._data_source.order_book_ids()
+
+    def export_bar_bundle(self, path, order_book_ids=None):
+        """把合约行情解压后导出成共享的内存映射文件,默认导出数据目录中的所有合约"""
+        if order_book_ids is None:
+            order_book_ids = self._data_source.order_book_ids()
+        return export_bar_bundle(self._data_source, order_book_ids, path)
 
     def get_trading_dates(self, start_date, end_date):
         return self._data_source.get_trading_dates(start_date, end_date)
 
     def instrument(self, order_book_id):
         return self._data_source.instruments(order_book_id)
+
+    def commission_info(self):
+        return self._data_source.commission_info()
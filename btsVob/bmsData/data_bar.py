@@ -2,26 +2,34 @@
 
 import datetime
 
+from .bar_store import EPOCH
+
 class BarObject(object):
-    def __init__(self, instrument, data):
-        self._data = data
+    def __init__(self, instrument, bars, index):
+        """
+        :param Instrument instrument:
+        :param ContractBars bars: 合约的列式行情数据
+        :param int index: 当前bar在列式数据中的下标
+        """
+        self._bars = bars
+        self._index = index
         self._instrument = instrument
 
     @property
     def open(self):
-        return self._data["open"]
+        return self._bars.open[self._index]
 
     @property
     def close(self):
-        return self._data["close"]
+        return self._bars.close[self._index]
 
     @property
     def low(self):
-        return self._data["low"]
+        return self._bars.low[self._index]
 
     @property
     def high(self):
-        return self.data["high"]
+        return self._bars.high[self._index]
 
     @property
     def last(self):
@@ -29,11 +37,15 @@ class BarObject(object):
 
     @property
     def volume(self):
-        return self._data["volume"]
+        return self._bars.volume[self._index]
+
+    @property
+    def oi(self):
+        return self._bars.oi[self._index]
 
     @property
     def datetime(self):
-        return datetime.datetime.strptime(str(self._data["date"]), "%Y%m%d%H%M%S")
+        return EPOCH + datetime.timedelta(minutes=int(self._bars.time[self._index]))
 
     @property
     def instrument(self):
@@ -69,10 +81,10 @@ class BarObject(object):
         raise NotImplementedError
 
     def __repr__(self):
-        return "BarObject({0})".format(self.__dict__)
+        return "BarObject({0} {1})".format(self._bars.order_book_id, self.datetime)
 
     def __getitem__(self, key):
-        return self.__dict__[key]
+        return self._bars.column(key)[self._index]
 
 
 class BarMap(object):
@@ -1,5 +1,9 @@
 #coding: utf-8
 
+import json
+import os
+import pickle
+
 import numpy as np
 import six
 import pandas as pd
@@ -12,20 +16,34 @@ class LocalDataSource(object):
     TRADING_DATES = 'trading_dates.bcolz'
     DAILY = 'daily.bcolz'
     INSTRUMENTS = 'instruments.pk'
+    COMMISSION = 'commission.json'
 
     def __init__(self, root_dir):
         self._root_dir = root_dir
-        import bcolz
-        bcolz.defaults.out_flavor = "numpy"
+        self._daily_table = None
+        self._index = None
 
-        import os
-        import pickle
-        self._daily_table = bcolz.open(os.path.join(root_dir, LocalDataSource.DAILY))
-        self._trading_dates = pd.Index(pd.Timestamp(d) for d in
-                                       bcolz.open(os.path.join(root_dir, LocalDataSource.TRADING_DATES)))
-        self._instruments = {d['order_book_id']: Instrument(d)
-                             for d in pickle.load(open(os.path.join(root_dir, LocalDataSource.INSTRUMENTS), 'rb'))}
+        # 在这里导入,python -m btsVob.bmsData.bundle_index运行前包中还没有加载该模块
+        from .bundle_index import BUNDLE_INDEX, BundleIndex, is_index_fresh
+        if is_index_fresh(root_dir):
+            # 使用编译好的索引,打开时只做内存映射,合约信息按需反序列化
+            self._index = BundleIndex(os.path.join(root_dir, BUNDLE_INDEX))
+            self._trading_dates = self._index.trading_dates()
+            self._instruments = self._index.instruments
+        else:
+            import bcolz
+            self._trading_dates = pd.Index(pd.Timestamp(d) for d in
+                                           bcolz.open(os.path.join(root_dir, LocalDataSource.TRADING_DATES)))
+            with open(os.path.join(root_dir, LocalDataSource.INSTRUMENTS), 'rb') as f:
+                self._instruments = {d['order_book_id']: Instrument(d) for d in pickle.load(f)}
 
+    @property
+    def daily_table(self):
+        if self._daily_table is None:
+            import bcolz
+            bcolz.defaults.out_flavor = "numpy"
+            self._daily_table = bcolz.open(os.path.join(self._root_dir, LocalDataSource.DAILY))
+        return self._daily_table
 
     def instruments(self, order_book_ids):
         if isinstance(order_book_ids, six.string_types):
@@ -55,11 +73,32 @@ class LocalDataSource(object):
         right = self._trading_dates.searchsorted(end_date, side='right')
         return self._trading_dates[left:right]
 
-    def get_all_bars(self, order_book_id):
+    def commission_info(self):
+        """数据目录中的commission.json,没有时返回空字典"""
+        path = os.path.join(self._root_dir, LocalDataSource.COMMISSION)
+        if not os.path.exists(path):
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def order_book_ids(self):
+        """数据目录中有行情的所有合约"""
+        if self._index is not None:
+            return self._index.order_book_ids()
+        return [k for k, v in self.daily_table.attrs.attrs.items()
+                if isinstance(v, (list, tuple)) and len(v) == 2]
+
+    def bar_range(self, order_book_id):
+        """合约行情在daily表中的行区间[start, end),不读取行情"""
         try:
-            start, end = self._daily_table.attrs[order_book_id]
+            if self._index is not None:
+                return self._index.bar_range(order_book_id)
+            return self.daily_table.attrs[order_book_id]
         except KeyError:
             raise RuntimeError('No data for {}'.format(order_book_id))
-        bars = self._daily_table[start:end]
+
+    def get_all_bars(self, order_book_id):
+        start, end = self.bar_range(order_book_id)
+        bars = self.daily_table[start:end]
         bars = bars[["time", "open", "high", "low", "close", "volume", "oi"]]
         return bars
@@ -1,6 +1,4 @@
 #coding: utf-8
-import datetime
-import time
 from ..bmsUtils.const import EVENT_TYPE
 
 class SimulatorAStockTradingEventSource(object):
@@ -28,26 +26,23 @@ class SimulatorAStockTradingEventSource(object):
 
 class SimulatorFutureTradingEventSource(object):
     """添加期货时间事件这里只能支持分钟线"""
-    def __init__(self, trading_param):
+    def __init__(self, trading_param, bar_cursors=None):
+        """
+        :trading_param: 交易参数
+        :bar_cursors: 可选的行情游标集合,随日历推进
+        """
         self.trading_param = trading_param
         self.timezone = trading_param.timezone
+        self.bar_cursors = bar_cursors
         self.generator = self.create_generator()
 
-    def judge_settle_time(self, date):
-        """判断结算时间每天两次结算"""
-        settle1 = [datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 15:00:00', '%Y-%m-%d %H:%M:%S'),
-                   datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 20:00:00', '%Y-%m-%d %H:%M:%S')]
-        settle2 = [datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 03:00:00', '%Y-%m-%d %H:%M:%S'),
-                   datetime.datetime.strptime(date.strftime('%Y-%m-%d')+' 08:00:00', '%Y-%m-%d %H:%M:%S')]
-        if ((date >= settle1[0] and date < settle1[1]) or
-            (date >= settle2[0] and date < settle2[1])):
-            return True
-        else:
-            return False
-        
     def create_generator(self):
-        for date in self.trading_param.trading_calendar:
-            if self.judge_settle_time(date):
+        bar_cursors = self.bar_cursors
+        calendar = self.trading_param.trading_calendar
+        for date, is_settle in zip(calendar, self.trading_param.settlement_mask):
+            if bar_cursors is not None:
+                bar_cursors.advance(date)
+            if is_settle:
                 yield date, EVENT_TYPE.DAILY_SETTLE
             else:
                 yield date, EVENT_TYPE.HANDLE_MIN_BAR
@@ -1 +1,9 @@
 from .logger import user_log, user_print
+from .trace import configure_trace, get_tracer
+from . import logger as _logger, trace as _trace
+
+
+def install_handlers():
+    """安装user_log和trace的logbook handler,重复调用不会重复安装"""
+    _logger.install_handler()
+    _trace.install_handler()
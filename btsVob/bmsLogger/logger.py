@@ -1,7 +1,6 @@
 #coding: utf-8
 
 from logbook import Logger
-from logbook.more import ColorizedStderrHandler
 
 from ..bmsUtils import ExecutionContext
 
@@ -19,10 +18,20 @@ def user_log_formatter(record, handler):
     )
 
 
-# handler = StreamHandler(sys.stdout)
-handler = ColorizedStderrHandler()
-handler.formatter = user_log_formatter
-handler.push_application()
+handler = None
+
+
+def install_handler():
+    """安装user_log的handler,由运行回测的入口调用一次,导入本模块不会改变logbook的全局状态"""
+    global handler
+    if handler is None:
+        from logbook.more import ColorizedStderrHandler
+
+        # handler = StreamHandler(sys.stdout)
+        handler = ColorizedStderrHandler()
+        handler.formatter = user_log_formatter
+        handler.push_application()
+    return handler
 
 
 user_log = Logger("user_log")
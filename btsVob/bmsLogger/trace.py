@@ -0,0 +1,245 @@
+#coding: utf-8
+"""分子系统、分级别的调试trace
+
+热点路径上的调用方式为::
+
+    if exchange_trace.debug_on:
+        exchange_trace.debug("portfolio %r", portfolio.__dict__)
+
+关闭时只有一次属性判断,不会格式化参数。trace默认经logbook输出到stderr,
+也可以用RingBufferTraceSink写入定长记录的二进制环形文件,之后用read_ring_buffer读回。
+"""
+
+import mmap
+import struct
+import time
+
+from logbook import Logger, DEBUG, INFO, WARNING, ERROR, NOTSET, get_level_name, lookup_level
+
+__all__ = [
+    "SUBSYSTEMS",
+    "get_tracer",
+    "configure_trace",
+    "RingBufferTraceSink",
+    "read_ring_buffer",
+    "exchange_trace",
+    "settlement_trace",
+    "risk_trace",
+    "controller_trace",
+]
+
+SUBSYSTEMS = ("exchange", "settlement", "risk", "controller")
+
+# 未配置时只输出警告和错误
+DEFAULT_LEVEL = WARNING
+# 高于所有级别,表示关闭
+DISABLED = ERROR + 100
+
+
+class Tracer(object):
+    """单个子系统的trace,debug_on等开关在设置级别时预先算好"""
+    __slots__ = ("name", "level", "debug_on", "info_on", "warning_on", "error_on", "_logger", "_sink")
+
+    def __init__(self, name, level=DEFAULT_LEVEL):
+        self.name = name
+        self._logger = Logger("trace." + name)
+        self._sink = None
+        self.set_level(level)
+
+    def set_level(self, level):
+        self.level = level
+        self.debug_on = level <= DEBUG
+        self.info_on = level <= INFO
+        self.warning_on = level <= WARNING
+        self.error_on = level <= ERROR
+
+    def set_sink(self, sink):
+        """sink为None时经logbook输出"""
+        self._sink = sink
+
+    def log(self, level, message, *args):
+        if level < self.level:
+            return
+        if args:
+            message = message % args
+        if self._sink is not None:
+            self._sink.write(level, self.name, message)
+        else:
+            self._logger.log(level, message)
+
+    def debug(self, message, *args):
+        self.log(DEBUG, message, *args)
+
+    def info(self, message, *args):
+        self.log(INFO, message, *args)
+
+    def warning(self, message, *args):
+        self.log(WARNING, message, *args)
+
+    def error(self, message, *args):
+        self.log(ERROR, message, *args)
+
+    def __repr__(self):
+        return "Tracer({0}, {1})".format(self.name, "OFF" if self.level >= DISABLED else get_level_name(self.level))
+
+
+_tracers = {name: Tracer(name) for name in SUBSYSTEMS}
+
+# configure_trace最近一次设置的输出,之后新建的tracer也写入其中
+_sink = None
+
+# configure_trace不传sink时保持当前的输出
+_KEEP_SINK = object()
+
+
+def get_tracer(name):
+    try:
+        return _tracers[name]
+    except KeyError:
+        tracer = _tracers[name] = Tracer(name)
+        tracer.set_sink(_sink)
+        return tracer
+
+
+def _parse_level(level):
+    if level is None:
+        return DEFAULT_LEVEL
+    if isinstance(level, int):
+        return level
+    if level.lower() in ("off", "none"):
+        return DISABLED
+    return lookup_level(level.upper())
+
+
+def configure_trace(spec=None, sink=_KEEP_SINK, **levels):
+    """设置各子系统的trace级别和输出
+
+    :param str spec: 形如"exchange=debug,settlement=info"或"debug"(所有子系统)的配置字符串
+    :param sink: 可选的RingBufferTraceSink,所有子系统都写入其中,None表示恢复经logbook输出,
+        不传时保持当前的输出,只修改级别
+    :param levels: 子系统名 -> 级别,如exchange="debug"
+    """
+    global _sink
+    if spec:
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            if "=" in item:
+                name, level = item.split("=", 1)
+                levels[name.strip()] = level.strip()
+            else:
+                for name in SUBSYSTEMS:
+                    levels.setdefault(name, item)
+    for name, level in levels.items():
+        get_tracer(name).set_level(_parse_level(level))
+    if sink is not _KEEP_SINK:
+        _sink = sink
+        for tracer in _tracers.values():
+            tracer.set_sink(sink)
+
+
+class RingBufferTraceSink(object):
+    """定长记录的二进制环形trace文件,写满后覆盖最早的记录
+    文件头为MAGIC、记录长度、记录个数和已写入的总记录数;
+    每条记录为时间戳(double)、级别(uint8)、子系统编号(uint8)、消息长度(uint16)和截断后的utf-8消息
+    """
+    MAGIC = b"BTSTRACE"
+    HEADER = struct.Struct("<8sIIQ")
+    RECORD = struct.Struct("<dBBH")
+
+    def __init__(self, path, capacity=65536, record_size=256):
+        assert record_size > self.RECORD.size
+        self.path = path
+        self.capacity = capacity
+        self.record_size = record_size
+        self._written = 0
+        self._subsystems = {name: i for i, name in enumerate(SUBSYSTEMS)}
+
+        size = self.HEADER.size + capacity * record_size
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self._file = open(path, "r+b")
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._write_header()
+
+    def _write_header(self):
+        self.HEADER.pack_into(self._map, 0, self.MAGIC, self.record_size, self.capacity, self._written)
+
+    def write(self, level, subsystem, message):
+        payload = message.encode("utf-8")[:self.record_size - self.RECORD.size]
+        offset = self.HEADER.size + (self._written % self.capacity) * self.record_size
+        self.RECORD.pack_into(self._map, offset, time.time(), level,
+                              self._subsystems.get(subsystem, 255), len(payload))
+        start = offset + self.RECORD.size
+        self._map[start:start + len(payload)] = payload
+        self._written += 1
+        self._write_header()
+
+    def close(self):
+        if self._map is not None:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+            self._map = None
+
+    def __repr__(self):
+        return "RingBufferTraceSink({0}, {1}/{2} records)".format(
+            self.path, min(self._written, self.capacity), self.capacity)
+
+
+def read_ring_buffer(path):
+    """按写入顺序读回环形trace文件中保留的记录
+
+    :returns: (时间戳, 级别名, 子系统, 消息)的列表
+    :rtype: List[tuple]
+    """
+    header, record = RingBufferTraceSink.HEADER, RingBufferTraceSink.RECORD
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, record_size, capacity, written = header.unpack_from(data, 0)
+    if magic != RingBufferTraceSink.MAGIC:
+        raise RuntimeError("Invalid trace file {}".format(path))
+
+    records = []
+    for n in range(max(0, written - capacity), written):
+        offset = header.size + (n % capacity) * record_size
+        timestamp, level, subsystem, length = record.unpack_from(data, offset)
+        start = offset + record.size
+        message = data[start:start + length].decode("utf-8", "replace")
+        name = SUBSYSTEMS[subsystem] if subsystem < len(SUBSYSTEMS) else "unknown"
+        records.append((timestamp, get_level_name(level), name, message))
+    return records
+
+
+def trace_formatter(record, handler):
+    return "[{dt}] {level} {channel}: {msg}".format(
+        dt=record.time,
+        level=record.level_name,
+        channel=record.channel,
+        msg=record.message,
+    )
+
+
+handler = None
+
+
+def install_handler():
+    """安装trace的handler,由运行回测的入口调用一次
+    trace不依赖ExecutionContext,单独使用一个handler,其他日志继续交给user_log的handler
+    """
+    global handler
+    if handler is None:
+        from logbook.more import ColorizedStderrHandler
+
+        handler = ColorizedStderrHandler(level=NOTSET, bubble=False,
+                                         filter=lambda record, handler: record.channel.startswith("trace."))
+        handler.formatter = trace_formatter
+        handler.push_application()
+    return handler
+
+
+exchange_trace = _tracers["exchange"]
+settlement_trace = _tracers["settlement"]
+risk_trace = _tracers["risk"]
+controller_trace = _tracers["controller"]
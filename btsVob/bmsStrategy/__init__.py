@@ -1 +1,3 @@
 from .bms_strategy import StrategyExecutor
+from .vectorized import VectorizedStrategyExecutor
+from .profiler import PhaseProfiler
@@ -10,13 +10,37 @@ from ..bmsUtils import ExecutionContext
 from ..bmsUtils import dummy_func
 from ..bmsUtils.const import *
 from ..bmsAnalyzer import SimuExchange
+from ..bmsAnalyzer.portfolio_view import PortfolioView
 from ..bmsEvent import SimulatorFutureTradingEventSource
 from ..bmsData import BarMap
 from ..bmsScheduler import scheduler
+from .result_sink import MemoryResultSink
+
+# 回测结果中每次结算保存的投资组合字段和风险指标
+RESULT_COLUMNS = [
+    "daily_returns",
+    "total_returns",
+    "annualized_returns",
+    "market_value",
+    "portfolio_value",
+    "total_commission",
+    "total_tax",
+    "pnl",
+    "positions",
+    "cash",
+]
+
+RISK_KEYS = [
+    "volatility",
+    "max_drawdown",
+    "sharpe",
+    "downside_risk",
+    "sortino",
+]
 
 class StrategyContext(object):
     def __init__(self):
-        self.__last_portfolio_update_dt = None
+        self.__portfolio = None
 
     @property
     def now(self):
@@ -62,10 +86,10 @@ class StrategyContext(object):
 
     @property
     def portfolio(self):
-        dt = self.now
-        if True:
-            self.__portfolio = copy.deepcopy(ExecutionContext.get_exchange().account.portfolio)
-            self.__last_portfolio_update_dt = dt
+        """账户投资组合的只读视图,随成交和价格更新自动失效"""
+        if self.__portfolio is None:
+            exchange = ExecutionContext.get_exchange()
+            self.__portfolio = PortfolioView(exchange.account.portfolio, exchange)
         return self.__portfolio
 
     def __repr__(self):
@@ -93,12 +117,29 @@ class StrategyExecutor(object):
 
         self._user_init = kwargs.get("init", dummy_func)
         self._user_handle_bar = kwargs.get("handle_bar", dummy_func)
+        # 参数扫描时覆盖策略在init中设置的参数
+        self._strategy_params = kwargs.get("strategy_params") or {}
+
+        # 每次结算追加一行结果,默认保存在内存中
+        self._result_sink = kwargs.get("result_sink")
+        if self._result_sink is None:
+            self._result_sink = MemoryResultSink()
 
         self._simu_exchange = kwargs.get("simu_exchange")
         if self._simu_exchange is None:
             self._simu_exchange = SimuExchange(data_proxy, trading_params)
-
-        self._event_source = SimulatorFutureTradingEventSource(trading_params)
+        if not self._result_sink.keeps_objects:
+            # 结果已经写到文件中,风险指标、持仓快照和成交只需要保留当前一次,
+            # 下一次结算需要的上一次快照就是保留的这一次
+            self._simu_exchange.risk_cal.max_history = 1
+            self._simu_exchange.daily_portfolios.max_history = 1
+            self._simu_exchange.account.trade_log.max_history = 1
+
+        # 可选的分阶段profiler,为None时不做任何统计
+        self._profiler = kwargs.get("profiler")
+
+        self._event_source = SimulatorFutureTradingEventSource(trading_params,
+                                                               getattr(data_proxy, "cursors", None))
         self._current_dt = None
         self.current_universe = set()
 
@@ -121,18 +162,34 @@ class StrategyExecutor(object):
             self._current_dt = dt
             exchange_on_dt_change(dt)
 
-        with ExecutionContext(self, EXECUTION_PHASE.INIT):
-            init(strategy_context)
+        profiler = self._profiler
+        bar_dict = BarMap(None, self.current_universe, data_proxy)
 
+        # init抛出异常时也要恢复profiler替换的方法
         try:
+            if profiler is not None:
+                profiler.start(self)
+                init = profiler.wrap_user("init", init)
+                handle_bar = profiler.wrap_user("handle_bar", handle_bar)
+
+            with ExecutionContext(self, EXECUTION_PHASE.INIT):
+                init(strategy_context)
+            for name, value in iteritems(self._strategy_params):
+                setattr(strategy_context, name, value)
+
             for dt, event in self._event_source:
+                if profiler is not None:
+                    event_start = profiler.event_start()
+
                 on_dt_change(dt)
 
-                bar_dict = BarMap(dt, self.current_universe, data_proxy)
+                bar_dict.update_dt(dt)
 
                 if event == EVENT_TYPE.HANDLE_MIN_BAR:
                     with ExecutionContext(self, EXECUTION_PHASE.HANDLE_BAR, bar_dict):
-                        handle_bar(strategy_context, None)
+                        simu_exchange.match_resting_orders(bar_dict)
+                        handle_bar(strategy_context, bar_dict)
+                        simu_exchange.match_queued_orders(bar_dict)
                         self.exchange.update_position(bar_dict)
 
                     if is_show_progress_bar:
@@ -140,62 +197,52 @@ class StrategyExecutor(object):
 
                 if event == EVENT_TYPE.DAILY_SETTLE:
                     self.exchange.settlement_daily_portfolio()
-                    
+                    self.record_result(simu_exchange)
+
+                if profiler is not None:
+                    profiler.event_end(event, event_start)
+
         finally:
             self.progress_bar.render_finish()
+            if profiler is not None:
+                profiler.stop()
 
         results_df = self.generate_result(simu_exchange)
         return results_df
 
+    def record_result(self, simu_exchange):
+        """把刚结算的投资组合和风险指标追加到结果输出
+        :simu_exchange: 模拟交易器
+        """
+        date = simu_exchange.current_date
+        sink = self._result_sink
+        portfolio = simu_exchange.daily_portfolios[date]
+        risk = simu_exchange.risk_cal.daily_risks[date]
+
+        # portfolio
+        items = {"date": pd.Timestamp(date)}
+        for key in RESULT_COLUMNS:
+            if key == "positions" and not sink.keeps_objects:
+                continue
+            items[key] = getattr(portfolio, key)
+
+        # trades
+        if sink.keeps_objects:
+            items["trades"] = simu_exchange.account.get_trades(date)
+
+        # risk
+        for risk_key in RISK_KEYS:
+            items[risk_key] = getattr(risk, risk_key)
+
+        sink.append(items)
+
     def generate_result(self, simu_exchange):
-        """生成运行结果
+        """生成运行结果,从结果输出中读回,写文件时返回ResultReader,需要时再用to_pandas()读成DataFrame
         :simu_exchange: 模拟交易器
         """
-        account = simu_exchange.account
-        risk_cal = simu_exchange.risk_cal
-        columns = [
-            "daily_returns",
-            "total_returns",
-            "annualized_returns",
-            "market_value",
-            "portfolio_value",
-            "total_commission",
-            "total_tax",
-            "pnl",
-            "positions",
-            "cash",
-        ]
-        risk_keys = [
-            "volatility",
-            "max_drawdown",
-            "sharpe",
-            "downside_risk",
-            "sortino",
-        ]
-
-        data = []
-        for date, portfolio in iteritems(simu_exchange.daily_portfolios):
-            print(date)
-            print(portfolio.__dict__)
-            # portfolio
-            items = {"date": pd.Timestamp(date)}
-            for key in columns:
-                items[key] = getattr(portfolio, key)
-
-            # trades
-            items["trades"] = account.get_all_trades()[date]
-
-            # risk
-            risk = risk_cal.daily_risks[date]
-            for risk_key in risk_keys:
-                items[risk_key] = getattr(risk, risk_key)
-
-            idx = risk_cal.trading_index.get_loc(date)
-            data.append(items)
-
-        results_df = pd.DataFrame(data)
-        results_df.set_index("date", inplace=True)
-        return results_df
+        sink = self._result_sink
+        sink.close()
+        return sink.read()
 
     @property
     def strategy_context(self):
@@ -0,0 +1,237 @@
+#coding: utf-8
+"""回测各阶段的耗时统计
+
+启用时在回测开始前把交易所、数据代理和风险计算上的热点方法替换成计时的包装,
+结束后恢复原来的方法;未启用时事件循环中每个事件只多一次判断。各阶段的时间是包含关系,
+例如handle_bar中下单触发的match_orders同时计入两者。
+"""
+
+import cProfile
+import json
+import pstats
+import sys
+import time
+
+from six import StringIO, iteritems
+
+# 包装的热点方法: (executor上的属性, 方法名, 阶段名), 属性为None表示executor本身
+PROFILED_METHODS = (
+    ("data_proxy", "history", "history"),
+    ("data_proxy", "history_array", "history_array"),
+    ("exchange", "match_orders", "match_orders"),
+    ("exchange", "match_resting_orders", "match_resting_orders"),
+    ("exchange", "match_queued_orders", "match_queued_orders"),
+    ("exchange", "update_position", "update_position"),
+    ("exchange", "settlement_daily_portfolio", "settlement"),
+    ("risk_cal", "calculate", "risk"),
+    (None, "record_result", "record_result"),
+)
+
+# 报告中用户代码profile输出的函数个数
+USER_STATS_LIMIT = 20
+
+_clock = getattr(time, "perf_counter", time.time)
+
+
+class PhaseTimer(object):
+    """单个阶段的调用次数、总耗时和最长耗时"""
+    __slots__ = ("name", "calls", "total", "max")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, elapsed):
+        self.calls += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+    def to_dict(self):
+        return {"calls": self.calls, "total_s": self.total, "max_s": self.max,
+                "mean_s": self.total / self.calls if self.calls else 0.}
+
+
+class LatencyHistogram(object):
+    """按2的幂划分微秒区间的延迟直方图,第i个桶为[2^(i-1), 2^i)微秒,第0个桶为不到1微秒"""
+    __slots__ = ("counts",)
+    BUCKETS = 32
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+
+    def add(self, elapsed):
+        bucket = int(elapsed * 1e6).bit_length()
+        self.counts[bucket if bucket < self.BUCKETS else self.BUCKETS - 1] += 1
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def percentile(self, q):
+        """q分位数所在桶的上界(微秒)"""
+        rank = q / 100. * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return 2 ** i
+        return 0
+
+    def to_dict(self):
+        """上界(微秒) -> 个数,省略空桶"""
+        return {"<{0}us".format(2 ** i): count for i, count in enumerate(self.counts) if count}
+
+
+class PhaseProfiler(object):
+    """StrategyExecutor的分阶段profiler
+
+    :param output: 可选,结束时把报告写成JSON的文件;启用用户代码profile时另写一个.prof文件
+    :param user_profiler: True表示用cProfile统计用户策略代码,也可以传入任何有enable()/disable()的
+        profiler对象(比如采样profiler),只在init/handle_bar内启用
+    :param stream: 没有output时打印报告的流,默认为stderr
+    """
+
+    def __init__(self, output=None, user_profiler=False, stream=None):
+        self.output = output
+        self.stream = stream
+        if user_profiler is True:
+            user_profiler = cProfile.Profile()
+        self.user_profiler = user_profiler or None
+        self.timers = {}
+        self.histograms = {}
+        self._patched = []
+        self._start = None
+        self.wall = 0.
+
+    def timer(self, name):
+        try:
+            return self.timers[name]
+        except KeyError:
+            timer = self.timers[name] = PhaseTimer(name)
+            return timer
+
+    def histogram(self, name):
+        try:
+            return self.histograms[name]
+        except KeyError:
+            histogram = self.histograms[name] = LatencyHistogram()
+            return histogram
+
+    def wrap(self, name, func):
+        """返回统计到name阶段的func"""
+        add = self.timer(name).add
+
+        def timed(*args, **kwargs):
+            start = _clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                add(_clock() - start)
+        timed.__wrapped__ = func
+        return timed
+
+    def wrap_user(self, name, func):
+        """包装用户策略函数,除计时外在调用期间启用用户代码profiler"""
+        user_profiler = self.user_profiler
+        if user_profiler is None:
+            return self.wrap(name, func)
+
+        def profiled(*args, **kwargs):
+            user_profiler.enable()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                user_profiler.disable()
+        return self.wrap(name, profiled)
+
+    def start(self, executor):
+        """替换executor及其交易所、数据代理上的热点方法"""
+        owners = {
+            "data_proxy": executor.data_proxy,
+            "exchange": executor.exchange,
+            "risk_cal": executor.exchange.risk_cal,
+            None: executor,
+        }
+        for owner_name, method_name, phase in PROFILED_METHODS:
+            owner = owners[owner_name]
+            method = getattr(owner, method_name, None)
+            if method is None:
+                continue
+            # 用实例属性覆盖类上的方法,结束时删除实例属性即可恢复
+            setattr(owner, method_name, self.wrap(phase, method))
+            self._patched.append((owner, method_name))
+        self._start = _clock()
+
+    def event_start(self):
+        return _clock()
+
+    def event_end(self, event, start):
+        elapsed = _clock() - start
+        self.histogram(event.name).add(elapsed)
+        self.timer(event.name).add(elapsed)
+
+    def stop(self):
+        """恢复被替换的方法,输出或打印报告"""
+        for owner, method_name in self._patched:
+            delattr(owner, method_name)
+        self._patched = []
+        if self._start is not None:
+            self.wall = _clock() - self._start
+            self._start = None
+
+        if self.output is not None:
+            self.export(self.output)
+        else:
+            (self.stream or sys.stderr).write(self.format_report())
+
+    def report(self):
+        """各阶段统计,按总耗时排序
+
+        :returns: [(阶段, 统计)]
+        :rtype: List[tuple]
+        """
+        return sorted(((name, timer.to_dict()) for name, timer in iteritems(self.timers)),
+                      key=lambda item: -item[1]["total_s"])
+
+    def user_stats(self):
+        """用户代码的pstats.Stats,没有启用cProfile时为None"""
+        if not isinstance(self.user_profiler, cProfile.Profile):
+            return None
+        stream = StringIO()
+        stats = pstats.Stats(self.user_profiler, stream=stream)
+        return stats
+
+    def to_dict(self):
+        return {
+            "wall_s": self.wall,
+            "phases": dict(self.report()),
+            "histograms": {name: histogram.to_dict() for name, histogram in iteritems(self.histograms)},
+        }
+
+    def export(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2, sort_keys=True)
+        stats = self.user_stats()
+        if stats is not None:
+            stats.dump_stats(path.rsplit(".", 1)[0] + ".prof")
+
+    def format_report(self):
+        lines = ["{0:<28}{1:>10}{2:>12}{3:>12}{4:>12}{5:>8}".format(
+            "phase", "calls", "total(s)", "mean(us)", "max(us)", "share")]
+        for name, item in self.report():
+            lines.append("{0:<28}{1:>10}{2:>12.3f}{3:>12.1f}{4:>12.1f}{5:>8.1%}".format(
+                name, item["calls"], item["total_s"], item["mean_s"] * 1e6, item["max_s"] * 1e6,
+                item["total_s"] / self.wall if self.wall else 0.))
+        for name, histogram in sorted(iteritems(self.histograms)):
+            lines.append("{0} latency p50<{1}us p90<{2}us p99<{3}us max<{4}us".format(
+                name, histogram.percentile(50), histogram.percentile(90), histogram.percentile(99),
+                histogram.percentile(100)))
+
+        stats = self.user_stats()
+        if stats is not None:
+            stats.sort_stats("cumulative").print_stats(USER_STATS_LIMIT)
+            lines.append(stats.stream.getvalue())
+        return "\n".join(lines) + "\n"
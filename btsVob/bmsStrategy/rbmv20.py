@@ -5,13 +5,14 @@ import math
 import pandas
 def init(context):
     context.OBSERVATION = 20 
+    context.contract = 'rb1610'
 
 def handle_bar(context, bar_dict):
-    prices = history(context.OBSERVATION, '1m', 'close')['rb1610'].values    
+    prices = history_array(context.contract, context.OBSERVATION, '1m', 'close')    
     print(sum(prices) / 20.0)
     print(prices[-1])
     if prices[-1] > (sum(prices) / 20.0):
-        order_shares('rb1610', 1, 'long', 'open')
+        order_shares(context.contract, 1, 'long', 'open')
     else:
-        order_shares('rb1610', 1, 'short', 'close')
+        order_shares(context.contract, 1, 'short', 'close')
         
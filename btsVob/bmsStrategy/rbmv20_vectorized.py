@@ -0,0 +1,12 @@
+# rbmv20的向量化版本,使用--vectorized运行
+# signal一次返回整个回测区间每个分钟bar的目标持仓,收盘价高于均线时持有1手多单,否则空仓
+import numpy as np
+
+def init(context):
+    context.OBSERVATION = 20
+    context.contract = 'rb1610'
+
+def signal(context, bars):
+    rb = bars[context.contract]
+    mean = rb.rolling_mean('close', context.OBSERVATION)
+    return {context.contract: np.where(rb.close > mean, 1, 0)}
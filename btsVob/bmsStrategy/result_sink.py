@@ -0,0 +1,300 @@
+#coding: utf-8
+import abc
+import os
+
+import pandas as pd
+from six import with_metaclass
+
+# 写文件时每积累这么多次结算写出一块,内存占用与回测天数无关
+CHUNK_ROWS = 256
+
+
+class ResultReader(object):
+    """写到文件中的回测结果的句柄,只有调用to_pandas()时才把整个文件读成DataFrame
+
+    :param ChunkedResultSink sink: 已经写完的结果输出
+    """
+
+    def __init__(self, sink):
+        self._sink = sink
+
+    @property
+    def path(self):
+        return self._sink.path
+
+    def to_pandas(self):
+        """读回全部结果
+
+        :returns: 以date为索引的结果
+        :rtype: pandas.DataFrame
+        """
+        if not os.path.exists(self.path):
+            return pd.DataFrame()
+        return self._sink.read_frame()
+
+    def last_row(self):
+        """只读最后一次结算的结果,没有结果时返回None
+
+        :rtype: pandas.Series
+        """
+        if not os.path.exists(self.path):
+            return None
+        return self._sink.read_last_row()
+
+    def __len__(self):
+        if not os.path.exists(self.path):
+            return 0
+        return self._sink.num_rows()
+
+    def __repr__(self):
+        return "ResultReader({0!r})".format(self.path)
+
+
+def load_results(results):
+    """把StrategyExecutor.execute()的返回值转成DataFrame,ResultReader在这里才读文件"""
+    if isinstance(results, ResultReader):
+        return results.to_pandas()
+    return results
+
+
+def last_result(results):
+    """最后一次结算的结果,没有结果时返回None,对ResultReader只读文件的最后一块"""
+    if results is None or len(results) == 0:
+        return None
+    if isinstance(results, ResultReader):
+        return results.last_row()
+    return results.iloc[-1]
+
+
+class BaseResultSink(with_metaclass(abc.ABCMeta)):
+    """回测结果的输出,每次结算追加一行,回测结束后读回结果"""
+
+    # 是否保存positions和trades这样的对象列,列式文件只保存数值列
+    keeps_objects = False
+
+    @abc.abstractmethod
+    def append(self, row):
+        """追加一次结算的结果
+
+        :param dict row: 列名 -> 值,包含date列
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """写完所有结果"""
+        pass
+
+    @abc.abstractmethod
+    def read(self):
+        """读回结果
+
+        :returns: 以date为索引的结果,写文件的输出返回ResultReader
+        :rtype: pandas.DataFrame | ResultReader
+        """
+        raise NotImplementedError
+
+
+class MemoryResultSink(BaseResultSink):
+    """保存在内存中,与原来generate_result的输出完全相同,包含positions和trades列"""
+    keeps_objects = True
+
+    def __init__(self):
+        self._rows = []
+
+    def append(self, row):
+        self._rows.append(row)
+
+    def read(self):
+        results_df = pd.DataFrame(self._rows)
+        if len(results_df):
+            results_df.set_index("date", inplace=True)
+        return results_df
+
+
+class ChunkedResultSink(BaseResultSink):
+    """先在内存中按列缓存CHUNK_ROWS行,再整块写入文件,读回时返回ResultReader"""
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._columns = None
+        self._buffer = None
+        self._closed = False
+
+    def append(self, row):
+        if self._columns is None:
+            self._columns = list(row)
+            self._buffer = {name: [] for name in self._columns}
+        buffer = self._buffer
+        for name in self._columns:
+            value = row[name]
+            buffer[name].append(value if name == "date" else float(value))
+        if len(buffer["date"]) >= self.chunk_rows:
+            self.flush()
+
+    def flush(self):
+        if self._buffer is None or not self._buffer["date"]:
+            return
+        chunk = pd.DataFrame(self._buffer, columns=self._columns)
+        chunk["date"] = pd.to_datetime(chunk["date"])
+        self.write_chunk(chunk)
+        self._buffer = {name: [] for name in self._columns}
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self.close_file()
+        self._closed = True
+
+    def read(self):
+        self.close()
+        return ResultReader(self)
+
+    @abc.abstractmethod
+    def write_chunk(self, chunk):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def close_file(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_frame(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def read_last_row(self):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def num_rows(self):
+        raise NotImplementedError
+
+
+class ParquetResultSink(ChunkedResultSink):
+    """每块写成Parquet文件中的一个row group"""
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        super(ParquetResultSink, self).__init__(path, chunk_rows)
+        self._writer = None
+
+    def write_chunk(self, chunk):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close_file(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def read_frame(self):
+        import pyarrow.parquet as pq
+
+        return pq.read_table(self.path, memory_map=True).to_pandas().set_index("date")
+
+    def read_last_row(self):
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(self.path, memory_map=True)
+        last_group = parquet_file.read_row_group(parquet_file.num_row_groups - 1)
+        return last_group.to_pandas().set_index("date").iloc[-1]
+
+    def num_rows(self):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(self.path, memory_map=True).metadata.num_rows
+
+
+class ArrowResultSink(ChunkedResultSink):
+    """Arrow IPC(Feather v2)文件,每块一个record batch,读回时内存映射"""
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        super(ArrowResultSink, self).__init__(path, chunk_rows)
+        self._writer = None
+        self._sink = None
+
+    def write_chunk(self, chunk):
+        import pyarrow as pa
+
+        batch = pa.RecordBatch.from_pandas(chunk, preserve_index=False)
+        if self._writer is None:
+            self._sink = pa.OSFile(self.path, "wb")
+            self._writer = pa.ipc.new_file(self._sink, batch.schema)
+        self._writer.write_batch(batch)
+
+    def close_file(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+
+    def read_frame(self):
+        import pyarrow as pa
+
+        with pa.memory_map(self.path, "r") as source:
+            return pa.ipc.open_file(source).read_all().to_pandas().set_index("date")
+
+    def read_last_row(self):
+        import pyarrow as pa
+
+        with pa.memory_map(self.path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            last_batch = reader.get_batch(reader.num_record_batches - 1)
+            return last_batch.to_pandas().set_index("date").iloc[-1]
+
+    def num_rows(self):
+        import pyarrow as pa
+
+        with pa.memory_map(self.path, "r") as source:
+            reader = pa.ipc.open_file(source)
+            return sum(reader.get_batch(i).num_rows for i in range(reader.num_record_batches))
+
+
+class HDF5ResultSink(ChunkedResultSink):
+    """以table格式追加到HDF5文件,需要PyTables"""
+    KEY = "results"
+
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        super(HDF5ResultSink, self).__init__(path, chunk_rows)
+        self._store = None
+
+    def write_chunk(self, chunk):
+        if self._store is None:
+            self._store = pd.HDFStore(self.path, mode="w")
+        self._store.append(self.KEY, chunk.set_index("date"), format="table")
+
+    def close_file(self):
+        if self._store is not None:
+            self._store.close()
+
+    def read_frame(self):
+        return pd.read_hdf(self.path, self.KEY)
+
+    def read_last_row(self):
+        return pd.read_hdf(self.path, self.KEY, start=self.num_rows() - 1).iloc[-1]
+
+    def num_rows(self):
+        with pd.HDFStore(self.path, mode="r") as store:
+            return store.get_storer(self.KEY).nrows
+
+
+RESULT_SINKS = {
+    ".parquet": ParquetResultSink,
+    ".feather": ArrowResultSink,
+    ".arrow": ArrowResultSink,
+    ".h5": HDF5ResultSink,
+    ".hdf5": HDF5ResultSink,
+}
+
+
+def make_result_sink(path=None):
+    """根据输出文件的扩展名选择输出方式,其他扩展名或没有输出文件时保存在内存中"""
+    if path is not None:
+        sink_class = RESULT_SINKS.get(os.path.splitext(path)[1].lower())
+        if sink_class is not None:
+            return sink_class(path)
+    return MemoryResultSink()
@@ -0,0 +1,373 @@
+#coding: utf-8
+import numpy as np
+import pandas as pd
+from six import iteritems
+
+from ..bmsUtils import ExecutionContext
+from ..bmsUtils import dummy_func
+from ..bmsUtils.const import *
+from ..bmsAnalyzer.commission import AStockCommission
+from ..bmsAnalyzer.order import gen_order_id
+from ..bmsAnalyzer.position import Positions
+from ..bmsAnalyzer.risk_cal import RiskCal
+from ..bmsAnalyzer.slippage import FixedPercentSlippageDecider
+from ..bmsAnalyzer.trade import Trade
+from ..bmsData.bar_store import to_epoch_minute
+from .bms_strategy import StrategyContext, RESULT_COLUMNS, RISK_KEYS
+
+
+class AlignedBars(object):
+    """单个合约对齐到交易日历的行情
+    属性访问(如bars.close)返回每个日历时间点对应bar的字段,与事件驱动模式下bar_dict取到的bar一致;
+    raw返回合约完整的列式数据,index为每个日历时间点在其中的下标,用于计算滚动窗口
+    """
+    __slots__ = ("order_book_id", "_bars", "index")
+
+    def __init__(self, bars, index):
+        self.order_book_id = bars.order_book_id
+        self._bars = bars
+        self.index = index
+
+    def raw(self, field):
+        return self._bars.column(field)
+
+    def rolling_mean(self, field, window):
+        """每个日历时间点上最近window根bar(含当前bar)的均值,与history_array(..., window, ...).mean()一致"""
+        values = self.raw(field)
+        csum = np.concatenate(([0.], np.cumsum(values)))
+        end = self.index + 1
+        start = np.maximum(end - window, 0)
+        return (csum[end] - csum[start]) / (end - start)
+
+    def __getattr__(self, field):
+        try:
+            column = self._bars.column(field)
+        except AttributeError:
+            raise AttributeError(field)
+        return column[self.index]
+
+    def __repr__(self):
+        return "AlignedBars({0}, {1} bars)".format(self.order_book_id, len(self.index))
+
+
+class VectorBars(object):
+    """传给signal函数的行情集合,按合约返回AlignedBars"""
+
+    def __init__(self, bar_store, trading_calendar):
+        self._bar_store = bar_store
+        self._aligned = {}
+        self.dt = trading_calendar
+        self.minutes = np.array([to_epoch_minute(dt) for dt in trading_calendar], dtype=np.int64)
+
+    def __getitem__(self, order_book_id):
+        try:
+            return self._aligned[order_book_id]
+        except KeyError:
+            bars = self._bar_store[order_book_id]
+            index = bars.time.searchsorted(self.minutes)
+            if len(index) and index[-1] >= len(bars):
+                raise IndexError("no bar of {} at or after {}".format(order_book_id, self.dt[-1]))
+            aligned = self._aligned[order_book_id] = AlignedBars(bars, index)
+            return aligned
+
+    def __repr__(self):
+        return "VectorBars({0})".format(sorted(self._aligned))
+
+
+def forward_fill(values, mask, leading=0.):
+    """mask为True的位置沿用之前最近一个mask为False位置的值
+    :leading: 开头没有之前值的位置填充的值,为None时保留原值
+    """
+    idx = np.where(mask, 0, np.arange(len(values)))
+    np.maximum.accumulate(idx, out=idx)
+    filled = values[idx]
+    lead = ~np.logical_or.accumulate(~mask)
+    filled[lead] = values[lead] if leading is None else leading
+    return filled
+
+
+class VectorizedStrategyExecutor(object):
+    """向量化回测
+    策略提供signal(context, bars)函数,返回order_book_id -> 每个日历时间点的目标净持仓手数(正多负空),
+    引擎在每个分钟bar按收盘价加滑点调仓到目标持仓,用numpy算出成交价和保证金,
+    持仓成本、手续费和每日结算按SimuExchange的规则逐笔重放,输出与StrategyExecutor.execute相同结构的results_df。
+    资金足够时与每个bar按目标持仓先平后开下市价单的事件驱动策略结果相同;不模拟资金不足时的拒单,
+    适合先批量筛选参数,再用事件驱动模式回测入选的参数。
+    """
+
+    def __init__(self, trading_params, data_proxy, **kwargs):
+        """
+        :trading_params: 当前交易参数
+        :data_proxy: 数据代理,需要提供bar_store
+        :result_sink: 可选,BaseResultSink,不保存对象列时结果逐行写入其中并返回它读回的结果
+        """
+        self.trading_params = trading_params
+        self._data_proxy = data_proxy
+
+        self._strategy_context = kwargs.get("strategy_context")
+        if self._strategy_context is None:
+            self._strategy_context = StrategyContext()
+
+        self._user_init = kwargs.get("init", dummy_func)
+        self._user_signal = kwargs["signal"]
+        self._strategy_params = kwargs.get("strategy_params") or {}
+        self._result_sink = kwargs.get("result_sink")
+
+        self._commission_decider = kwargs.get("commission", AStockCommission())
+        self._commission_decider.contract_specs.update_commission_info(data_proxy.commission_info())
+        self._commission_decider.contract_specs.bind_instruments(data_proxy.instrument)
+        self._slippage_decider = kwargs.get("slippage", FixedPercentSlippageDecider())
+
+        self._current_dt = None
+        self.exchange = None
+        self.risk_cal = RiskCal(trading_params, data_proxy)
+
+    def execute(self):
+        """运行策略
+        :returns: 返回策略执行结果以DataFrame的方式,结果写文件时返回ResultReader
+        """
+        strategy_context = self.strategy_context
+        trading_params = self.trading_params
+        calendar = trading_params.trading_calendar
+
+        with ExecutionContext(self, EXECUTION_PHASE.INIT):
+            self._user_init(strategy_context)
+        for name, value in iteritems(self._strategy_params):
+            setattr(strategy_context, name, value)
+
+        bars = VectorBars(self._data_proxy.bar_store, calendar)
+        with ExecutionContext(self, EXECUTION_PHASE.HANDLE_BAR):
+            targets = self._user_signal(strategy_context, bars)
+
+        settle = np.asarray(trading_params.settlement_mask, dtype=bool)
+        settle_rows = np.flatnonzero(settle)
+        contracts = [self.simulate_contract(bars[order_book_id], target, settle)
+                     for order_book_id, target in iteritems(targets)]
+        results_df = self.settle(calendar[settle_rows], settle_rows, contracts)
+        return self.write_result(results_df)
+
+    def write_result(self, results_df):
+        """把结果逐行写入result_sink,没有输出或输出保存在内存中时直接返回results_df"""
+        sink = self._result_sink
+        if sink is None or sink.keeps_objects:
+            return results_df
+        columns = [column for column in results_df.columns if column not in ("positions", "trades")]
+        for date, values in zip(results_df.index, results_df[columns].itertuples(index=False)):
+            items = {"date": date}
+            items.update(zip(columns, values))
+            sink.append(items)
+        sink.close()
+        return sink.read()
+
+    def simulate_contract(self, bars, target, settle):
+        """计算单个合约每个日历时间点的持仓、成交价和保证金,再逐笔重放SimuExchange的成本和盈亏规则"""
+        spec = self._commission_decider.contract_specs[bars.order_book_id]
+
+        # 结算时间点不调仓,沿用之前的目标持仓
+        target = np.rint(np.nan_to_num(np.asarray(target, dtype=np.float64)))
+        position = forward_fill(target, settle)
+        quantity = np.diff(position, prepend=0.)
+
+        # 结算时按最近一个分钟bar的收盘价盯市
+        close = forward_fill(bars.close.astype(np.float64), settle, None)
+        # 与FixedPercentSlippageDecider相同,买入加滑点,卖出减滑点
+        trade_price = close + close * self._slippage_decider.rate / 2 * np.sign(quantity)
+        margin = np.abs(position) * close * spec.multiplier * spec.margin_rate
+
+        contract = {
+            "spec": spec,
+            "position": position,
+            "quantity": quantity,
+            "close": close,
+            "trade_price": trade_price,
+            "margin": margin,
+        }
+        contract.update(self.replay_fills(spec, quantity, close, trade_price, settle))
+        return contract
+
+    def replay_fills(self, spec, quantity, close, trade_price, settle):
+        """按SimuExchange.fill_order和settlement_daily_portfolio的规则逐笔计算成本和盈亏
+        净持仓反向时先平后开,与依次下平仓单和开仓单的事件驱动策略相同;
+        只有开仓手续费计入total_commission,平仓的已实现盈亏按(成交价-持仓成本)*乘数计,
+        结算时按结算价计算盈亏并把持仓成本重置为结算价。资金不足时的拒单不模拟。
+
+        :returns: commission(开平仓手续费), open_commission(开仓手续费), pnl(平仓和结算盈亏),
+            fills(每笔成交的(行号, Trade))
+        :rtype: dict
+        """
+        multiplier = spec.multiplier
+        order_book_id = spec.order_book_id
+        commission = np.zeros(len(quantity))
+        open_commission = np.zeros(len(quantity))
+        pnl = np.zeros(len(quantity))
+        fills = []
+
+        def fill(row, price, amount, direction, offset):
+            fee = spec.commission(price, amount)
+            commission[row] += fee
+            if offset == "open":
+                open_commission[row] += fee
+            fills.append((row, Trade(date=None, order_book_id=order_book_id, price=price, amount=amount,
+                                     order_id=None, commission=fee, direction=direction, offset=offset)))
+
+        long_quantity = short_quantity = 0.
+        long_cost = short_cost = 0.
+        for row in np.flatnonzero((quantity != 0) | settle):
+            if settle[row]:
+                price = close[row]
+                pnl[row] += (long_quantity * (price - long_cost) + short_quantity * (short_cost - price)) * multiplier
+                long_cost = short_cost = price
+                continue
+
+            price = float(trade_price[row])
+            amount = float(quantity[row])
+            if amount > 0:
+                closed = min(amount, short_quantity)
+                if closed:
+                    pnl[row] += (short_cost - price) * multiplier
+                    short_cost = 0. if short_quantity == closed else \
+                        (short_cost * short_quantity - price * closed) / (short_quantity - closed)
+                    short_quantity -= closed
+                    fill(row, price, closed, "long", "close")
+                opened = amount - closed
+                if opened:
+                    long_cost = price * opened / (long_quantity + opened) + \
+                        long_cost * long_quantity / (long_quantity + opened)
+                    long_quantity += opened
+                    fill(row, price, opened, "long", "open")
+            else:
+                closed = min(-amount, long_quantity)
+                if closed:
+                    pnl[row] += (price - long_cost) * multiplier
+                    long_cost = 0. if long_quantity == closed else \
+                        (long_cost * long_quantity - price * closed) / (long_quantity - closed)
+                    long_quantity -= closed
+                    fill(row, price, closed, "short", "close")
+                opened = -amount - closed
+                if opened:
+                    short_cost = price * opened / (short_quantity + opened) + \
+                        short_cost * short_quantity / (short_quantity + opened)
+                    short_quantity += opened
+                    fill(row, price, opened, "short", "open")
+
+        return {"commission": commission, "open_commission": open_commission, "pnl": pnl, "fills": fills}
+
+    def settle(self, settle_dates, settle_rows, contracts):
+        """按结算时间点汇总成每日结算的结果,规则与SimuExchange.settlement_daily_portfolio相同,
+        风险指标沿用RiskCal的流式计算
+        """
+        calendar = self.trading_params.trading_calendar
+        n = len(calendar)
+        pnl = np.zeros(n)
+        commission = np.zeros(n)
+        open_commission = np.zeros(n)
+        margin = np.zeros(n)
+        for contract in contracts:
+            pnl += contract["pnl"]
+            commission += contract["commission"]
+            open_commission += contract["open_commission"]
+            margin += contract["margin"]
+
+        def per_day(values):
+            cumsum = np.cumsum(values)[settle_rows]
+            return np.diff(cumsum, prepend=0.)
+
+        daily_pnl = per_day(pnl)
+        total_commission = np.cumsum(per_day(open_commission))
+
+        # SimuExchange只在上一个日历时间点也是结算时才找得到上一次结算的组合,
+        # 找不到时扣除累计的开仓手续费,日收益率以初始资金为分母
+        settle = np.asarray(self.trading_params.settlement_mask, dtype=bool)
+        has_previous = np.zeros(len(settle_rows), dtype=bool)
+        has_previous[1:] = settle[settle_rows[1:] - 1]
+        previous_commission = np.concatenate(([0.], total_commission[:-1]))
+        deducted = np.where(has_previous, total_commission - previous_commission, total_commission)
+
+        starting_cash = float(self.trading_params.init_cash)
+        portfolio_value = starting_cash + np.cumsum(daily_pnl - deducted)
+        previous_value = np.where(has_previous, np.concatenate(([starting_cash], portfolio_value[:-1])),
+                                  starting_cash)
+        daily_returns = daily_pnl / previous_value
+        total_returns = portfolio_value / starting_cash - 1
+        days_pass = np.array([(date - self.trading_params.start_date).days + 1 for date in settle_dates], dtype=np.float64)
+        annualized_returns = total_returns * (DAYS_CNT.DAYS_A_YEAR / days_pass)
+
+        # 开仓冻结、平仓释放的保证金和逐bar的保证金变动都在资金中,结算时资金为
+        # 初始资金 - 全部手续费 + 平仓的已实现盈亏 - 按结算价计算的保证金
+        realized = np.zeros(n)
+        for contract in contracts:
+            realized += np.where(settle, 0., contract["pnl"])
+        cash = starting_cash + np.cumsum(realized - commission)[settle_rows] - margin[settle_rows]
+
+        columns = {
+            "daily_returns": daily_returns,
+            "total_returns": total_returns,
+            "annualized_returns": annualized_returns,
+            "market_value": np.zeros(len(settle_rows)),
+            "portfolio_value": portfolio_value,
+            "total_commission": total_commission,
+            "total_tax": np.zeros(len(settle_rows)),
+            "pnl": daily_pnl,
+            "positions": [self.positions_at(contracts, row) for row in settle_rows],
+            "cash": cash,
+            "trades": self.daily_trades(contracts, settle_rows),
+        }
+
+        risk_cal = self.risk_cal
+        for date, returns in zip(settle_dates, daily_returns):
+            risk_cal.calculate(date, returns)
+        for risk_key in RISK_KEYS:
+            columns[risk_key] = [getattr(risk_cal.daily_risks[date], risk_key) for date in settle_dates]
+
+        results_df = pd.DataFrame(columns, index=pd.DatetimeIndex(settle_dates, name="date"))
+        return results_df[RESULT_COLUMNS + ["trades"] + RISK_KEYS]
+
+    def positions_at(self, contracts, row):
+        """结算时的持仓,持仓成本按结算价重置,与盯市结算后的持仓一致"""
+        positions = Positions()
+        for contract in contracts:
+            net = contract["position"][row]
+            if net == 0:
+                continue
+            spec = contract["spec"]
+            price = contract["close"][row]
+            position = positions[spec.order_book_id]
+            position.quantity = abs(net)
+            position.bought_quantity = position.long_sellable = max(net, 0.)
+            position.sold_quantity = position.short_sellable = max(-net, 0.)
+            position.bought_premium = price * position.bought_quantity * spec.margin_rate * spec.multiplier
+            position.sold_premium = price * position.sold_quantity * spec.margin_rate * spec.multiplier
+            position.average_long_cost = position.average_short_cost = position.market_value = price
+        return positions
+
+    def daily_trades(self, contracts, settle_rows):
+        """每个结算周期内的成交,与事件驱动模式一样amount为正的手数,方向和开平在direction和offset中,
+        订单号按成交时间顺序生成
+        """
+        calendar = self.trading_params.trading_calendar
+        day_of_row = np.searchsorted(settle_rows, np.arange(len(calendar)))
+        fills = sorted((fill for contract in contracts for fill in contract["fills"]), key=lambda fill: fill[0])
+        trades = [[] for _ in settle_rows]
+        for row, trade in fills:
+            day = day_of_row[row]
+            if day >= len(trades):
+                break
+            trade.date = calendar[row].to_pydatetime()
+            trade.order_id = gen_order_id()
+            trades[day].append(trade)
+        return trades
+
+    @property
+    def strategy_context(self):
+        """获取当前策略"""
+        return self._strategy_context
+
+    @property
+    def data_proxy(self):
+        """获取数据代理"""
+        return self._data_proxy
+
+    @property
+    def current_dt(self):
+        """获取当前模拟器的交易时间"""
+        return self._current_dt
@@ -51,7 +51,8 @@ else:
         "DAY_START",
         "HANDLE_DAY_BAR",
         "DAY_END",
-        "HANDLE_MIN_BAR"
+        "HANDLE_MIN_BAR",
+        "DAILY_SETTLE",
     ])
     
     
@@ -64,6 +65,23 @@ else:
     ])
     
 
+# 各交易时段的结算窗口[开始, 结束),日盘收盘后和夜盘收盘后各结算一次
+SETTLEMENT_WINDOWS = {
+    "day": ("15:00", "20:00"),
+    "night": ("03:00", "08:00"),
+}
+
+class MATCHING_MODE(object):
+    IMMEDIATE = "immediate"     # 下单时立即撮合
+    BAR_END = "bar_end"         # handle_bar中的订单排队,在bar结束时一次撮合
+
+
+class FILL_PRIORITY(object):
+    FIFO = "fifo"               # 按下单顺序成交
+    CLOSE_FIRST = "close_first" # 先成交平仓单,释放保证金后再开仓
+    OPEN_FIRST = "open_first"   # 先成交开仓单
+
+
 class DAYS_CNT(object):
     DAYS_A_YEAR = 365
     TRADING_DAYS_A_YEAR = 252
@@ -0,0 +1,31 @@
+#coding: utf-8
+
+import numpy as np
+import pandas as pd
+
+
+def parse_session_time(value):
+    """把'HH:MM'格式的时间转换成当天的分钟数"""
+    hour, minute = value.split(":")
+    return int(hour) * 60 + int(minute)
+
+
+def settlement_mask(trading_calendar, settlement_windows):
+    """一次性向量化计算交易日历中哪些时间点属于结算时间
+
+    :param pandas.Index trading_calendar: 分钟线交易日历
+    :param dict settlement_windows: 各交易时段的结算窗口,如 {"day": ("15:00", "20:00")},
+        左闭右开;开始时间晚于结束时间的窗口表示跨越零点
+    :returns: 与交易日历等长的布尔数组
+    :rtype: numpy.ndarray
+    """
+    calendar = pd.DatetimeIndex(trading_calendar)
+    minutes = np.asarray(calendar.hour) * 60 + np.asarray(calendar.minute)
+    mask = np.zeros(len(calendar), dtype=bool)
+    for session, (start, end) in settlement_windows.items():
+        start, end = parse_session_time(start), parse_session_time(end)
+        if start <= end:
+            mask |= (minutes >= start) & (minutes < end)
+        else:
+            mask |= (minutes >= start) | (minutes < end)
+    return mask
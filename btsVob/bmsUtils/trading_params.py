@@ -2,6 +2,9 @@
 import pytz
 import pandas as pd
 
+from .const import SETTLEMENT_WINDOWS, MATCHING_MODE, FILL_PRIORITY
+from .settlement import settlement_mask
+
 class TradingParams(object):
     def __init__(self, trading_calendar, **kwargs):
         assert isinstance(trading_calendar, pd.Index)
@@ -12,3 +15,14 @@ class TradingParams(object):
         self.end_date = kwargs.get("end_date", self.trading_calendar[-1].to_datetime())
         self.init_cash = kwargs.get("init_cash", 100000)
         self.show_progress = kwargs.get("show_progress", False)
+        self.settlement_windows = kwargs.get("settlement_windows", SETTLEMENT_WINDOWS)
+        self.matching_mode = kwargs.get("matching_mode", MATCHING_MODE.IMMEDIATE)
+        self.fill_priority = kwargs.get("fill_priority", FILL_PRIORITY.FIFO)
+        self._settlement_mask = None
+
+    @property
+    def settlement_mask(self):
+        """交易日历上的结算时间点掩码,只计算一次,供事件源和风险计算共用"""
+        if self._settlement_mask is None:
+            self._settlement_mask = settlement_mask(self.trading_calendar, self.settlement_windows)
+        return self._settlement_mask
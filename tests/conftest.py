@@ -0,0 +1,38 @@
+#coding: utf-8
+"""测试夹具,需要数据目录的测试在bundle_generator生成的小数据目录上运行,没有安装bcolz时跳过"""
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def bundle_dir(tmp_path_factory):
+    pytest.importorskip("bcolz")
+    from btsVob.bmsData.bundle_generator import generate_bundle
+
+    root = str(tmp_path_factory.mktemp("bundle"))
+    generate_bundle(root, contracts=4, days=10, seed=5)
+    return root
+
+
+@pytest.fixture
+def data_proxy(bundle_dir):
+    from btsVob.bmsData import LocalDataProxy
+    return LocalDataProxy(bundle_dir)
+
+
+@pytest.fixture
+def make_trading_params(data_proxy):
+    from btsVob.bmsUtils import TradingParams
+
+    def make(**kwargs):
+        calendar = data_proxy.get_trading_dates("1900-01-01", "2100-01-01")
+        kwargs.setdefault("init_cash", 1e8)
+        return TradingParams(calendar, start_date=calendar[0].to_pydatetime(),
+                             end_date=calendar[-1].to_pydatetime(), **kwargs)
+    return make
+
+
+@pytest.fixture
+def order_book_ids(bundle_dir):
+    from btsVob.bmsData.data_source import LocalDataSource
+    return sorted(LocalDataSource(bundle_dir).order_book_ids())
@@ -0,0 +1,147 @@
+#coding: utf-8
+"""撮合引擎、成交顺序以及bar_end与立即撮合的一致性"""
+
+from collections import namedtuple
+
+import logbook
+import numpy as np
+import pytest
+
+from btsVob.bmsAnalyzer.matching_engine import BarMatchingEngine
+from btsVob.bmsAnalyzer.order import Order
+from btsVob.bmsAnalyzer.order_style import LimitOrder, StopOrder
+from btsVob.bmsAnalyzer.simulation_exchange import SimuExchange
+from btsVob.bmsController import api
+from btsVob.bmsStrategy import StrategyExecutor
+from btsVob.bmsStrategy.bms_strategy import RESULT_COLUMNS, RISK_KEYS
+from btsVob.bmsUtils.const import FILL_PRIORITY, MATCHING_MODE
+
+Bar = namedtuple("Bar", "open high low close")
+
+NUMERIC_COLUMNS = [column for column in RESULT_COLUMNS if column != "positions"] + RISK_KEYS
+BAR = Bar(open=100., high=105., low=95., close=102.)
+
+
+def make_order(direction="long", offset="open", style=None):
+    return Order(None, "RB1701", 1, direction, offset, style)
+
+
+def match(orders, bar=BAR, resting=True):
+    fills = BarMatchingEngine().match(bar, orders, resting, lambda order: -1.)
+    return [(orders.index(order), price) for order, price in fills]
+
+
+def test_limit_orders_fill_at_limit_or_better_open():
+    orders = [make_order("long", style=LimitOrder(96.)),
+              make_order("short", style=LimitOrder(104.)),
+              make_order("long", style=LimitOrder(94.)),
+              make_order("short", style=LimitOrder(106.))]
+    assert match(orders) == [(0, 96.), (1, 104.)]
+
+    gap = Bar(open=90., high=92., low=88., close=91.)
+    assert match(orders[:1], gap) == [(0, 90.)]
+
+
+def test_stop_orders_trigger_on_breakout():
+    orders = [make_order("long", style=StopOrder(104.)),
+              make_order("short", style=StopOrder(96.)),
+              make_order("long", style=StopOrder(106.)),
+              make_order("short", style=StopOrder(94.))]
+    assert match(orders) == [(0, 104.), (1, 96.)]
+
+    gap = Bar(open=110., high=112., low=108., close=111.)
+    assert match(orders[:1], gap) == [(0, 110.)]
+
+
+def test_new_orders_only_see_close_price():
+    orders = [make_order("long", style=LimitOrder(96.)),
+              make_order("long", style=LimitOrder(103.)),
+              make_order("long", style=StopOrder(101.))]
+    assert match(orders, resting=False) == [(1, 102.), (2, 102.)]
+
+
+def test_market_orders_keep_submission_order():
+    orders = [make_order("short", "close"),
+              make_order("long", style=LimitOrder(94.)),
+              make_order("long", style=LimitOrder(96.)),
+              make_order("long")]
+    assert match(orders) == [(0, -1.), (2, 96.), (3, -1.)]
+
+
+@pytest.mark.parametrize("fill_priority, expected", [
+    (FILL_PRIORITY.FIFO, ["open", "close", "open", "close"]),
+    (FILL_PRIORITY.CLOSE_FIRST, ["close", "close", "open", "open"]),
+    (FILL_PRIORITY.OPEN_FIRST, ["open", "open", "close", "close"]),
+])
+def test_sort_by_fill_priority_is_stable(data_proxy, make_trading_params, fill_priority, expected):
+    exchange = SimuExchange(data_proxy, make_trading_params(fill_priority=fill_priority))
+    orders = [make_order(offset=offset) for offset in ("open", "close", "open", "close")]
+
+    ordered = exchange.sort_by_fill_priority(orders)
+    assert [order.offset for order in ordered] == expected
+    for offset in ("open", "close"):
+        assert [order for order in ordered if order.offset == offset] == \
+            [order for order in orders if order.offset == offset]
+
+
+def test_unknown_fill_priority(data_proxy, make_trading_params):
+    exchange = SimuExchange(data_proxy, make_trading_params(fill_priority="random"))
+    with pytest.raises(ValueError):
+        exchange.sort_by_fill_priority([make_order()])
+
+
+def backtest(data_proxy, trading_params, handle_bar):
+    executor = StrategyExecutor(trading_params=trading_params, data_proxy=data_proxy, handle_bar=handle_bar)
+    with logbook.NullHandler().applicationbound():
+        return executor.execute()
+
+
+def all_trades(results_df):
+    return [trade for day_trades in results_df["trades"] for trade in day_trades]
+
+
+@pytest.mark.parametrize("fill_priority, expected", [
+    (FILL_PRIORITY.FIFO, ["open", "close"]),
+    (FILL_PRIORITY.CLOSE_FIRST, ["close", "open"]),
+    (FILL_PRIORITY.OPEN_FIRST, ["open", "close"]),
+])
+def test_bar_end_fills_in_priority_order(data_proxy, make_trading_params, order_book_ids, fill_priority, expected):
+    """开出1手多单后,每个bar先下开仓单再下平仓单,bar结束时按成交顺序撮合"""
+    order_book_id = order_book_ids[0]
+
+    def handle_bar(context, bar_dict):
+        api.order_shares(order_book_id, 1, "long", "open")
+        if context.portfolio.positions[order_book_id].bought_quantity:
+            api.order_shares(order_book_id, 1, "short", "close")
+
+    trading_params = make_trading_params(matching_mode=MATCHING_MODE.BAR_END, fill_priority=fill_priority)
+    trades = all_trades(backtest(data_proxy, trading_params, handle_bar))
+    assert len(trades) > 3 and len(trades) % 2 == 1
+    for i in range(1, len(trades), 2):
+        assert [trades[i].offset, trades[i + 1].offset] == expected
+
+
+@pytest.mark.parametrize("fill_priority", [FILL_PRIORITY.FIFO, FILL_PRIORITY.CLOSE_FIRST, FILL_PRIORITY.OPEN_FIRST])
+def test_bar_end_matches_immediate_with_one_order_per_bar(data_proxy, make_trading_params, order_book_ids,
+                                                           fill_priority):
+    """每个bar只下一笔单时,bar_end撮合与立即撮合的结果相同"""
+    order_book_id = order_book_ids[0]
+
+    def handle_bar(context, bar_dict):
+        if context.portfolio.positions[order_book_id].bought_quantity:
+            api.order_shares(order_book_id, 1, "short", "close")
+        else:
+            api.order_shares(order_book_id, 1, "long", "open")
+
+    expected = backtest(data_proxy, make_trading_params(matching_mode=MATCHING_MODE.IMMEDIATE), handle_bar)
+    results_df = backtest(data_proxy, make_trading_params(matching_mode=MATCHING_MODE.BAR_END,
+                                                          fill_priority=fill_priority), handle_bar)
+
+    np.testing.assert_array_equal(results_df[NUMERIC_COLUMNS].values.astype(float),
+                                  expected[NUMERIC_COLUMNS].values.astype(float))
+    trades, expected_trades = all_trades(results_df), all_trades(expected)
+    assert len(trades) == len(expected_trades) > 0
+    for trade, expected_trade in zip(trades, expected_trades):
+        assert (trade.date, trade.price, trade.amount, trade.direction, trade.offset) == \
+            (expected_trade.date, expected_trade.price, expected_trade.amount,
+             expected_trade.direction, expected_trade.offset)
@@ -0,0 +1,80 @@
+#coding: utf-8
+"""挂单簿的索引一致性"""
+
+from btsVob.bmsAnalyzer.order import Order
+from btsVob.bmsAnalyzer.order_book import OrderBook
+from btsVob.bmsUtils.const import ORDER_STATUS
+
+
+def make_order(order_book_id="RB1701", direction="long", offset="open"):
+    return Order(None, order_book_id, 1, direction, offset)
+
+
+def test_orders_are_indexed_by_id_contract_and_status():
+    book = OrderBook()
+    first, second, other = make_order(), make_order(), make_order("CU1701")
+    for order in (first, second, other):
+        book.add(order)
+
+    assert len(book) == 3
+    assert book.get(second.order_id) is second
+    assert first in book
+    assert book.orders("RB1701") == [first, second]
+    assert book.orders("AU1701") == []
+    assert book.contracts() == ["RB1701", "CU1701"]
+    assert book.with_status(ORDER_STATUS.OPEN) == [first, second, other]
+    assert list(book) == [first, second, other]
+
+
+def test_remove_drops_empty_contracts():
+    book = OrderBook()
+    order = make_order()
+    book.add(order)
+
+    assert book.remove(order)
+    assert not book.remove(order)
+    assert len(book) == 0
+    assert book.contracts() == []
+    assert book.with_status(ORDER_STATUS.OPEN) == []
+    assert book.get(order.order_id) is None
+
+
+def test_set_status_moves_status_index():
+    book = OrderBook()
+    order, rejected = make_order(), make_order()
+    book.add(order)
+    book.add(rejected)
+
+    book.reject(rejected, "no cash")
+    assert rejected.status == ORDER_STATUS.REJECTED
+    assert book.with_status(ORDER_STATUS.REJECTED) == [rejected]
+    assert book.with_status(ORDER_STATUS.OPEN) == [order]
+
+    # 不在挂单簿中的订单只修改状态
+    outside = make_order()
+    book.set_status(outside, ORDER_STATUS.CANCELLED)
+    assert outside.status == ORDER_STATUS.CANCELLED
+    assert book.with_status(ORDER_STATUS.CANCELLED) == []
+
+
+def test_cancel_removes_order():
+    book = OrderBook()
+    order = make_order()
+    book.add(order)
+
+    assert book.cancel(order)
+    assert order.status == ORDER_STATUS.CANCELLED
+    assert order not in book
+    assert book.with_status(ORDER_STATUS.CANCELLED) == []
+    assert book.orders("RB1701") == []
+
+
+def test_orders_can_be_removed_while_iterating():
+    book = OrderBook()
+    orders = [make_order() for _ in range(3)]
+    for order in orders:
+        book.add(order)
+
+    for order in book.orders("RB1701"):
+        book.remove(order)
+    assert len(book) == 0
@@ -0,0 +1,86 @@
+#coding: utf-8
+"""向量化回测与事件驱动回测的一致性"""
+
+import logbook
+import numpy as np
+import pandas as pd
+
+from btsVob.bmsController import api
+from btsVob.bmsStrategy import StrategyExecutor, VectorizedStrategyExecutor
+from btsVob.bmsStrategy.bms_strategy import RESULT_COLUMNS, RISK_KEYS
+from btsVob.bmsStrategy.vectorized import VectorBars, forward_fill
+
+NUMERIC_COLUMNS = [column for column in RESULT_COLUMNS if column != "positions"] + RISK_KEYS
+
+
+def make_signal(order_book_ids):
+    """均线交叉,多头1到2手,空头1手,覆盖开仓、加仓、平仓和反手"""
+    def signal(context, bars):
+        targets = {}
+        for i, order_book_id in enumerate(order_book_ids):
+            aligned = bars[order_book_id]
+            fast, slow = aligned.rolling_mean("close", 5), aligned.rolling_mean("close", 20)
+            targets[order_book_id] = np.where(fast > slow, 1 + i % 2, np.where(fast < slow * 0.9995, -1, 0))
+        return targets
+    return signal
+
+
+def make_handle_bar(targets, trading_params):
+    """每个bar按目标持仓先平后开下市价单,与向量化模式的调仓规则相同"""
+    settle = np.asarray(trading_params.settlement_mask, dtype=bool)
+    targets = {order_book_id: forward_fill(np.asarray(target, dtype=np.float64), settle)
+               for order_book_id, target in targets.items()}
+    rows = {dt: row for row, dt in enumerate(trading_params.trading_calendar)}
+
+    def handle_bar(context, bar_dict):
+        row = rows[pd.Timestamp(context.now)]
+        for order_book_id, target in targets.items():
+            position = context.portfolio.positions[order_book_id]
+            long_quantity, short_quantity = position.bought_quantity, position.sold_quantity
+            amount = target[row] - (long_quantity - short_quantity)
+            if amount > 0:
+                closed = min(amount, short_quantity)
+                if closed:
+                    api.order_shares(order_book_id, closed, "long", "close")
+                if amount - closed:
+                    api.order_shares(order_book_id, amount - closed, "long", "open")
+            elif amount < 0:
+                closed = min(-amount, long_quantity)
+                if closed:
+                    api.order_shares(order_book_id, closed, "short", "close")
+                if -amount - closed:
+                    api.order_shares(order_book_id, -amount - closed, "short", "open")
+    return handle_bar
+
+
+def trade_key(trade):
+    return trade.date, trade.order_book_id, trade.direction, trade.offset
+
+
+def test_vectorized_matches_event_engine(data_proxy, make_trading_params, order_book_ids):
+    signal = make_signal(order_book_ids)
+    vectorized_df = VectorizedStrategyExecutor(trading_params=make_trading_params(), data_proxy=data_proxy,
+                                               signal=signal).execute()
+
+    trading_params = make_trading_params()
+    targets = signal(None, VectorBars(data_proxy.bar_store, trading_params.trading_calendar))
+    executor = StrategyExecutor(trading_params=trading_params, data_proxy=data_proxy,
+                                handle_bar=make_handle_bar(targets, trading_params))
+    with logbook.NullHandler().applicationbound():
+        event_df = executor.execute()
+
+    assert vectorized_df.index.equals(event_df.index)
+    np.testing.assert_allclose(vectorized_df[NUMERIC_COLUMNS].values.astype(float),
+                               event_df[NUMERIC_COLUMNS].values.astype(float), rtol=1e-9, atol=1e-6)
+
+    assert sum(len(trades) for trades in event_df["trades"]) > 0
+    for vectorized_trades, event_trades in zip(vectorized_df["trades"], event_df["trades"]):
+        assert len(vectorized_trades) == len(event_trades)
+        for vectorized_trade, event_trade in zip(sorted(vectorized_trades, key=trade_key),
+                                                 sorted(event_trades, key=trade_key)):
+            assert trade_key(vectorized_trade) == trade_key(event_trade)
+            assert type(vectorized_trade.date) is type(event_trade.date)
+            assert vectorized_trade.amount == event_trade.amount
+            assert vectorized_trade.order_id is not None
+            np.testing.assert_allclose([vectorized_trade.price, vectorized_trade.commission],
+                                       [event_trade.price, event_trade.commission], rtol=1e-12)